@@ -0,0 +1,53 @@
+"""
+Configuration of the production server, which serves the task interface from
+pre-forked gunicorn worker processes with the settings in
+tellina_task_interface/settings_production.py.
+
+Run it with `gunicorn -c gunicorn.conf.py tellina_task_interface.wsgi`
+(`make serve`). The number of worker processes defaults to the number of CPUs
+and can be set with the WEB_CONCURRENCY environment variable.
+
+The master process loads the application and preloads the task catalog
+before forking the workers (see website/serving.py). Each worker serves
+several requests at a time on its threads, so that the long requests (command
+verifications, file system scans) do not hold up the others. On SIGTERM or
+SIGINT the workers finish their requests within `graceful_timeout` seconds,
+then the master destroys the containers of the open task sessions, unless
+the RELEASE_CONTAINERS environment variable is 0.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('SERVER_BIND', '0.0.0.0:10411')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = 8
+# a verification scans the home directory for at most SCAN_TIME_BUDGET
+# seconds, but the containers can take a while to start
+timeout = 120
+graceful_timeout = 30
+preload_app = True
+raw_env = [
+    'DJANGO_SETTINGS_MODULE=tellina_task_interface.settings_production',
+    # the settings which depend on the number of worker processes
+    'SERVER_WORKERS={}'.format(workers),
+]
+
+
+def when_ready(server):
+    # the application is loaded in the master, the workers are not forked yet
+    from website import serving
+    serving.preload()
+
+
+def worker_exit(server, worker):
+    from website import serving
+    serving.worker_exit()
+
+
+def on_exit(server):
+    if os.environ.get('RELEASE_CONTAINERS', '1') == '0':
+        return
+    from website import serving
+    serving.release_containers()
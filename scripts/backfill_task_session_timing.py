@@ -0,0 +1,24 @@
+"""
+This script fills in the cached timing fields of the task sessions recorded
+before TaskSession kept track of them.
+
+Run it with `python3 manage.py runscript backfill_task_session_timing`.
+"""
+
+from website.models import *
+
+from django.db import transaction
+
+def run():
+    num_updated = 0
+    with transaction.atomic():
+        for task_session in TaskSession.objects.all():
+            if task_session.start_time is None:
+                continue
+            action_history = list(task_session.get_action_history())
+            task_session.last_resumed_at, \
+                task_session.accumulated_active_time = \
+                replay_task_session_timing(task_session, action_history)
+            task_session.save()
+            num_updated += 1
+    print('{} task sessions updated'.format(num_updated))
@@ -0,0 +1,128 @@
+"""
+Measure the per-file cost of snapshotting the example website with the file
+attributes of the shipped tasks, with the attribute dispatch of the original
+scan and with the compiled AttributeExtractor of the task catalog.
+
+The example website is extracted from data/example_website.tar.xz to a
+temporary directory. Both variants start from the os.scandir entries of the
+files, and the original one builds their pathlib paths like the original scan
+did. The content digests are computed once beforehand so that the digest cache
+serves both.
+
+Run it with `python3 manage.py runscript bench_attribute_extraction`.
+"""
+
+from website.filesystem import *
+from website.filesystem import _USER, _GROUP, _SIZE, _MODE, _ATIME, \
+    _CTIME, _MTIME, _CONTENT
+from website.owners import host_owners
+
+import datetime
+import json
+import os
+import pathlib
+import stat
+import tarfile
+import tempfile
+import time
+
+ATTRIBUTE_SETS = [[], [_SIZE], [_MTIME], [_USER, _GROUP, _MODE],
+                  [_SIZE, _MODE, _ATIME, _CTIME, _MTIME, _CONTENT]]
+
+
+def dispatch_extract(dir_path, entry, attrs):
+    """The attribute extraction of disk_2_dict before the extractors."""
+    path = dir_path / entry.name
+    node = File(path.name)
+    if len(attrs) > 0:
+        file_stat = os.stat(path.as_posix())
+    for attr in attrs:
+        if attr == _USER:
+            node.attributes.user = host_owners.user_name(file_stat.st_uid)
+        if attr == _GROUP:
+            node.attributes.group = host_owners.group_name(file_stat.st_gid)
+        if attr == _SIZE:
+            node.attributes.size = file_stat.st_size
+        if attr == _MODE:
+            node.attributes.mode = file_stat.st_mode
+        if attr == _ATIME:
+            node.attributes.atime = datetime.date.\
+                fromtimestamp(file_stat.st_atime)
+        if attr == _MTIME:
+            node.attributes.mtime = datetime.date.\
+                fromtimestamp(file_stat.st_mtime)
+        if attr == _CTIME:
+            node.attributes.ctime = datetime.date.\
+                fromtimestamp(file_stat.st_ctime)
+        if attr == _CONTENT:
+            if stat.S_ISREG(file_stat.st_mode):
+                node.attributes.content = file_digest(path, file_stat)
+            else:
+                node.attributes.content = ''
+    return node
+
+
+def compiled_extract(entry, extractor):
+    node = File(entry.name)
+    if extractor.needs_stat:
+        file_stat = os.stat(entry.path)
+        extractor.extract(node.attributes, entry.path, file_stat, host_owners)
+    return node
+
+
+def timed(f, entries, repeat=20):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for dir_path, entry in entries:
+            f(dir_path, entry)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(entries) * 1e6
+
+
+def task_attribute_sets(data_dir='data'):
+    attribute_sets = []
+    for file_name in sorted(os.listdir(data_dir)):
+        if not (file_name.startswith('task') and file_name.endswith('.json')) \
+                or 'stdout' in file_name:
+            continue
+        with open(os.path.join(data_dir, file_name)) as f:
+            content = f.read()
+        if content:
+            attrs = json.loads(content)['file_attributes']
+            if attrs not in attribute_sets:
+                attribute_sets.append(attrs)
+    return attribute_sets
+
+
+def run(*args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with tarfile.open('data/example_website.tar.xz') as tar:
+            tar.extractall(tmp_dir)
+        entries = []
+        for dir_name, _, _ in os.walk(tmp_dir):
+            entries.extend((pathlib.Path(dir_name), entry)
+                           for entry in os.scandir(dir_name)
+                           if entry.is_file())
+        for _, entry in entries:
+            file_digest(entry.path)
+
+        print('{} files'.format(len(entries)))
+        print('{:<24} {:>14} {:>14}'.format(
+            'attributes', 'dispatch(us)', 'compiled(us)'))
+        attribute_sets = task_attribute_sets()
+        attribute_sets += [attrs for attrs in ATTRIBUTE_SETS
+                           if attrs not in attribute_sets]
+        for attrs in attribute_sets:
+            extractor = compile_attributes(attrs)
+            for dir_path, entry in entries:
+                assert dispatch_extract(dir_path, entry, attrs).to_dict() == \
+                    compiled_extract(entry, extractor).to_dict()
+            dispatch_us = timed(lambda dir_path, entry:
+                                dispatch_extract(dir_path, entry, attrs),
+                                entries)
+            compiled_us = timed(lambda dir_path, entry:
+                                compiled_extract(entry, extractor), entries)
+            print('{:<24} {:>14.2f} {:>14.2f}'.format(
+                str(attrs), dispatch_us, compiled_us))
@@ -0,0 +1,121 @@
+"""
+Compare attribute range selections on the dictionary representation of a file
+system with the same selections on its NumPy columns.
+
+A synthetic file system with N files spread over directories of 100 files is
+generated, with modification dates spread over a year. The benchmark times
+annotate_node tagging the files modified in one month, with and without the
+columns, and the comparison of the sizes with a goal in which every tenth
+file has a different size.
+
+Run it with
+`python3 manage.py runscript bench_columnar --script-args [N ...]`,
+where the sizes default to 10000 and 100000 files.
+"""
+
+from website import columnar
+from website.filesystem import annotate_node, find_file
+
+import datetime
+import pathlib
+import time
+
+
+def synthetic_filesystem(num_files, files_per_directory=100):
+    start = datetime.date(2016, 1, 1)
+    fs = {'type': 'directory', 'name': 'website', 'children': []}
+    builder = columnar.ColumnBuilder()
+    goal_builder = columnar.ColumnBuilder()
+    directory = None
+    for i in range(num_files):
+        if i % files_per_directory == 0:
+            directory = {'type': 'directory', 'name': 'dir{}'.format(i),
+                         'children': []}
+            fs['children'].append(directory)
+        name = 'file{}.txt'.format(i)
+        mtime = (start + datetime.timedelta(days=i % 365)).isoformat()
+        size = i % 4096
+        directory['children'].append({'type': 'file', 'name': name,
+            'attributes': {'mtime': mtime, 'size': str(size)}})
+        path = directory['name'] + '/' + name
+        builder.add_values(path, {
+            'mtime': columnar.to_number('mtime', mtime), 'size': size})
+        goal_builder.add_values(path, {
+            'size': size + 1 if i % 10 == 0 else size})
+    return fs, builder.build(), goal_builder.build()
+
+
+def clear_tags(fs):
+    stack = [fs]
+    while stack:
+        node = stack.pop()
+        node.pop('tag', None)
+        stack.extend(node.get('children') or [])
+
+
+def timed(f, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def dict_mismatches(fs, goal_columns):
+    """The size comparison done on the dictionary representation."""
+    goal_index = goal_columns.index()
+    goal_sizes = goal_columns.columns['size']
+    mismatches = []
+    stack = [(child, child['name']) for child in fs['children']]
+    while stack:
+        node, path = stack.pop()
+        if node['type'] == 'directory':
+            stack.extend((child, path + '/' + child['name'])
+                         for child in node['children'])
+        elif int(node['attributes']['size']) != \
+                goal_sizes[goal_index[path]]:
+            mismatches.append(path)
+    return mismatches
+
+
+def run(*args):
+    if not columnar.available():
+        print('NumPy is not installed')
+        return
+    sizes = [int(n) for n in args] or [10000, 100000]
+    kwargs = {'attr': 'mtime', 'attr_lower_bound': '2016-03-01',
+              'attr_higher_bound': '2016-04-01', 'recursive': True,
+              'file_only': True}
+
+    print('{:>8} {:>12} {:>12} {:>12} {:>12} {:>12}'.format(
+        'files', 'dict(ms)', 'columns(ms)', 'select(ms)', 'cmp dict',
+        'cmp cols'))
+    for num_files in sizes:
+        fs, columns, goal_columns = synthetic_filesystem(num_files)
+
+        def dict_selection():
+            clear_tags(fs)
+            annotate_node(fs, pathlib.Path('website'), 'to_select', **kwargs)
+        _, dict_ms = timed(dict_selection)
+
+        def column_selection():
+            clear_tags(fs)
+            annotate_node(fs, pathlib.Path('website'), 'to_select',
+                          columns=columns, **kwargs)
+        _, columns_ms = timed(column_selection)
+
+        selected, select_ms = timed(lambda: columns.select(
+            'mtime', '2016-03-01', '2016-04-01'))
+        expected, cmp_dict_ms = timed(lambda: dict_mismatches(
+            fs, goal_columns))
+        actual, cmp_columns_ms = timed(lambda: columns.mismatches(
+            goal_columns, 'size'))
+        assert sorted(expected) == sorted(actual)
+        assert all('to_select' in find_file(fs, columns.paths[i])['tag']
+                   for i in selected)
+
+        print('{:>8} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.2f}'.format(
+            num_files, dict_ms, columns_ms, select_ms, cmp_dict_ms,
+            cmp_columns_ms))
@@ -0,0 +1,106 @@
+"""
+Measure the database write latency with many study participants working at
+the same time.
+
+Each simulated participant gets its own user, study session and task session
+and then issues commands in a loop, doing the same writes as the task
+interface server: an ActionHistory row per command plus updates of the task
+session and the study session. The rows created by the benchmark are deleted
+at the end.
+
+Run it with
+`python3 manage.py runscript bench_db_concurrency --script-args [N] [M]`,
+where N is the number of participants (8 by default) and M the number of
+commands per participant (50 by default).
+"""
+
+from website.models import *
+from website.db import retry_on_busy
+
+from django.db import connection
+from django.utils import timezone
+
+import threading
+import time
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+def simulate_participant(i, num_commands, container, task, latencies, errors):
+    def timed(write):
+        start = time.perf_counter()
+        try:
+            retry_on_busy(write)()
+        except Exception as err:
+            errors.append(err)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    try:
+        user = User.objects.create(
+            access_code='bench-participant-{}'.format(i),
+            first_name='bench', last_name='participant-{}'.format(i))
+        study_session = StudySession.objects.create(
+            user=user, session_id='bench-participant-{}-study_session-1'
+                .format(i),
+            creation_time=timezone.now(),
+            half_session_time_left=timezone.timedelta(minutes=40),
+            status='running')
+        task_session = TaskSession.objects.create(
+            study_session=study_session, study_session_stage='I',
+            session_id=study_session.session_id + '-task-1',
+            container=container, task=task, start_time=timezone.now(),
+            time_left=task.duration, status='running')
+        for j in range(num_commands):
+            timed(lambda: ActionHistory.objects.create(
+                task_session=task_session, action='ls -l {}'.format(j),
+                stdout='', action_time=timezone.now()))
+            task_session.time_left -= timezone.timedelta(seconds=1)
+            timed(task_session.save)
+            if j % 10 == 0:
+                study_session.half_session_time_left -= \
+                    timezone.timedelta(seconds=10)
+                timed(study_session.save)
+    finally:
+        connection.close()
+
+
+def run(*args):
+    num_participants = int(args[0]) if len(args) > 0 else 8
+    num_commands = int(args[1]) if len(args) > 1 else 50
+
+    container = Container.objects.create(
+        container_id='bench', filesystem_name='bench', port=0)
+    task = Task.objects.create(
+        task_id=0, type='filesystem_change', description='bench',
+        file_attributes='[]', duration=timezone.timedelta(minutes=10))
+
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=simulate_participant,
+                                args=(i, num_commands, container, task,
+                                      latencies, errors))
+               for i in range(num_participants)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    User.objects.filter(access_code__startswith='bench-participant-').delete()
+    task.delete()
+    container.delete()
+
+    print('{} participants x {} commands in {:.2f}s'.format(
+        num_participants, num_commands, elapsed))
+    if latencies:
+        print('writes: {}, p50: {:.2f}ms, p99: {:.2f}ms, max: {:.2f}ms'.format(
+            len(latencies), percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000, max(latencies) * 1000))
+    print('failed writes: {}'.format(len(errors)))
+    for err in errors[:5]:
+        print('  {}'.format(err))
@@ -0,0 +1,54 @@
+"""
+Measure the hit rate of the diff cache by replaying recorded sessions.
+
+The sessions are recorded by running the server with settings.DIFF_CACHE_TRACE
+set to a file path. The lookups in the trace are replayed in order against
+caches of different capacities, using the recorded size of every diff.
+
+Run it with
+`python3 manage.py runscript bench_diff_cache --script-args TRACE [MB ...]`,
+where the capacities are given in megabytes (1, 4, 16 and 64 by default).
+"""
+
+from website.diff_cache import DiffCache
+
+import json
+
+
+def replay(records, max_size):
+    cache = DiffCache(max_size)
+    sizes = {}
+    for record in records:
+        if record['op'] == 'put':
+            sizes[tuple(record['key'])] = record['size']
+    for record in records:
+        if record['op'] != 'get':
+            continue
+        key = tuple(record['key'])
+        if cache.get_encoded(key) is None and key in sizes:
+            # the content of the diff does not matter for the replay
+            cache.put_encoded(key, '0' * sizes[key])
+    return cache.stats()
+
+
+def run(*args):
+    if not args:
+        print('usage: runscript bench_diff_cache --script-args TRACE [MB ...]')
+        return
+    with open(args[0]) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    capacities = [float(mb) for mb in args[1:]] or [1, 4, 16, 64]
+
+    lookups = [r for r in records if r['op'] == 'get']
+    num_lookups = len(lookups)
+    num_sessions = len(set(r['trace_id'] for r in lookups))
+    num_keys = len(set(tuple(r['key']) for r in lookups))
+    print('{} lookups from {} task sessions, {} distinct diffs'.format(
+        num_lookups, num_sessions, num_keys))
+    if num_lookups:
+        print('hit rate with unbounded cache: {:.1%}'.format(
+            1 - num_keys / num_lookups))
+    for mb in capacities:
+        stats = replay(records, int(mb * 1024 * 1024))
+        print('{:>8}MB: hit rate {:.1%}, {} evictions'.format(
+            mb, stats['hit_rate'], stats['evictions']))
@@ -0,0 +1,73 @@
+"""
+Compare the payload size and encoding time of the JSON and the compact
+encoding of the file system diffs of the shipped tasks.
+
+For every data/task*.json, the example website (data/website, extracted by
+`make run`) is compared with the task's goal file system. The diff is encoded
+the way JsonResponse encodes it and with website/diff_encoding.py, with and
+without gzip.
+
+Run it with `python3 manage.py runscript bench_diff_encoding`.
+"""
+
+from website.constants import HOME
+from website.diff_encoding import decode_compact_diff, encode_compact_diff
+from website.filesystem import *
+
+import gzip
+import json
+import os
+import pathlib
+import timeit
+
+
+def load_task_diffs(data_dir='data'):
+    for file_name in sorted(os.listdir(data_dir)):
+        if not (file_name.startswith('task') and file_name.endswith('.json')) \
+                or 'stdout' in file_name:
+            continue
+        with open(os.path.join(data_dir, file_name)) as f:
+            content = f.read()
+        if not content:
+            continue
+        task = json.loads(content)
+        current = disk_2_dict(pathlib.Path(HOME), task['file_attributes'])
+        goal = current if task['type'] == 'stdout' \
+            else filesystem_sort(task['goal_filesystem'])
+        try:
+            fs_diff = filesystem_diff(json.loads(json.dumps(current)), goal)
+        except (KeyError, ValueError) as err:
+            # unimplemented tasks have incomplete goal file systems
+            print('skip task {}: {!r}'.format(task['task_id'], err))
+            continue
+        annotate_path_selection(fs_diff, task['type'], [])
+        yield task['task_id'], fs_diff
+
+
+def run(*args):
+    repeat = int(args[0]) if args else 20
+    if not os.path.exists(HOME):
+        print('{} does not exist, extract data/example_website.tar.xz first'
+              .format(HOME))
+        return
+
+    print('task     json    gzip  compact    gzip  encode(ms)  decode(ms)')
+    totals = [0, 0, 0, 0]
+    for task_id, fs_diff in load_task_diffs():
+        encoded_json = json.dumps(fs_diff).encode('utf-8')
+        compact = encode_compact_diff(fs_diff)
+        encoded_compact = json.dumps(compact, separators=(',', ':'))\
+            .encode('utf-8')
+        sizes = [len(encoded_json), len(gzip.compress(encoded_json)),
+                 len(encoded_compact), len(gzip.compress(encoded_compact))]
+        totals = [total + size for total, size in zip(totals, sizes)]
+        encode_time = timeit.timeit(
+            lambda: json.dumps(encode_compact_diff(fs_diff),
+                               separators=(',', ':')),
+            number=repeat) / repeat
+        decode_time = timeit.timeit(
+            lambda: decode_compact_diff(json.loads(encoded_compact)),
+            number=repeat) / repeat
+        print('{:>4} {:>8} {:>7} {:>8} {:>7} {:>11.2f} {:>11.2f}'.format(
+            task_id, *(sizes + [encode_time * 1000, decode_time * 1000])))
+    print('total {:>7} {:>7} {:>8} {:>7}'.format(*totals))
@@ -0,0 +1,390 @@
+"""
+Benchmark suite of the file system snapshot and diff engine (see
+website/filesystem.py), which does not need Docker.
+
+It times, on every case, the operations of a command verification:
+    - disk_2_dict: the scan of the current file system
+    - filesystem_diff: the diff of the scan with the goal file system
+    - annotate_path_selection: the annotation of the paths of a command's
+      standard output
+    - annotate_stdout_errors: the annotation of the errors of a standard
+      output diff
+    - filesystem_sort: the sort of the goal file system
+
+The cases are:
+    - synthetic trees of several shapes (SHAPES: depth, fan-out and files per
+      directory, with varied sizes, modes, times and contents), scanned with
+      every attribute mix of ATTRIBUTE_MIXES, and mutated by every scenario of
+      MUTATIONS (deleted subtree, chmod of many files, renames, ...) and then
+      diffed with the unmutated tree
+    - the example website of data/example_website.tar.xz, scanned with the
+      attributes of every data/task*.json and diffed with its goal file
+      system (the stdout tasks and the tasks whose goal cannot be diffed are
+      skipped)
+
+Every operation is timed on fresh copies of its inputs and the best of the
+repeats is kept. The results are written as JSON and, if a baseline (the
+results of an earlier run) is given, compared with it: an operation which got
+more than `threshold` (as a fraction) and more than NOISE_MS slower is
+reported as a regression, and the script exits with status 1.
+
+Run it with
+`python3 manage.py runscript bench_filesystem --script-args [key=value ...]`,
+with the keys:
+    out: the path of the results, bench_filesystem.json by default
+    baseline: the path of the results to compare with
+    threshold: the regression threshold, 0.2 by default
+    repeat: the number of times every operation is timed, 5 by default
+    quick: 1 to run only the smallest synthetic tree and the first three
+        tasks
+"""
+
+from website.filesystem import *
+from website.filesystem import _USER, _GROUP, _SIZE, _MODE, _MTIME, _CONTENT
+
+import copy
+import json
+import os
+import pathlib
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+# (name, depth, fan-out, files per directory)
+SHAPES = [
+    ('small', 3, 3, 10),
+    ('wide', 2, 20, 20),
+    ('deep', 8, 2, 5),
+]
+ATTRIBUTE_MIXES = {
+    'names': [],
+    'stat': [_SIZE, _MODE, _MTIME],
+    'owners': [_USER, _GROUP],
+    'content': [_SIZE, _CONTENT],
+}
+MUTATIONS = ['none', 'delete_subtree', 'chmod_many', 'rename', 'add_files',
+             'modify_content']
+# the attribute mix of the mutated trees
+MUTATION_MIX = 'stat'
+# the slowdowns below this many milliseconds are noise
+NOISE_MS = 0.2
+# every n-th file is selected in the goal and printed by the command
+SELECTION_STEP = 5
+
+
+def make_synthetic_tree(root, depth, fanout, files_per_directory, seed=0):
+    """
+    Write a tree of directories 'depth' levels deep, with 'fanout'
+    subdirectories and 'files_per_directory' files in every directory.
+    """
+    rng = random.Random(seed)
+    modes = [0o644, 0o600, 0o755, 0o640]
+    now = time.time()
+    directories = [(root, 0)]
+    while directories:
+        directory, level = directories.pop()
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(files_per_directory):
+            path = directory / 'file{}.{}'.format(
+                i, rng.choice(['txt', 'md', 'html', 'css', 'js']))
+            with open(path.as_posix(), 'wb') as f:
+                f.write(bytes(rng.getrandbits(8)
+                              for _ in range(rng.randrange(0, 512))))
+            os.chmod(path.as_posix(), rng.choice(modes))
+            mtime = now - rng.randrange(0, 400) * 86400
+            os.utime(path.as_posix(), (mtime, mtime))
+        if level < depth:
+            for i in range(fanout):
+                directories.append((directory / 'dir{}'.format(i), level + 1))
+
+
+def list_files(root):
+    """Returns the paths of the files of a tree, relative to it, in order."""
+    paths = []
+    for dir_name, dir_names, file_names in os.walk(root.as_posix()):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            paths.append(pathlib.Path(dir_name, file_name).relative_to(root))
+    return paths
+
+
+def mutate(root, mutation, seed=0):
+    """Apply a mutation scenario to a tree."""
+    rng = random.Random(seed)
+    files = list_files(root)
+    if mutation == 'delete_subtree':
+        subdirectories = sorted(p for p in root.iterdir() if p.is_dir())
+        if subdirectories:
+            shutil.rmtree(subdirectories[0].as_posix())
+    elif mutation == 'chmod_many':
+        for path in files[::2]:
+            os.chmod((root / path).as_posix(), 0o666)
+    elif mutation == 'rename':
+        for path in files[::10]:
+            os.rename((root / path).as_posix(),
+                      (root / path).as_posix() + '.bak')
+        subdirectories = sorted(p for p in root.iterdir() if p.is_dir())
+        if subdirectories:
+            os.rename(subdirectories[-1].as_posix(),
+                      subdirectories[-1].as_posix() + '_renamed')
+    elif mutation == 'add_files':
+        for i, path in enumerate(files[::10]):
+            with open((root / path.parent / 'new{}.txt'.format(i)).as_posix(),
+                      'w') as f:
+                f.write('new file {}\n'.format(i))
+    elif mutation == 'modify_content':
+        for path in files[::10]:
+            with open((root / path).as_posix(), 'ab') as f:
+                f.write(bytes(rng.getrandbits(8) for _ in range(64)))
+
+
+def select_goal_files(goal):
+    """Tag every SELECTION_STEP-th file of a goal file system to_select."""
+    i = 0
+    stack = [goal]
+    while stack:
+        node = stack.pop()
+        if node['type'] == 'directory':
+            stack.extend(reversed(node['children']))
+        else:
+            if i % SELECTION_STEP == 0:
+                add_tag(node, 'to_select')
+            i += 1
+    return goal
+
+
+def printed_paths(fs):
+    """
+    Returns the paths of every SELECTION_STEP-th file of a file system,
+    starting with the name of its root, like the paths found in a standard
+    output.
+    """
+    paths = []
+    stack = [(fs, pathlib.Path(fs['name']))]
+    while stack:
+        node, path = stack.pop()
+        if node['type'] == 'directory':
+            stack.extend((child, path / child['name'])
+                         for child in reversed(node['children']))
+        else:
+            paths.append(path)
+    return paths[::SELECTION_STEP]
+
+
+def make_stdout_diff(paths):
+    """A standard output diff with missing and extra lines of the paths."""
+    return {
+        'lines': [{'line': pathlib.Path(*path.parts[1:]).as_posix(),
+                   'tag': 'missing' if i % 2 else 'extra'}
+                  for i, path in enumerate(paths) if len(path.parts) > 2],
+        'tag': 'incorrect'
+    }
+
+
+def timed(f, prepare=None, repeat=5):
+    """
+    Returns the best time of f in milliseconds, called with a fresh result of
+    'prepare' every time (which is not timed).
+    """
+    best = None
+    for _ in range(repeat):
+        arg = prepare() if prepare is not None else None
+        start = time.perf_counter()
+        f(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def scan(root, attrs):
+    return disk_2_dict(root, attrs, max_entries=10 ** 9, time_budget=None,
+                       as_dict=False)
+
+
+def bench_case(root, attrs, goal, repeat):
+    """Time the operations on the tree at 'root' against a goal."""
+    goal = filesystem_sort(goal)
+    current = scan(root, attrs)
+    fs_diff = filesystem_diff(current, goal)
+    paths = printed_paths(fs_diff)
+    stdout_diff = make_stdout_diff(paths)
+
+    def annotate_stdout(fs):
+        try:
+            annotate_stdout_errors(fs, stdout_diff)
+        except ValueError:
+            # a printed path is not in the diff
+            pass
+
+    return {
+        'entries': len(list_files(root)),
+        'ops': {
+            'disk_2_dict': timed(lambda _: scan(root, attrs), repeat=repeat),
+            'filesystem_diff': timed(lambda _: filesystem_diff(current, goal),
+                                     repeat=repeat),
+            'annotate_path_selection': timed(
+                lambda fs: annotate_path_selection(fs, 'file_search', paths),
+                lambda: copy.deepcopy(fs_diff), repeat=repeat),
+            'annotate_stdout_errors': timed(
+                annotate_stdout, lambda: copy.deepcopy(fs_diff),
+                repeat=repeat),
+            'filesystem_sort': timed(
+                filesystem_sort, lambda: copy.deepcopy(goal), repeat=repeat),
+        }
+    }
+
+
+def synthetic_cases(tmp_dir, shapes, repeat):
+    results = {}
+    for name, depth, fanout, files_per_directory in shapes:
+        original = tmp_dir / '{}-original'.format(name) / 'website'
+        make_synthetic_tree(original, depth, fanout, files_per_directory)
+        for mix, attrs in sorted(ATTRIBUTE_MIXES.items()):
+            mutations = MUTATIONS if mix == MUTATION_MIX else ['none']
+            goal = select_goal_files(disk_2_dict(
+                original, attrs, max_entries=10 ** 9, time_budget=None))
+            for mutation in mutations:
+                mutated = tmp_dir / '{}-{}'.format(name, mutation) / 'website'
+                if mutated.exists():
+                    shutil.rmtree(mutated.parent.as_posix())
+                shutil.copytree(original.as_posix(), mutated.as_posix())
+                mutate(mutated, mutation)
+                case = 'synthetic/{}/{}/{}'.format(name, mix, mutation)
+                print('{}...'.format(case))
+                results[case] = bench_case(mutated, attrs,
+                                           copy.deepcopy(goal), repeat)
+    return results
+
+
+def task_goals(data_dir='data'):
+    """Returns the (task ID, file attributes, goal) of the task files."""
+    goals = []
+    for file_name in sorted(os.listdir(data_dir)):
+        if not (file_name.startswith('task') and file_name.endswith('.json')) \
+                or 'stdout' in file_name:
+            continue
+        with open(os.path.join(data_dir, file_name)) as f:
+            content = f.read()
+        if not content:
+            continue
+        task = json.loads(content)
+        goal = task['goal_filesystem']
+        if not goal:
+            # the goal of stdout tasks is their output
+            continue
+        digest_goal_contents(goal)
+        goals.append((int(task['task_id']), task['file_attributes'], goal))
+    return sorted(goals, key=lambda goal: goal[0])
+
+
+def task_cases(tmp_dir, goals, repeat):
+    results = {}
+    with tarfile.open('data/example_website.tar.xz') as tar:
+        tar.extractall(tmp_dir.as_posix())
+    root = tmp_dir / 'website'
+    for task_id, attrs, goal in goals:
+        case = 'example_website/task{}'.format(task_id)
+        try:
+            filesystem_diff(disk_2_dict(root, attrs), goal)
+        except (KeyError, ValueError) as e:
+            # the goals of the unimplemented tasks lack some attributes
+            print('skipping {}: {!r}'.format(case, e))
+            continue
+        print('{}...'.format(case))
+        results[case] = bench_case(root, attrs, goal, repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the operations which got slower or faster than in the baseline by
+    more than the threshold. Returns the number of regressions.
+    """
+    num_regressions = 0
+    print('{:<48} {:<24} {:>10} {:>10} {:>8}'.format(
+        'case', 'operation', 'base(ms)', 'now(ms)', 'ratio'))
+    for case, result in sorted(results['cases'].items()):
+        base_result = baseline['cases'].get(case)
+        if base_result is None:
+            continue
+        for op, ms in sorted(result['ops'].items()):
+            base_ms = base_result['ops'].get(op)
+            if base_ms is None or abs(ms - base_ms) < NOISE_MS:
+                continue
+            ratio = ms / base_ms if base_ms else float('inf')
+            if ratio > 1 + threshold:
+                verdict = 'REGRESSION'
+                num_regressions += 1
+            elif ratio < 1 / (1 + threshold):
+                verdict = 'faster'
+            else:
+                continue
+            print('{:<48} {:<24} {:>10.2f} {:>10.2f} {:>8.2f} {}'.format(
+                case, op, base_ms, ms, ratio, verdict))
+    return num_regressions
+
+
+def run(*args):
+    options = dict(arg.split('=', 1) for arg in args)
+    out = options.get('out', 'bench_filesystem.json')
+    threshold = float(options.get('threshold', 0.2))
+    repeat = int(options.get('repeat', 5))
+    quick = options.get('quick', '0') == '1'
+
+    goals = task_goals()
+    shapes = SHAPES[:1] if quick else SHAPES
+    if quick:
+        goals = goals[:3]
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+        },
+        'cases': {}
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        (tmp_dir / 'synthetic').mkdir()
+        (tmp_dir / 'example').mkdir()
+        results['cases'].update(
+            synthetic_cases(tmp_dir / 'synthetic', shapes, repeat))
+        results['cases'].update(
+            task_cases(tmp_dir / 'example', goals, repeat))
+
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('{} cases written to {}'.format(len(results['cases']), out))
+
+    print('{:<48} {:>8} {}'.format('case', 'entries', ' '.join(
+        '{:>12}'.format(op[:12]) for op in
+        sorted(next(iter(results['cases'].values()))['ops']))))
+    for case, result in sorted(results['cases'].items()):
+        print('{:<48} {:>8} {}'.format(case, result['entries'], ' '.join(
+            '{:>12.2f}'.format(ms) for _, ms in sorted(
+                result['ops'].items()))))
+
+    if 'baseline' in options:
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        num_regressions = compare(results, baseline, threshold)
+        print('{} regressions (threshold {:.0%}) against {}'.format(
+            num_regressions, threshold, options['baseline']))
+        if num_regressions:
+            sys.exit(1)
@@ -0,0 +1,83 @@
+"""
+Time disk_2_dict on synthetic file systems of various sizes with 1, 2, 4 and
+8 workers, on the local disk and with a simulated storage latency added to
+every stat call (like a network-backed home directory, where the listings
+and stat calls of the workers overlap).
+
+A synthetic file system with N files spread over nested directories of 50
+files is written to a temporary directory. Every parallel snapshot is checked
+against the serial one.
+
+Run it with
+`python3 manage.py runscript bench_parallel_scan --script-args [N ...]`,
+where the sizes default to 1000, 10000 and 50000 files.
+"""
+
+from website import filesystem
+from website.filesystem import disk_2_dict
+
+import contextlib
+import os
+import pathlib
+import tempfile
+import time
+from unittest import mock
+
+ATTRIBUTES = [filesystem._SIZE, filesystem._MODE, filesystem._MTIME]
+WORKERS = [1, 2, 4, 8]
+# seconds added to every stat call in the simulated storage
+STAT_LATENCY = 0.0001
+
+
+def make_tree(root, num_files, files_per_directory=50, fan_out=8):
+    directories = [root]
+    for i in range(num_files):
+        if i % files_per_directory == 0:
+            parent = directories[(len(directories) - 1) // fan_out]
+            directory = parent / 'dir{}'.format(len(directories))
+            directory.mkdir()
+            directories.append(directory)
+        (directory / 'file{}.txt'.format(i)).touch()
+
+
+def scan(root, workers):
+    return disk_2_dict(root, ATTRIBUTES, max_entries=10 ** 9,
+                       time_budget=None, workers=workers)
+
+
+def slow_stat(*args, _stat=os.stat, **kwargs):
+    time.sleep(STAT_LATENCY)
+    return _stat(*args, **kwargs)
+
+
+def timed(f, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def run(*args):
+    sizes = [int(n) for n in args] or [1000, 10000, 50000]
+    print('{:>8} {:>8} {:>8} {:>14} {:>14}'.format(
+        'files', 'storage', 'workers', 'scan(ms)', 'speedup'))
+    for num_files in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = pathlib.Path(tmp_dir) / 'website'
+            root.mkdir()
+            make_tree(root, num_files)
+            expected = scan(root, 1)
+            for storage in ['local', 'slow']:
+                serial_ms = None
+                for workers in WORKERS:
+                    with mock.patch('os.stat', slow_stat) \
+                            if storage == 'slow' else contextlib.ExitStack():
+                        fs, scan_ms = timed(lambda: scan(root, workers))
+                    assert fs == expected
+                    serial_ms = serial_ms or scan_ms
+                    print('{:>8} {:>8} {:>8} {:>14.1f} {:>14.2f}'.format(
+                        num_files, storage, workers, scan_ms,
+                        serial_ms / scan_ms))
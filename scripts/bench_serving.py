@@ -0,0 +1,112 @@
+"""
+Compare the request throughput of the development server (`runserver`) with
+the production server (gunicorn.conf.py) under concurrent clients.
+
+Each server is started on a free local port. For every path, C client
+processes send requests one after the other for D seconds, each on a new
+connection; the requests per second and the latencies of the successful
+responses are reported. The paths default to a page, a query of the database
+and a static file. The production server is started with RELEASE_CONTAINERS=0
+so that it leaves the containers of the study alone when it stops.
+
+Run it with
+`python3 manage.py runscript bench_serving --script-args [C] [D] [path ...]`,
+where C defaults to 16 clients and D to 10 seconds.
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+PATHS = ['/', '/retrieve_access_code?first_name=bench&last_name=bench',
+         '/static/js/task.js']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, port):
+    env = dict(os.environ)
+    if name == 'runserver':
+        command = [sys.executable, 'manage.py', 'runserver', '--noreload',
+                   '127.0.0.1:{}'.format(port)]
+    else:
+        env['RELEASE_CONTAINERS'] = '0'
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '--bind', '127.0.0.1:{}'.format(port),
+                   'tellina_task_interface.wsgi']
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen('http://127.0.0.1:{}/'.format(port))
+            return server
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('{} did not start'.format(name))
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(60)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def client(url, duration):
+    latencies = []
+    errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url) as resp:
+                resp.read()
+            latencies.append(time.perf_counter() - start)
+        except (urllib.error.URLError, ConnectionError):
+            errors += 1
+    return latencies, errors
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def run(*args):
+    num_clients = int(args[0]) if len(args) > 0 else 16
+    duration = float(args[1]) if len(args) > 1 else 10.0
+    paths = list(args[2:]) or PATHS
+
+    print('{:>10} {:<58} {:>8} {:>8} {:>9} {:>9}'.format(
+        'server', 'path', 'req/s', 'errors', 'p50(ms)', 'p99(ms)'))
+    context = multiprocessing.get_context('fork')
+    for name in ['runserver', 'gunicorn']:
+        port = free_port()
+        server = start_server(name, port)
+        try:
+            for path in paths:
+                url = 'http://127.0.0.1:{}{}'.format(port, path)
+                with context.Pool(num_clients) as pool:
+                    results = pool.starmap(client,
+                                           [(url, duration)] * num_clients)
+                latencies = sorted(latency for latencies, _ in results
+                                   for latency in latencies)
+                errors = sum(errors for _, errors in results)
+                print('{:>10} {:<58} {:>8.1f} {:>8} {:>9.1f} {:>9.1f}'.format(
+                    name, path, len(latencies) / duration, errors,
+                    percentile(latencies, 0.5) if latencies else 0.0,
+                    percentile(latencies, 0.99) if latencies else 0.0))
+        finally:
+            stop_server(server)
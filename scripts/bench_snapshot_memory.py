@@ -0,0 +1,79 @@
+"""
+Measure the peak memory and the time of scanning a file system and comparing
+it with a goal, with the snapshot in the dictionary representation and as a
+tree of filesystem.Node objects.
+
+A synthetic file system with N files in directories of 100 files is written
+to a temporary directory. The goal is its dictionary representation with one
+file in a hundred removed, so that the diff has errors to annotate.
+
+Run it with
+`python3 manage.py runscript bench_snapshot_memory --script-args [N ...]`,
+where the sizes default to 10000 and 100000 files.
+"""
+
+from website import filesystem
+from website.diff_cache import snapshot_hash
+from website.filesystem import disk_2_dict, filesystem_diff
+
+import copy
+import gc
+import os
+import pathlib
+import tempfile
+import time
+import tracemalloc
+
+ATTRIBUTES = [filesystem._SIZE, filesystem._MODE, filesystem._MTIME]
+
+
+def make_tree(root, num_files, files_per_directory=100):
+    for i in range(num_files):
+        directory = root / 'dir{}'.format(i // files_per_directory)
+        if i % files_per_directory == 0:
+            directory.mkdir()
+        with (directory / 'file{}.txt'.format(i)).open('w') as o_f:
+            o_f.write('x' * (i % 100))
+
+
+def measure(root, goal, as_dict):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    snapshot = disk_2_dict(root, ATTRIBUTES, max_entries=10 ** 9,
+                           time_budget=None, as_dict=as_dict)
+    scanned = time.perf_counter()
+    _, scan_peak = tracemalloc.get_traced_memory()
+    snapshot_hash(snapshot)
+    fs_diff = filesystem_diff(snapshot, goal)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return scanned - start, elapsed, scan_peak, peak, fs_diff
+
+
+def run(*args):
+    sizes = [int(n) for n in args] or [10000, 100000]
+    print('{:>8} {:>6} {:>10} {:>10} {:>12} {:>12}'.format(
+        'files', 'nodes', 'scan(s)', 'total(s)', 'scan(MB)', 'peak(MB)'))
+    for num_files in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = pathlib.Path(tmp_dir) / 'website'
+            root.mkdir()
+            make_tree(root, num_files)
+            goal = disk_2_dict(root, ATTRIBUTES, max_entries=10 ** 9,
+                               time_budget=None)
+            for directory in goal['children']:
+                directory['children'] = [
+                    child for i, child in enumerate(directory['children'])
+                    if i != 0]
+
+            results = {}
+            for as_dict in [True, False]:
+                scan, total, scan_peak, peak, fs_diff = measure(
+                    root, copy.deepcopy(goal), as_dict)
+                results[as_dict] = fs_diff
+                print('{:>8} {:>6} {:>10.2f} {:>10.2f} {:>12.1f} {:>12.1f}'
+                      .format(num_files, 'dict' if as_dict else 'Node', scan,
+                              total, scan_peak / 2 ** 20, peak / 2 ** 20))
+            assert results[True] == results[False]
@@ -6,14 +6,49 @@ Run it with `python3 manage.py runscript load_config`.
 
 from website.models import *
 from website.filesystem import *
+from website.owners import FixedOwners
+from website import task_catalog
+from website.views import compute_filesystem_diff, compute_stdout_diff
 
 import json
 import os
+import pathlib
+import shutil
+import tempfile
 
 from django.utils import timezone
 import django.contrib.auth.models as auth
 from django.core.exceptions import ObjectDoesNotExist
 
+def materialize_initial_filesystem(task):
+    """
+    Create the starting home directory of a task the same way it is created
+    for every task session, and save its JSON representation and its
+    annotated difference from the goal to the Task object.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # make_filesystem.bash copies the example website with "cp -r", which
+        # does not preserve the file timestamps
+        filesystem_vfs_path = os.path.join(tmp_dir, 'website')
+        shutil.copytree(HOME, filesystem_vfs_path, copy_function=shutil.copy)
+        prepare_task_filesystem(task, filesystem_vfs_path + '/')
+
+        # create_container hands the home directory over to the user
+        owners = FixedOwners(USER_NAME, USER_NAME)
+        task.initial_filesystem = json.dumps(disk_2_dict(
+            pathlib.Path(filesystem_vfs_path),
+            json.loads(task.file_attributes), owners=owners))
+        task_catalog.invalidate(task)
+        fs_diff = compute_filesystem_diff(filesystem_vfs_path, task, [],
+                                          owners=owners)
+    if task.type == 'stdout':
+        stdout_diff = compute_stdout_diff('', task)
+        annotate_stdout_errors(fs_diff, stdout_diff)
+        task.initial_stdout_diff = json.dumps(stdout_diff)
+    task.initial_filesystem_diff = json.dumps(fs_diff)
+    task.save()
+    task_catalog.invalidate(task)
+
 def run():
     """
     This is the 'main method' that must be implemented in order for runscript
@@ -81,6 +116,12 @@ def run():
                     solution = solution
                 )
 
+    # precompute the starting home directory of the tasks
+    for task in Task.objects.filter(initial_filesystem_diff=''):
+        print("materialize initial file system of task {}...".format(
+            task.task_id))
+        materialize_initial_filesystem(task)
+
     # register researchers
     for researcher in config['researchers']:
         first_name = researcher['first_name']
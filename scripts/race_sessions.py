@@ -0,0 +1,88 @@
+"""
+Race several server processes on the same study session and check that no
+counter update is lost and that a task session is provisioned only once.
+
+Each of the N processes loads its own copy of the study session and then,
+M times:
+    - increments its completed task counter, once with the read-modify-write
+      the models used to do and once with inc_num_training_tasks_completed
+    - provisions the "container" of a task session if it does not exist yet,
+      under the lock of the task session (a Container row stands for the
+      Docker container)
+
+The rows created by the script are deleted at the end.
+
+Run it with
+`python3 manage.py runscript race_sessions --script-args [N] [M]`,
+where N defaults to 8 processes and M to 20 rounds.
+"""
+
+from website.locks import session_lock
+from website.models import *
+
+from django.db import connection
+from django.utils import timezone
+
+import multiprocessing
+import time
+
+SESSION_ID = 'race-participant-study_session-1'
+
+
+def provision(task_session_id):
+    with session_lock(task_session_id):
+        if Container.objects.filter(filesystem_name=task_session_id).exists():
+            return
+        # the time it takes to start a container
+        time.sleep(0.01)
+        Container.objects.create(container_id='race',
+                                 filesystem_name=task_session_id, port=0)
+
+
+def race(num_rounds):
+    connection.close()
+    study_session = StudySession.objects.get(session_id=SESSION_ID)
+    for i in range(num_rounds):
+        stale = StudySession.objects.get(session_id=SESSION_ID)
+        stale.num_tasks_completed += 1
+        stale.save(update_fields=['num_tasks_completed'])
+        study_session.inc_num_training_tasks_completed()
+        provision('{}-task-{}'.format(SESSION_ID, i + 1))
+    connection.close()
+
+
+def run(*args):
+    num_processes = int(args[0]) if len(args) > 0 else 8
+    num_rounds = int(args[1]) if len(args) > 1 else 20
+
+    user = User.objects.create(access_code='race-participant',
+                               first_name='race', last_name='participant')
+    StudySession.objects.create(
+        user=user, session_id=SESSION_ID, creation_time=timezone.now(),
+        half_session_time_left=timezone.timedelta(minutes=40))
+    connection.close()
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=race, args=(num_rounds,))
+                 for _ in range(num_processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    study_session = StudySession.objects.get(session_id=SESSION_ID)
+    num_containers = Container.objects.filter(
+        filesystem_name__startswith=SESSION_ID).count()
+    expected = num_processes * num_rounds
+    print('read-modify-write counter: {} of {} increments'.format(
+        study_session.num_tasks_completed, expected))
+    print('atomic counter:            {} of {} increments'.format(
+        study_session.num_training_tasks_completed, expected))
+    print('containers provisioned:    {} for {} task sessions'.format(
+        num_containers, num_rounds))
+
+    Container.objects.filter(filesystem_name__startswith=SESSION_ID).delete()
+    user.delete()
+
+    assert study_session.num_training_tasks_completed == expected
+    assert num_containers == num_rounds
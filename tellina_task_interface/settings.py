@@ -43,13 +43,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'website.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'website.middleware.ThresholdGZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'website.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'tellina_task_interface.urls'
@@ -72,6 +75,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'tellina_task_interface.wsgi.application'
 
+# Responses larger than GZIP_MIN_SIZE bytes are gzipped.
+GZIP_MIN_SIZE = 1024
+
 
 # Database
 # https://docs.djangoproject.com/en/1.10/ref/settings/#databases
@@ -80,9 +86,90 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # seconds to wait for the database lock before raising an error
+            'timeout': 5,
+        },
     }
 }
 
+# Every SQLite connection is opened in WAL mode so that the participants'
+# writes do not block the readers (see website/db.py). Writes that still find
+# the database locked after SQLITE_BUSY_TIMEOUT milliseconds are retried up to
+# SQLITE_MAX_RETRIES times.
+SQLITE_JOURNAL_MODE = 'WAL'
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_BUSY_TIMEOUT = 5000
+SQLITE_MAX_RETRIES = 5
+
+# Actions in the task sessions are written to the database in batches, at most
+# ACTION_LOG_FLUSH_INTERVAL seconds after they happen or as soon as
+# ACTION_LOG_MAX_BATCH_SIZE of them are waiting. Set the interval to 0 to write
+# every action synchronously.
+ACTION_LOG_FLUSH_INTERVAL = 0.5
+ACTION_LOG_MAX_BATCH_SIZE = 64
+
+# Annotated file system diffs are shared across task sessions through an LRU
+# cache holding at most DIFF_CACHE_MAX_SIZE bytes of JSON (see
+# website/diff_cache.py). Set DIFF_CACHE_TRACE to a file path to record the
+# cache lookups for scripts/bench_diff_cache.py.
+DIFF_CACHE_MAX_SIZE = 64 * 1024 * 1024
+DIFF_CACHE_TRACE = ''
+
+# Browsers which ask for summarized diffs receive only the nodes with errors
+# or selections of diffs with more than DIFF_SUMMARY_MIN_NODES nodes (see
+# website/diff_summary.py).
+DIFF_SUMMARY_MIN_NODES = 1000
+
+# The content viewer returns at most FILE_CONTENT_MAX_RANGE bytes of a file
+# per request.
+FILE_CONTENT_MAX_RANGE = 64 * 1024
+
+# Scans of a participant's home directory stop after SCAN_MAX_ENTRIES files
+# and directories, SCAN_MAX_DEPTH levels or SCAN_TIME_BUDGET seconds and
+# report a truncated file system.
+SCAN_MAX_ENTRIES = 100000
+SCAN_MAX_DEPTH = 64
+SCAN_TIME_BUDGET = 2.0
+# Scans of large home directories list the directories on up to SCAN_WORKERS
+# threads, which pays off on slow (e.g. network-backed) storage.
+SCAN_WORKERS = 1
+
+# The commands are verified on a pool of VERIFICATION_WORKERS threads (see
+# website/verification.py), which holds at most VERIFICATION_QUEUE_SIZE
+# waiting jobs. The browser waits at most VERIFICATION_POLL_TIMEOUT seconds per
+# request for their results. Set VERIFICATION_WORKERS to 0 to verify the
+# commands in the requests.
+VERIFICATION_WORKERS = 4
+VERIFICATION_QUEUE_SIZE = 64
+VERIFICATION_POLL_TIMEOUT = 20.0
+
+# /container_report flags the periods in which the median provisioning time
+# of the containers exceeded the median of the earlier containers by more
+# than CONTAINER_REGRESSION_FACTOR (see website/provisioning.py).
+CONTAINER_REGRESSION_FACTOR = 1.5
+
+# With PROFILING on, the requests with the X-Profile-Request header set to
+# PROFILING_HEADER_TOKEN (if not empty), the requests of staff members with the
+# "profile" cookie set to 1 and a PROFILING_SAMPLE_RATE fraction of the other
+# requests are profiled with cProfile and tracemalloc (see
+# website/profiling.py). The PROFILING_MAX_PROFILES most recent profiles are
+# kept, with their PROFILING_TOP_ALLOCATIONS largest allocations.
+PROFILING = False
+PROFILING_HEADER_TOKEN = ''
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_MAX_PROFILES = 100
+PROFILING_TOP_ALLOCATIONS = 20
+
+# The advisory locks which serialize the operations on a session across the
+# server processes are files in LOCK_DIR (see website/locks.py).
+LOCK_DIR = os.path.join(BASE_DIR, 'locks')
+
+# The last file system diff sent to each task session is kept in the memory of
+# the server process, or in files in DIFF_VERSION_DIR if it is set, which is
+# required with several server processes (see website/diff_patch.py).
+DIFF_VERSION_DIR = ''
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
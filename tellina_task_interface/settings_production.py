@@ -0,0 +1,31 @@
+"""
+Django settings of the production server (see gunicorn.conf.py), on top of
+the development settings in settings.py.
+"""
+
+from .settings import *
+
+DEBUG = False
+
+# Without runserver, the WSGI application serves the static files itself (see
+# wsgi.py).
+SERVE_STATIC_FILES = True
+
+# The requests of a participant may reach any of the worker processes, while
+# the results of a verification pool stay in the process which ran the
+# verification. The commands are therefore verified in their requests, on the
+# request threads of the workers, and the verifications of a task session hold
+# its advisory lock (see website/locks.py) so that they still run one at a
+# time across the workers.
+VERIFICATION_WORKERS = 0
+
+# The requests of a task session may reach any of the worker processes, which
+# share the last file system diff sent to the task session through files.
+DIFF_VERSION_DIR = os.path.join(BASE_DIR, 'diff_versions')
+
+# The actions are queued in the memory of the process which logged them, while
+# the task session may be closed by another worker process, which would not
+# see the last commands of the participant. With several workers (see
+# gunicorn.conf.py), the actions are therefore written in their requests.
+if int(os.environ.get('SERVER_WORKERS', '1')) > 1:
+    ACTION_LOG_FLUSH_INTERVAL = 0
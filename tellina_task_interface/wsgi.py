@@ -3,14 +3,23 @@ WSGI config for tellina_task_interface project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+The production server (see gunicorn.conf.py) loads it with the settings in
+settings_production.py.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/1.10/howto/deployment/wsgi/
 """
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import StaticFilesHandler
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tellina_task_interface.settings")
 
 application = get_wsgi_application()
+
+if getattr(settings, 'SERVE_STATIC_FILES', False):
+    # runserver serves the static files in development
+    application = StaticFilesHandler(application)
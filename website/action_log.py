@@ -0,0 +1,133 @@
+"""
+Buffered writer for the user's action history.
+
+Every command the user issues in the terminal is logged to the database. To
+keep the database write (and the fsync that comes with it) out of the request,
+the records are queued in memory and inserted in batches by a background
+thread, either every `flush_interval` seconds or as soon as `max_batch_size`
+records are waiting, whichever comes first.
+
+Code that reads the action history must call `flush` first so that it sees
+every queued record.
+
+If a batch cannot be inserted, its records are written one at a time, so that
+a record the database rejects (e.g. one whose task session was deleted) does
+not hold up the others. The rejected records are moved to `dead_letters` and
+logged; the records which failed for another reason (e.g. the database is
+unavailable) are put back in the queue.
+"""
+
+from django.db import DataError, IntegrityError, transaction
+
+from .db import retry_on_busy
+
+import atexit
+import collections
+import threading
+
+
+class ActionLogWriter(object):
+    """
+    Queues model instances and writes them to the database with bulk_create.
+
+    :member model: The model class of the queued records.
+    :member flush_interval: Maximum time (in seconds) a record stays in the
+        queue. Records are written synchronously if it is 0.
+    :member max_batch_size: Number of queued records which triggers a flush
+        before the interval expires.
+    :member dead_letters: The most recent records the database rejected.
+    """
+    def __init__(self, model, flush_interval=0.5, max_batch_size=64,
+                 max_dead_letters=1000):
+        self.model = model
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.dead_letters = collections.deque(maxlen=max_dead_letters)
+        self._queue = []
+        # protects the queue
+        self._queue_lock = threading.Lock()
+        # makes sure that batches are written one at a time
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def log(self, **kwargs):
+        """Queue a record with the given field values."""
+        record = self.model(**kwargs)
+        with self._queue_lock:
+            self._queue.append(record)
+            queue_size = len(self._queue)
+        if not self.flush_interval:
+            self.flush()
+            return
+        self._start()
+        if queue_size >= self.max_batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all queued records to the database."""
+        with self._flush_lock:
+            with self._queue_lock:
+                records = self._queue
+                self._queue = []
+            if not records:
+                return
+            try:
+                retry_on_busy(self._bulk_create)(records)
+            except (DataError, IntegrityError):
+                self._create_one_at_a_time(records)
+            except Exception:
+                # put the records back so that they are written next time
+                with self._queue_lock:
+                    self._queue = records + self._queue
+                raise
+
+    def _bulk_create(self, records):
+        # a savepoint, so that a failed batch leaves the transaction of the
+        # caller (if any) usable
+        with transaction.atomic():
+            self.model.objects.bulk_create(records)
+
+    def _create_one_at_a_time(self, records):
+        """
+        Write the records of a batch the database rejected one at a time, and
+        move the ones it rejects to the dead letters.
+        """
+        for i, record in enumerate(records):
+            try:
+                retry_on_busy(self._bulk_create)([record])
+            except (DataError, IntegrityError) as err:
+                self.dead_letters.append(record)
+                print('Dropped an action history record ({}): {}'.format(
+                    err, {field.attname: getattr(record, field.attname)
+                          for field in record._meta.concrete_fields}))
+            except Exception:
+                with self._queue_lock:
+                    self._queue = records[i:] + self._queue
+                raise
+
+    @property
+    def queue_size(self):
+        with self._queue_lock:
+            return len(self._queue)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._queue_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name='action-log-writer')
+            self._thread.daemon = True
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as err:
+                print('Failed to write the action history: {}'.format(err))
@@ -13,7 +13,8 @@ admin.site.register(Researcher)
 admin.site.register(Software)
 admin.site.register(User, UserAdmin)
 admin.site.register(Task)
-admin.site.register(Container)
+admin.site.register(Container, ContainerAdmin)
 admin.site.register(StudySession, StudySessionAdmin)
 admin.site.register(TaskSession, TaskSessionAdmin)
 admin.site.register(ActionHistory)
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -1,10 +1,18 @@
 """
 File autogenerated by `python3 manage.py startproject website`.
 
-Not sure what this file is for but I haven't had to edit it.
+Connects the database connection tuning in db.py and the query timing in
+timing.py when the app is loaded.
 """
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class WebsiteConfig(AppConfig):
     name = 'website'
+
+    def ready(self):
+        from .db import configure_sqlite_connection
+        from .timing import instrument_connection
+        connection_created.connect(configure_sqlite_connection)
+        connection_created.connect(instrument_connection)
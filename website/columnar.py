@@ -0,0 +1,180 @@
+"""
+Columnar representation of the file attributes of a file system snapshot.
+
+The files of a snapshot are numbered in scan order; their paths relative to
+the root are kept in a list and their numeric attributes in parallel NumPy
+arrays:
+
+    size, mode          integers
+    atime, mtime, ctime seconds since the epoch
+
+Attribute range selections (e.g. the files modified on a given day for the
+"find -mtime" tasks) and comparisons with the goal file system then run as
+vectorized operations instead of walks over the dictionary representation.
+The command verifications do not use the columns yet (no task annotates an
+attribute range); scripts/bench_columnar.py measures them.
+
+NumPy is optional: if it is not installed, 'available' returns False and the
+callers keep using the dictionary representation.
+"""
+
+import datetime
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ATTRIBUTES = ['size', 'mode', 'atime', 'mtime', 'ctime']
+TIME_ATTRIBUTES = ['atime', 'mtime', 'ctime']
+
+
+def available():
+    return np is not None
+
+
+def to_number(attr, value):
+    """
+    Convert an attribute value of the dictionary representation (e.g. a size
+    '1024' or a date '2016-01-29') to the number stored in the columns. A date
+    becomes its first second in local time, so that date comparisons become
+    comparisons of seconds.
+    """
+    if not isinstance(value, str):
+        return value
+    if attr in TIME_ATTRIBUTES:
+        date = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        return time.mktime(date.timetuple())
+    return int(value)
+
+
+class ColumnBuilder(object):
+    """Collects the attributes of the files visited by disk_2_dict."""
+    def __init__(self):
+        self.paths = []
+        self._values = {attr: [] for attr in ATTRIBUTES}
+
+    def add(self, path, file_stat):
+        """
+        Args:
+            path: the path of the file relative to the root
+            file_stat: the os.stat result of the file
+        """
+        self.paths.append(path)
+        self._values['size'].append(file_stat.st_size)
+        self._values['mode'].append(file_stat.st_mode)
+        self._values['atime'].append(file_stat.st_atime)
+        self._values['mtime'].append(file_stat.st_mtime)
+        self._values['ctime'].append(file_stat.st_ctime)
+
+    def add_values(self, path, values):
+        """
+        Args:
+            path: the path of the file relative to the root
+            values: the attribute values of the file, missing ones are NaN
+        """
+        self.paths.append(path)
+        for attr in ATTRIBUTES:
+            self._values[attr].append(values.get(attr, float('nan')))
+
+    def build(self):
+        columns = {}
+        for attr in ATTRIBUTES:
+            dtype = np.float64 if attr in TIME_ATTRIBUTES or \
+                any(value != value for value in self._values[attr]) \
+                else np.int64
+            columns[attr] = np.array(self._values[attr], dtype=dtype)
+        return ColumnarSnapshot(self.paths, columns)
+
+
+class ColumnarSnapshot(object):
+    """
+    :member paths: The paths of the files relative to the root, indexed by
+        file number.
+    :member columns: The attribute arrays, indexed by file number.
+    """
+    def __init__(self, paths, columns):
+        self.paths = paths
+        self.columns = columns
+        self._path_array = None
+        self._index = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @staticmethod
+    def from_filesystem(fs):
+        """
+        Build the columns of a file system in the dictionary representation,
+        such as a goal file system.
+        """
+        builder = ColumnBuilder()
+        stack = [(child, child['name']) for child in fs['children']] \
+            if fs else []
+        while stack:
+            node, path = stack.pop()
+            if node['type'] == 'directory':
+                stack.extend((child, path + '/' + child['name'])
+                             for child in node['children'])
+            else:
+                attributes = node.get('attributes', {})
+                builder.add_values(path, {
+                    attr: to_number(attr, attributes[attr])
+                    for attr in ATTRIBUTES if attr in attributes})
+        return builder.build()
+
+    def index(self):
+        """Returns the map from paths to file numbers."""
+        if self._index is None:
+            self._index = {path: i for i, path in enumerate(self.paths)}
+        return self._index
+
+    def select(self, attr, lower_bound, higher_bound, under=None):
+        """
+        Returns the numbers of the files whose attribute lies in
+        [lower_bound, higher_bound), optionally only below a directory.
+        """
+        column = self.columns[attr]
+        mask = (column >= to_number(attr, lower_bound)) & \
+            (column < to_number(attr, higher_bound))
+        if under:
+            if self._path_array is None:
+                self._path_array = np.array(self.paths, dtype=str)
+            prefix = under.rstrip('/') + '/'
+            mask &= np.char.startswith(self._path_array, prefix)
+        return np.nonzero(mask)[0]
+
+    def select_paths(self, attr, lower_bound, higher_bound, under=None):
+        return [self.paths[i] for i in
+                self.select(attr, lower_bound, higher_bound, under=under)]
+
+    def align(self, goal, attr):
+        """
+        Returns the goal's attribute column reordered by the file numbers of
+        this snapshot, with NaN for the files missing from the goal.
+        """
+        goal_index = goal.index()
+        positions = np.array([goal_index.get(path, -1) for path in self.paths],
+                             dtype=np.int64)
+        goal_column = goal.columns[attr].astype(np.float64)
+        aligned = np.full(len(self.paths), np.nan)
+        found = positions >= 0
+        aligned[found] = goal_column[positions[found]]
+        return aligned
+
+    def mismatches(self, goal, attr):
+        """
+        Returns the paths of the files present in both snapshots whose
+        attribute differs from the goal's. Times are compared by day, since
+        the goal file systems give dates.
+        """
+        expected = self.align(goal, attr)
+        actual = self.columns[attr].astype(np.float64)
+        present = ~np.isnan(expected) & ~np.isnan(actual)
+        if attr in TIME_ATTRIBUTES:
+            differ = (actual < expected) | (actual >= expected + 86400)
+        else:
+            differ = actual != expected
+        mask = present & differ
+        return [self.paths[i] for i in np.nonzero(mask)[0]]
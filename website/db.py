@@ -0,0 +1,98 @@
+"""
+Database connection tuning for running many study participants at once.
+
+Every new SQLite connection is switched to write-ahead logging, so that readers
+no longer block the writer, and is given a busy timeout so that concurrent
+writers wait for the database lock instead of failing immediately. The hot
+writes are additionally wrapped in `retry_on_busy`, which retries them when the
+database is still locked after the timeout, and the hot transactions in
+`retry_transaction_on_busy`, which retries them as a whole.
+"""
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+import functools
+import time
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply the SQLite pragmas to a newly created database connection."""
+    if connection.vendor != 'sqlite':
+        return
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode={}'.format(
+        getattr(settings, 'SQLITE_JOURNAL_MODE', 'WAL')))
+    cursor.execute('PRAGMA synchronous={}'.format(
+        getattr(settings, 'SQLITE_SYNCHRONOUS', 'NORMAL')))
+    cursor.execute('PRAGMA busy_timeout={:d}'.format(
+        getattr(settings, 'SQLITE_BUSY_TIMEOUT', 5000)))
+    cursor.close()
+
+
+def is_database_locked(err):
+    return 'database is locked' in str(err) or 'database is busy' in str(err)
+
+
+def retry_on_busy(f):
+    """
+    Retry a database write if it fails because the database is locked.
+
+    A write that is part of a larger transaction is not retried since the
+    transaction has to be rolled back as a whole.
+    """
+    @functools.wraps(f)
+    def g(*args, **kwargs):
+        max_retries = getattr(settings, 'SQLITE_MAX_RETRIES', 5)
+        delay = 0.05
+        for i in range(max_retries + 1):
+            try:
+                return f(*args, **kwargs)
+            except OperationalError as err:
+                if not is_database_locked(err) or i == max_retries \
+                        or connection.in_atomic_block:
+                    raise
+                print('Database is locked, retrying in {:.2f}s'.format(delay))
+                time.sleep(delay)
+                delay *= 2
+    return g
+
+
+def retry_transaction_on_busy(f):
+    """
+    Run a model method in a transaction, and run it again if the database is
+    locked. The writes within the transaction are not retried on their own
+    (see retry_on_busy), the whole transaction is. The fields of the model
+    instance are restored before every retry, so the method starts over from
+    the same state; it must not have side effects outside of the database.
+    """
+    @functools.wraps(f)
+    def g(self, *args, **kwargs):
+        fields = {field.attname: getattr(self, field.attname)
+                  for field in self._meta.concrete_fields}
+
+        def attempt():
+            self.__dict__.update(fields)
+            with transaction.atomic():
+                return f(self, *args, **kwargs)
+        return retry_on_busy(attempt)()
+    return g
+
+
+def explain_query_plan(queryset):
+    """Return the steps of the SQLite query plan of a queryset."""
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    steps = [row[-1] for row in cursor.fetchall()]
+    cursor.close()
+    return steps
+
+
+def full_table_scans(queryset):
+    """
+    Return the steps of the query plan of a queryset that read a whole table
+    without using an index.
+    """
+    return [step for step in explain_query_plan(queryset)
+            if step.startswith('SCAN') and 'INDEX' not in step]
@@ -0,0 +1,156 @@
+"""
+Cache of annotated file system diffs shared by all task sessions.
+
+Many participants reach exactly the same file system states for a task (the
+initial state, the goal state and common intermediate mistakes). The annotated
+diff only depends on the task, the scanned file system and the paths selected
+by the last command, so it is cached under the key
+
+    (task id, hash of the file system snapshot, hash of the selected paths)
+
+The diffs are stored JSON-encoded, which makes it cheap to hand out a private
+copy to every caller (the diffs are annotated further before they are sent)
+and gives an exact size for the least-recently-used eviction. The copies get
+their tags back as defaultdict(int), like the diffs filesystem_diff returns,
+since the annotations increment them.
+
+If settings.DIFF_CACHE_TRACE names a file, every lookup and insertion is
+appended to it so that scripts/bench_diff_cache.py can replay the recorded
+sessions.
+"""
+
+from django.conf import settings
+
+import collections
+import hashlib
+import json
+import threading
+import time
+
+
+def snapshot_hash(filesystem):
+    """
+    Hash of the JSON representation of a file system snapshot, given as
+    dictionaries or as filesystem.Node objects (which the encoder converts one
+    node at a time).
+    """
+    return hashlib.sha1(json.dumps(filesystem, sort_keys=True,
+                        separators=(',', ':'),
+                        default=lambda node: node.json_fields())
+                        .encode('utf-8')).hexdigest()
+
+
+def selection_hash(paths):
+    """Hash of the list of paths selected by a command."""
+    return hashlib.sha1('\n'.join(path.as_posix() for path in paths)
+                        .encode('utf-8')).hexdigest()
+
+
+def restore_tags(node):
+    """The object_hook which decodes the tags of a diff as defaultdict(int)."""
+    if isinstance(node.get('tag'), dict):
+        node['tag'] = collections.defaultdict(int, node['tag'])
+    return node
+
+
+class DiffCache(object):
+    """
+    A least-recently-used cache whose capacity is given in bytes of encoded
+    diffs.
+
+    :member max_size: The maximum total size of the cached diffs in bytes.
+    """
+    def __init__(self, max_size, trace_path=''):
+        self.max_size = max_size
+        self.trace_path = trace_path
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(task_id, filesystem, stdout_paths, filesystem_hash=None):
+        """
+        Returns the key of a diff. The snapshot hash can be given if it is
+        already known.
+        """
+        if filesystem_hash is None:
+            filesystem_hash = snapshot_hash(filesystem)
+        return (task_id, filesystem_hash, selection_hash(stdout_paths))
+
+    def get(self, key, trace_id=''):
+        """Returns a copy of the cached diff, or None on a cache miss."""
+        encoded = self.get_encoded(key)
+        self._trace('get', trace_id, key, hit=encoded is not None)
+        if encoded is None:
+            return None
+        return json.loads(encoded, object_hook=restore_tags)
+
+    def get_encoded(self, key):
+        """Returns the cached diff as JSON, or None on a cache miss."""
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        return encoded
+
+    def put(self, key, fs_diff, trace_id=''):
+        encoded = json.dumps(fs_diff, separators=(',', ':'))
+        self._trace('put', trace_id, key, size=len(encoded))
+        self.put_encoded(key, encoded)
+
+    def put_encoded(self, key, encoded):
+        size = len(encoded)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = encoded
+            self._size += size
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            num_lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / num_lookups if num_lookups else 0.0,
+                'evictions': self.evictions,
+                'num_entries': len(self._entries),
+                'size': self._size,
+                'max_size': self.max_size,
+            }
+
+    def _trace(self, op, trace_id, key, **kwargs):
+        if not self.trace_path:
+            return
+        record = {
+            'op': op,
+            'time': time.time(),
+            'trace_id': trace_id,
+            'key': list(key),
+        }
+        record.update(kwargs)
+        with self._lock:
+            with open(self.trace_path, 'a') as o_f:
+                o_f.write(json.dumps(record) + '\n')
+
+
+diff_cache = DiffCache(
+    max_size=getattr(settings, 'DIFF_CACHE_MAX_SIZE', 64 * 1024 * 1024),
+    trace_path=getattr(settings, 'DIFF_CACHE_TRACE', ''))
@@ -0,0 +1,122 @@
+"""
+Compact wire encoding of the annotated file system diffs.
+
+The JSON representation of a diff repeats the "type", "name", "attributes" and
+"tag" keys on every node. The compact encoding replaces every node with a
+positional list
+
+    [kind, name, tags, attributes]              (files)
+    [kind, name, tags, children(, collapsed)]   (directories)
+
+where
+    kind is 0 for a file and 1 for a directory,
+    name is an index into the shared name table,
+    tags is a flat list [tag code, value, tag code, value, ...] with the tag
+        codes taken from TAG_NAMES, or null if the node has no tag field,
+    attributes is a list of [key, current value(, expected value)] with the
+        key an index into the shared attribute key table, or null if the file
+        has no attributes field,
+    collapsed is the [number of files, number of directories] left out of a
+        summarized directory (see diff_summary.py), omitted if there are none.
+
+The encoded diff is
+
+    {"names": [...], "keys": [...], "root": node}
+
+The browser asks for it by sending "diff_encoding=compact"; fs_tree_vis.js
+decodes it back to the JSON representation.
+"""
+
+TAG_NAMES = ['extra', 'missing', 'incorrect', 'correct', 'stdout_missing',
+             'stdout_extra', 'ch_extra', 'ch_missing', 'ch_incorrect',
+             'to_select', 'selected', 'truncated']
+TAG_CODES = {tag: code for code, tag in enumerate(TAG_NAMES)}
+
+_FILE = 0
+_DIRECTORY = 1
+
+
+def wants_compact_diff(request):
+    """Check if the browser negotiated the compact encoding."""
+    return request.GET.get('diff_encoding') == 'compact' or \
+        request.POST.get('diff_encoding') == 'compact'
+
+
+def encode_compact_diff(fs_diff):
+    names = []
+    name_indices = {}
+    keys = []
+    key_indices = {}
+
+    def index(table, indices, value):
+        i = indices.get(value)
+        if i is None:
+            i = indices[value] = len(table)
+            table.append(value)
+        return i
+
+    def encode_node(node):
+        if 'tag' in node:
+            tags = []
+            for tag, value in node['tag'].items():
+                tags.append(TAG_CODES[tag])
+                tags.append(value)
+        else:
+            tags = None
+        encoded = [_DIRECTORY if node['type'] == 'directory' else _FILE,
+                   index(names, name_indices, node['name']), tags, None]
+        if node['type'] == 'directory':
+            encoded[3] = []
+            for child in node['children']:
+                encoded[3].append(encode_node(child))
+            if 'collapsed' in node:
+                encoded.append([node['collapsed']['files'],
+                                node['collapsed']['directories']])
+        elif 'attributes' in node:
+            encoded[3] = [[index(keys, key_indices, key)] +
+                          str(value).split(':::', 1)
+                          for key, value in node['attributes'].items()]
+        return encoded
+
+    root = encode_node(fs_diff) if fs_diff is not None else None
+    return {'names': names, 'keys': keys, 'root': root}
+
+
+def decode_compact_diff(encoded):
+    names = encoded['names']
+    keys = encoded['keys']
+
+    def decode_node(node):
+        kind, name, tags, rest = node[:4]
+        decoded = {
+            'type': 'directory' if kind == _DIRECTORY else 'file',
+            'name': names[name]
+        }
+        if tags is not None:
+            decoded['tag'] = {TAG_NAMES[tags[i]]: tags[i + 1]
+                              for i in range(0, len(tags), 2)}
+        if kind == _DIRECTORY:
+            decoded['children'] = [decode_node(child) for child in rest]
+            if len(node) > 4:
+                decoded['collapsed'] = {'files': node[4][0],
+                                        'directories': node[4][1]}
+        elif rest is not None:
+            decoded['attributes'] = {keys[attr[0]]: ':::'.join(attr[1:])
+                                     for attr in rest}
+        return decoded
+
+    if encoded['root'] is None:
+        return None
+    return decode_node(encoded['root'])
+
+
+def encode_diff_fields(request, resp):
+    """
+    Replace the file system diff (or subtree) in a response dictionary with
+    its compact encoding if the browser asked for it.
+    """
+    if wants_compact_diff(request):
+        for field in ['filesystem_diff', 'filesystem_subtree']:
+            if field in resp:
+                resp[field + '_compact'] = encode_compact_diff(resp.pop(field))
+    return resp
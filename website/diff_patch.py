@@ -0,0 +1,270 @@
+"""
+Incremental updates of the file system diff shown in the browser.
+
+The server remembers the last annotated file system diff it sent to each task
+session together with a version number. When the browser reports that it holds
+that version, only a patch is sent:
+
+    {
+        "removed": [key, ...],
+        "updated": [{"key": key, "node": node}, ...],
+        "inserted": [{"parent": key, "index": i, "node": subtree}, ...]
+    }
+
+Every node is identified by a key built from the types and names on its path,
+e.g. "d:website/d:css/f:main.css" (a file and a directory may have the same
+name in a diff). A removed or inserted node stands for its whole subtree, and
+an updated node carries every field except its children. The browser applies
+the removals first, then the updates and finally the insertions in the order
+given; fs_tree_vis.js implements the same keys.
+
+With several server processes, the diffs are shared through files (see
+DiffVersionStore and settings.DIFF_VERSION_DIR).
+"""
+
+from django.conf import settings
+
+from .locks import session_lock
+
+import collections
+import hashlib
+import os
+import pickle
+import random
+import threading
+
+
+def node_key(node, parent_key=None):
+    key = ('d:' if node['type'] == 'directory' else 'f:') + node['name']
+    return key if parent_key is None else parent_key + '/' + key
+
+
+def node_fields(node):
+    """The fields of a node except for its children."""
+    return {field: value for field, value in node.items()
+            if field != 'children'}
+
+
+def index_diff(fs_diff):
+    """
+    Returns a dictionary from node keys to (parent key, position among the
+    siblings, node) triples, in pre-order.
+    """
+    nodes = collections.OrderedDict()
+    stack = [(fs_diff, None, 0)]
+    while stack:
+        node, parent_key, index = stack.pop()
+        key = node_key(node, parent_key)
+        nodes[key] = (parent_key, index, node)
+        children = node.get('children') or []
+        for i in range(len(children) - 1, -1, -1):
+            stack.append((children[i], key, i))
+    return nodes
+
+
+def compute_diff_patch(old_diff, new_diff):
+    """
+    Compute the patch which turns old_diff into new_diff. Returns None if the
+    two diffs are identical.
+    """
+    old_nodes = index_diff(old_diff)
+    new_nodes = index_diff(new_diff)
+
+    removed = []
+    for key, (parent_key, _, _) in old_nodes.items():
+        if key not in new_nodes and parent_key in new_nodes:
+            removed.append(key)
+
+    updated = []
+    inserted = []
+    for key, (parent_key, index, node) in new_nodes.items():
+        if key in old_nodes:
+            if node_fields(node) != node_fields(old_nodes[key][2]):
+                updated.append({'key': key, 'node': node_fields(node)})
+        elif parent_key in old_nodes:
+            inserted.append({'parent': parent_key, 'index': index,
+                             'node': node})
+
+    if not (removed or updated or inserted):
+        return None
+    return {'removed': removed, 'updated': updated, 'inserted': inserted}
+
+
+def apply_diff_patch(fs_diff, patch):
+    """Apply a patch computed by compute_diff_patch to a diff in place."""
+    nodes = index_diff(fs_diff)
+    for key in patch['removed']:
+        parent_key, _, node = nodes[key]
+        nodes[parent_key][2]['children'].remove(node)
+    for update in patch['updated']:
+        node = nodes[update['key']][2]
+        for field in list(node):
+            if field != 'children':
+                del node[field]
+        node.update(update['node'])
+    for insertion in patch['inserted']:
+        parent = nodes[insertion['parent']][2]
+        parent['children'].insert(insertion['index'], insertion['node'])
+    return fs_diff
+
+
+class DiffVersionStore(object):
+    """
+    Remembers the last diff sent to each task session, and the complete diff
+    it was summarized from.
+
+    Without a directory, the diffs are kept in the memory of the process,
+    which is enough for a single server process. With several server
+    processes, a request of a task session may reach any of them, so the
+    diffs are kept in one file per task session in the directory, shared by
+    every process, and each process caches the files it last read.
+
+    :member max_sessions: The number of task sessions remembered in memory.
+        The least recently updated ones are forgotten first; without a
+        directory, their browsers then receive a full diff.
+    :member directory: The directory of the diff files, or None.
+    """
+    def __init__(self, max_sessions=1000, directory=None):
+        self.max_sessions = max_sessions
+        self.directory = directory
+        self._versions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Returns the (version, diff) last sent to a task session."""
+        version, fs_diff, _ = self._get_entry(session_id)
+        return version, fs_diff
+
+    def get_full(self, session_id):
+        """
+        Returns the version and the complete diff of the last update of a task
+        session, which differs from the diff sent if a summary was sent.
+        """
+        version, _, full_diff = self._get_entry(session_id)
+        return version, full_diff
+
+    def update(self, session_id, fs_diff, client_version=None,
+               full_diff=None):
+        """
+        Record the diff of a task session and return the fields of the
+        response which bring the browser up to date.
+
+        Args:
+            session_id: the ID of the task session
+            fs_diff: the latest annotated file system diff, or its summary
+            client_version: the version of the diff the browser holds
+            full_diff: the complete diff if fs_diff is a summary
+        """
+        if self.directory is None:
+            return self._update(session_id, fs_diff, client_version,
+                                full_diff)
+        # the read and the write of the file must not interleave with
+        # those of another process
+        with session_lock('diff_versions:' + session_id):
+            return self._update(session_id, fs_diff, client_version,
+                                full_diff)
+
+    def forget(self, session_id):
+        """Forget the diffs of a task session which is closed."""
+        with self._lock:
+            self._versions.pop(session_id, None)
+        if self.directory is not None:
+            try:
+                os.remove(self._path(session_id))
+            except FileNotFoundError:
+                pass
+
+    def _update(self, session_id, fs_diff, client_version, full_diff):
+        version, last_diff, last_full_diff = self._get_entry(session_id)
+        if version is None:
+            # the versions of a task session start at a random number, so that
+            # a version issued by another server process is not mistaken for
+            # one of ours
+            version = random.getrandbits(48)
+        if full_diff is None:
+            full_diff = fs_diff
+        if last_diff is not None and client_version == version:
+            patch = compute_diff_patch(last_diff, fs_diff)
+            if patch is None and full_diff != last_full_diff:
+                # the summary did not change but the subtrees the browser
+                # expanded may have, so a new version is issued
+                patch = {'removed': [], 'updated': [], 'inserted': []}
+            if patch is None:
+                return {
+                    'filesystem_diff_version': version,
+                    'filesystem_diff_unchanged': True
+                }
+            fields = {
+                'filesystem_diff_version': version + 1,
+                'filesystem_diff_base_version': version,
+                'filesystem_diff_patch': patch
+            }
+        else:
+            fields = {
+                'filesystem_diff_version': version + 1,
+                'filesystem_diff': fs_diff
+            }
+        entry = (version + 1, fs_diff, full_diff)
+        file_stat = self._write(session_id, entry)
+        with self._lock:
+            self._versions[session_id] = (file_stat, entry)
+            self._versions.move_to_end(session_id)
+            while len(self._versions) > self.max_sessions:
+                self._versions.popitem(last=False)
+        return fields
+
+    def _get_entry(self, session_id):
+        """
+        Returns the (version, diff, full diff) of a task session, read from
+        its file if another process updated it.
+        """
+        with self._lock:
+            file_stat, entry = self._versions.get(session_id, (None, None))
+        if self.directory is None:
+            return entry or (None, None, None)
+        try:
+            current_stat = file_signature(os.stat(self._path(session_id)))
+        except FileNotFoundError:
+            return None, None, None
+        if current_stat == file_stat:
+            return entry
+        try:
+            with open(self._path(session_id), 'rb') as f:
+                current_stat = file_signature(os.fstat(f.fileno()))
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None, None, None
+        with self._lock:
+            self._versions[session_id] = (current_stat, entry)
+            while len(self._versions) > self.max_sessions:
+                self._versions.popitem(last=False)
+        return entry
+
+    def _write(self, session_id, entry):
+        """
+        Write the entry of a task session to its file, if there is a
+        directory, and returns the signature of the file.
+        """
+        if self.directory is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(session_id)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        # the readers see either the previous file or the new one
+        os.replace(temp_path, path)
+        return file_signature(os.stat(path))
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, '{}.pickle'.format(
+            hashlib.sha1(session_id.encode('utf-8')).hexdigest()))
+
+
+def file_signature(file_stat):
+    """Changes whenever a diff file is replaced."""
+    return file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size
+
+
+diff_versions = DiffVersionStore(
+    directory=getattr(settings, 'DIFF_VERSION_DIR', '') or None)
@@ -0,0 +1,110 @@
+"""
+Summarized file system diffs for large file systems.
+
+A summarized diff keeps only the nodes which carry an error or a selection tag,
+their ancestors and the root. The children left out of a directory are counted
+in a "collapsed" field
+
+    "collapsed": {"files": 120, "directories": 4}
+
+so the size of a summarized diff is bounded by the number of nodes with errors
+or selections, not by the size of the file system. When the participant
+expands a collapsed directory, the browser requests the subtree from
+/get_filesystem_subtree, which returns the directory with all of its children
+(each of them summarized again).
+
+The browser asks for summaries by sending "diff_mode=summary"; diffs with at
+most settings.DIFF_SUMMARY_MIN_NODES nodes are always sent in full.
+"""
+
+from django.conf import settings
+
+from .diff_patch import node_key, node_fields
+
+
+def wants_summarized_diff(request, fs_diff):
+    """
+    Check if the browser negotiated summarized diffs and the diff is large
+    enough to be summarized.
+    """
+    if request.GET.get('diff_mode') != 'summary' and \
+            request.POST.get('diff_mode') != 'summary':
+        return False
+    return fs_diff is not None and count_nodes(fs_diff) > \
+        getattr(settings, 'DIFF_SUMMARY_MIN_NODES', 1000)
+
+
+def count_nodes(fs_diff):
+    num_nodes = 0
+    stack = [fs_diff]
+    while stack:
+        node = stack.pop()
+        num_nodes += 1
+        stack.extend(node.get('children') or [])
+    return num_nodes
+
+
+def is_marked(node):
+    """Check if a node itself carries an error or a selection tag."""
+    return any(tag != 'correct' for tag in node.get('tag') or {})
+
+
+def summarize_diff(fs_diff, expanded=False):
+    """
+    Returns the summary of an annotated file system diff. The diff itself is
+    not modified.
+
+    Args:
+        fs_diff: the annotated file system diff
+        expanded: keep every child of the root, not only the marked ones
+    """
+    if fs_diff is None:
+        return None
+    # the nodes are summarized in post-order with an explicit stack, so that
+    # deep file systems do not exhaust the recursion limit; the summaries of
+    # the visited children wait in 'summaries' for their parent
+    summaries = {}
+    stack = [(fs_diff, expanded, False)]
+    while stack:
+        node, node_expanded, children_done = stack.pop()
+        if node['type'] == 'directory' and not children_done:
+            stack.append((node, node_expanded, True))
+            stack.extend((child, False, False) for child in node['children'])
+            continue
+        summary = node_fields(node)
+        marked = is_marked(node)
+        if node['type'] == 'directory':
+            children = []
+            num_files = 0
+            num_directories = 0
+            for child in node['children']:
+                child_summary, child_marked = summaries.pop(id(child))
+                if child_marked or node_expanded:
+                    children.append(child_summary)
+                elif child['type'] == 'directory':
+                    num_directories += 1
+                else:
+                    num_files += 1
+                marked = marked or child_marked
+            summary['children'] = children
+            if num_files or num_directories:
+                summary['collapsed'] = {'files': num_files,
+                                        'directories': num_directories}
+        summaries[id(node)] = (summary, marked)
+    return summaries[id(fs_diff)][0]
+
+
+def find_node(fs_diff, key):
+    """Returns the node of a diff with the given key, or None."""
+    steps = key.split('/')
+    node = fs_diff
+    if node is None or node_key(node) != steps[0]:
+        return None
+    for step in steps[1:]:
+        for child in node.get('children') or []:
+            if node_key(child) == step:
+                node = child
+                break
+        else:
+            return None
+    return node
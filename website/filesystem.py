@@ -1,7 +1,17 @@
 """
 File system serialization and deserialization.
 
-TODO: handle links in a file system properly.
+Symbolic links are followed, but every directory is listed at most once, so
+link cycles end the traversal instead of looping forever. Scans are bounded by
+a number of entries, a depth and a time budget; a directory which was not
+fully listed is marked with "truncated": true, and so is the root of a
+partial snapshot. 'filesystem_diff' turns the marker into a "truncated" tag,
+so that a partial snapshot never counts as a completed task.
+
+Large trees can be scanned by a pool of threads (see the 'workers' parameter
+of 'disk_2_dict'), which overlap the directory listings and stat calls, since
+they release the GIL. Every directory sorts its own children, so the snapshot
+does not depend on the order in which the threads list the directories.
 
 Given the following directory:
 
@@ -41,6 +51,11 @@ Its JSON representation is:
     }
 }
 
+The "content" attribute of a file is the SHA-1 digest of its content rather
+than the content itself, so that neither the scans nor the diffs grow with the
+file sizes. Goal file systems spell out the content, which is replaced by its
+digest with 'digest_goal_contents' before comparison.
+
 The 'filesystem_diff' function returns an annotated JSON representation which
 contains one extra "tag" field for each entry. The tag field is a dictionary
 with error types as the key and count as the value.
@@ -71,12 +86,23 @@ and four are incorrect.
                         executed command
 """
 
+from .owners import host_owners
+
 import collections
+import collections.abc
+import concurrent.futures
 import datetime
+import functools
+import hashlib
 import json
+import math
 import pathlib
 import re
 import copy, os, pwd, grp, shutil
+import stat
+import sys
+import threading
+import time
 
 # file attributes
 _NAME = 0
@@ -89,6 +115,13 @@ _CTIME = 6
 _MTIME = 7
 _CONTENT = 8
 
+# default scan budgets of disk_2_dict
+SCAN_MAX_ENTRIES = 100000
+SCAN_MAX_DEPTH = 64
+SCAN_TIME_BUDGET = 2.0
+# the number of entries a scan lists on the calling thread before it fans out
+PARALLEL_SCAN_MIN_ENTRIES = 2000
+
 ERROR_TAGS = ['extra', 'missing', 'incorrect', 'stdout_missing',
               'stdout_extra', 'ch_extra', 'ch_missing', 'ch_incorrect']
 
@@ -97,33 +130,115 @@ directories_in_sample_filesystems = ['backup', 'content', 'css', 'js', 'lib',
     'fonts', 'angular', 'jquery', 'showdown', 'underscore']
 
 
-class Node(object):
+class Node(collections.abc.MutableMapping):
     """
     A node in the filesystem representation. Can be a regular file or a
     directory.
 
+    Nodes are compact (no per-instance dictionary, interned names, typed
+    attributes) and implement the mapping protocol with the keys of the
+    dictionary representation, so that the comparison and annotation
+    functions work on both. Only the keys whose value is not None are present.
+
     :member name: The name of the node.
     :member type: The type of the node.
+    :member tag: The annotations of the node, or None.
     """
+    __slots__ = ('name', 'type', 'tag')
+    _keys = ('name', 'type', 'tag')
+
     def __init__(self, name, type):
-        self.name = name
+        self.name = sys.intern(name)
         self.type = type
+        self.tag = None
+
+    def __getitem__(self, key):
+        if key in self._keys:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        self[key] = None
+
+    def __contains__(self, key):
+        return key in self._keys and getattr(self, key) is not None
+
+    def __iter__(self):
+        return (key for key in self._keys if getattr(self, key) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
 
 class Directory(Node):
+    """
+    :member children: The child nodes.
+    :member truncated: True if the children were not all listed, else None.
+    """
+    __slots__ = ('children', 'truncated')
+    _keys = ('name', 'type', 'children', 'truncated', 'tag')
+
     def __init__(self, name):
         super(Directory, self).__init__(name, 'directory')
         self.children = []
+        self.truncated = None
+
+    def json_fields(self):
+        """
+        Returns the fields of the dictionary representation of the directory,
+        with the children left as Node objects (see diff_cache.snapshot_hash).
+        """
+        d = {
+            'name': self.name,
+            'type': self.type,
+            'children': self.children
+        }
+        if self.truncated:
+            d['truncated'] = True
+        if self.tag is not None:
+            d['tag'] = self.tag
+        return d
 
     def to_dict(self):
-        children_dict_list = [child.to_dict() for child in
-                              sorted(self.children, key=lambda x:x.name)]
-        return {
+        """Returns the dictionary representation of the subtree."""
+        root = {
             'name': self.name,
             'type': self.type,
-            'children': children_dict_list
+            'children': []
         }
+        stack = [(self, root)]
+        while stack:
+            node, node_dict = stack.pop()
+            if node.truncated:
+                node_dict['truncated'] = True
+            if node.tag is not None:
+                node_dict['tag'] = node.tag
+            for child in node.children:
+                if child.type == 'directory':
+                    child_dict = {
+                        'name': child.name,
+                        'type': child.type,
+                        'children': []
+                    }
+                    stack.append((child, child_dict))
+                else:
+                    child_dict = child.to_dict()
+                node_dict['children'].append(child_dict)
+        return root
 
 class File(Node):
+    """
+    :member attributes: The FileAttributes of the file.
+    """
+    __slots__ = ('attributes',)
+    _keys = ('name', 'type', 'attributes', 'tag')
+
     def __init__(self, name, user=None, group=None, size=None, mode=None,
                  atime=None, ctime=None, mtime=None, content=None):
         super(File, self).__init__(name, 'file')
@@ -140,13 +255,27 @@ class File(Node):
         )
 
     def to_dict(self):
-        return {
+        d = {
             'name': self.name,
             'type': self.type,
             'attributes': self.attributes.to_dict()
         }
+        if self.tag is not None:
+            d['tag'] = self.tag
+        return d
+
+    # a file has no children to leave as Node objects
+    json_fields = to_dict
+
+class FileAttributes(collections.abc.MutableMapping):
+    """
+    The attributes of a file, stored with their own types (int for the size
+    and mode, datetime.date for the timestamps). As a mapping it gives their
+    string values like the dictionary representation.
+    """
+    __slots__ = ('user', 'group', 'size', 'mode', 'atime', 'ctime', 'mtime',
+                 'content')
 
-class FileAttributes(object):
     def __init__(self, user=None, group=None, size=None, mode=None,
                  atime=None, ctime=None, mtime=None, content=None):
         self.user = user
@@ -158,68 +287,402 @@ class FileAttributes(object):
         self.mtime = mtime
         self.content = content
 
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None:
+                return str(value)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        self[key] = None
+
+    def __iter__(self):
+        return (key for key in self.__slots__ if getattr(self, key) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
     def to_dict(self):
         # None-value attributes are excluded from the serialization
         d = {}
-        for attr in self.__dict__:
-            if self.__dict__[attr] is not None:
-                d[attr] = str(self.__dict__[attr])
+        for key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None:
+                d[key] = str(value)
         return d
 
 # --- Read a filesystem to/from the disk --- #
 
-def disk_2_dict(path: pathlib.Path, attrs=[_NAME]) -> dict:
+@functools.lru_cache(maxsize=4096)
+def _second_date(second):
+    return datetime.date.fromtimestamp(second)
+
+def _stat_date(timestamp):
+    # the local day of a timestamp only depends on its second, and the files
+    # of a snapshot share few distinct seconds
+    return _second_date(math.floor(timestamp))
+
+def _content(path, file_stat, owners):
+    if stat.S_ISREG(file_stat.st_mode):
+        return file_digest(path, file_stat)
+    return ''
+
+# the FileAttributes slot of each attribute and the function computing it
+# from the path string, the stat result and the owner name resolver
+_ATTRIBUTE_GETTERS = {
+    _USER: ('user', lambda path, file_stat, owners:
+            owners.user_name(file_stat.st_uid)),
+    _GROUP: ('group', lambda path, file_stat, owners:
+             owners.group_name(file_stat.st_gid)),
+    _SIZE: ('size', lambda path, file_stat, owners: file_stat.st_size),
+    _MODE: ('mode', lambda path, file_stat, owners: file_stat.st_mode),
+    _ATIME: ('atime', lambda path, file_stat, owners:
+             _stat_date(file_stat.st_atime)),
+    _CTIME: ('ctime', lambda path, file_stat, owners:
+             _stat_date(file_stat.st_ctime)),
+    _MTIME: ('mtime', lambda path, file_stat, owners:
+             _stat_date(file_stat.st_mtime)),
+    _CONTENT: ('content', _content),
+}
+
+
+class AttributeExtractor(object):
+    """
+    The file attributes of a task compiled into the getters 'disk_2_dict'
+    calls for every file, so that the scan neither dispatches on the
+    attribute numbers nor stats files of which only the name is used.
+
+    :member attrs: The file attributes, as in the task configurations.
+    :member getters: The (slot, getter) pairs of the attributes other than
+        the name, in the order of attrs.
+    :member needs_stat: Whether the getters use the stat result of the file.
+    """
+    def __init__(self, attrs):
+        self.attrs = tuple(attrs)
+        getters = []
+        for attr in self.attrs:
+            getter = _ATTRIBUTE_GETTERS.get(attr)
+            if getter is not None and getter not in getters:
+                getters.append(getter)
+        self.getters = tuple(getters)
+        self.needs_stat = len(self.getters) > 0
+
+    def extract(self, attributes, path, file_stat, owners):
+        """Set the attributes of a file on its FileAttributes."""
+        for slot, getter in self.getters:
+            setattr(attributes, slot, getter(path, file_stat, owners))
+
+
+_extractors = {}
+
+def compile_attributes(attrs) -> AttributeExtractor:
+    """Returns the (shared) AttributeExtractor of a list of file attributes."""
+    if isinstance(attrs, AttributeExtractor):
+        return attrs
+    key = tuple(attrs)
+    try:
+        return _extractors[key]
+    except KeyError:
+        return _extractors.setdefault(key, AttributeExtractor(key))
+
+
+def disk_2_dict(path: pathlib.Path, attrs=[_NAME],
+                max_entries=SCAN_MAX_ENTRIES, max_depth=SCAN_MAX_DEPTH,
+                time_budget=SCAN_TIME_BUDGET, owners=None,
+                columns=None, as_dict=True, workers=1) -> dict:
     """
     :param path: location of directory
-    :param attrs: list of relevant file attributes
+    :param attrs: list of relevant file attributes, or their compiled
+        AttributeExtractor
+    :param max_entries: the maximum number of files and directories listed
+    :param max_depth: the maximum depth of the directories listed
+    :param time_budget: the time in seconds after which no more directories
+        are listed, None for no limit
+    :param owners: the resolver of the user and group names (see owners.py),
+        the host's databases by default
+    :param columns: a columnar.ColumnBuilder which collects the attributes of
+        every file as well
+    :param as_dict: return the dictionary representation rather than the
+        Node tree, which takes less memory and can be passed to
+        'filesystem_diff' as it is
+    :param workers: the maximum number of threads listing directories. The
+        scan starts on the calling thread and only fans the remaining
+        directories out to a thread pool after PARALLEL_SCAN_MIN_ENTRIES
+        entries, so that small trees do not pay for the threads. The
+        snapshot is the same as the serial one, except for which entries a
+        budget cuts off.
 
     Returns:
-        JSON representation of the directory named by path
+        JSON representation of the directory named by path, marked as
+        truncated if one of the budgets ran out
     """
     if not path.exists():
         return None
-
-    def create_filesystem(path: pathlib.Path, attrs=[_NAME]) -> Node:
-        if path.is_dir():
-            node = Directory(path.name)
-            for subpath in path.iterdir():
-                subtree = create_filesystem(subpath, attrs=attrs)
-                node.children.append(subtree)
-        else:
-            node = File(path.name)
-            if len(attrs) > 0:
-                file_stat = os.stat(path.as_posix())
-            for attr in attrs:
-                if attr == _USER:
-                    # node.attributes.user = pwd.getpwuid(file_stat.st_uid).pw_name
-                    node.attributes.user = 'me'
-                if attr == _GROUP:
-                    node.attributes.group = grp.getgrgid(file_stat.st_gid).gr_name
-                if attr == _SIZE:
-                    node.attributes.size = file_stat.st_size
-                if attr == _MODE:
-                    node.attributes.mode = file_stat.st_mode
-                if attr == _ATIME:
-                    node.attributes.atime = datetime.date.\
-                        fromtimestamp(file_stat.st_atime)
-                if attr == _MTIME:
-                    node.attributes.mtime = datetime.date.\
-                        fromtimestamp(file_stat.st_mtime)
-                if attr == _CTIME:
-                    node.attributes.ctime = datetime.date.\
-                        fromtimestamp(file_stat.st_ctime)
-                if attr == _CONTENT:
-                    with open(path.as_posix(), encoding='utf-8',
-                              errors='ignore') as f:
-                        node.attributes.content = f.read()
+    if owners is None:
+        owners = host_owners
+    extractor = compile_attributes(attrs)
+    needs_stat = extractor.needs_stat or columns is not None
+    add_columns = columns.add if columns is not None else None
+
+    def create_file(name, path: str, relative_path=None) -> Node:
+        node = File(name)
+        if needs_stat:
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                # a dangling symbolic link
+                file_stat = os.lstat(path)
+            if add_columns is not None:
+                add_columns(relative_path, file_stat)
+            extractor.extract(node.attributes, path, file_stat, owners)
         return node
 
-    fs = create_filesystem(path, attrs)
-    fs_dict = fs.to_dict()
+    deadline = time.monotonic() + time_budget if time_budget else None
+    num_entries = 0
+    truncated = False
+    # guards the budgets when the scan is parallel
+    scan_lock = threading.Lock()
+
+    def list_directory(node, dir_path, relative_dir_path, depth, ancestors):
+        """
+        Fill in the children of a directory node. Returns the subdirectories
+        still to be listed.
+
+        'ancestors' holds the (device, inode) of the directories above the
+        directory: a directory which is one of its own ancestors is reached
+        through a symbolic link cycle and is left empty. Other links to a
+        directory are listed like the directory itself.
+        """
+        nonlocal num_entries, truncated
+        try:
+            dir_stat = os.stat(dir_path)
+        except OSError:
+            return []
+        dir_id = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_id in ancestors:
+            return []
+        ancestors = ancestors | {dir_id}
+        if depth >= max_depth or \
+                (deadline is not None and time.monotonic() > deadline):
+            node.truncated = truncated = True
+            return []
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            return []
+        with scan_lock:
+            num_listed = max(0, min(len(entries), max_entries - num_entries))
+            num_entries += num_listed
+        if num_listed < len(entries):
+            node.truncated = truncated = True
+        subdirectories = []
+        for entry in entries[:num_listed]:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            relative_path = relative_dir_path + entry.name
+            if is_dir:
+                child = Directory(entry.name)
+                subdirectories.append((child, entry.path,
+                                       relative_path + '/', depth + 1,
+                                       ancestors))
+            else:
+                child = create_file(entry.name, entry.path, relative_path)
+            node.children.append(child)
+        # the order of filesystem_sort: files first, then directories
+        node.children.sort(key=lambda x: (x.type != 'file', x.name))
+        return subdirectories
+
+    def list_in_parallel(stack, num_workers):
+        """List the directories of the stack and below on a thread pool."""
+        nonlocal add_columns
+        if columns is not None:
+            def add_columns(relative_path, file_stat):
+                with scan_lock:
+                    columns.add(relative_path, file_stat)
+        condition = threading.Condition()
+        # the directories on the stack or being listed
+        num_pending = len(stack)
+
+        def work():
+            nonlocal num_pending
+            while True:
+                with condition:
+                    while not stack and num_pending:
+                        condition.wait()
+                    if not stack:
+                        return
+                    directory = stack.pop()
+                subdirectories = []
+                try:
+                    subdirectories = list_directory(*directory)
+                finally:
+                    with condition:
+                        stack.extend(subdirectories)
+                        num_pending += len(subdirectories) - 1
+                        condition.notify_all()
+
+        with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+            for future in [executor.submit(work)
+                           for _ in range(num_workers)]:
+                future.result()
+
+    if path.is_dir():
+        fs = Directory(path.name)
+        stack = [(fs, path.as_posix(), '', 0, frozenset())]
+    else:
+        fs = create_file(path.name, path.as_posix(), path.name)
+        stack = []
+    while stack:
+        if workers > 1 and len(stack) > 1 and \
+                num_entries >= PARALLEL_SCAN_MIN_ENTRIES:
+            # a large tree: one worker per pending subtree, at most workers
+            list_in_parallel(stack, min(workers, len(stack)))
+            break
+        stack.extend(list_directory(*stack.pop()))
+
+    if truncated and fs.type == 'directory':
+        fs.truncated = True
+
+    return fs.to_dict() if as_dict else fs
+
 
-    filesystem_sort(fs_dict)
+# digests of the files scanned, keyed by (device, inode, size, mtime)
+_content_digests = collections.OrderedDict()
+_content_digests_lock = threading.Lock()
+CONTENT_DIGEST_CACHE_SIZE = 65536
+CONTENT_DIGEST_CHUNK_SIZE = 64 * 1024
 
-    return fs_dict
+def file_digest(path, file_stat=None) -> str:
+    """
+    Returns the SHA-1 digest of the content of a file, given by its
+    pathlib.Path or its path string. The file is read in chunks, and the
+    digest is cached until the file is modified.
+    """
+    path = str(path)
+    if file_stat is None:
+        file_stat = os.stat(path)
+    key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_size,
+           file_stat.st_mtime_ns)
+    with _content_digests_lock:
+        digest = _content_digests.get(key)
+        if digest is not None:
+            _content_digests.move_to_end(key)
+            return digest
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CONTENT_DIGEST_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+
+    with _content_digests_lock:
+        _content_digests[key] = digest
+        while len(_content_digests) > CONTENT_DIGEST_CACHE_SIZE:
+            _content_digests.popitem(last=False)
+    return digest
+
+def text_digest(text: str) -> str:
+    """Returns the SHA-1 digest of a file content given as text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def read_file_range(f, offset: int, length: int):
+    """
+    Read at most length bytes of a regular file starting at offset. The file
+    is not memory-mapped: the participant's commands may truncate it while it
+    is read, and reading a mapped page past the end of the file kills the
+    process with SIGBUS.
+
+    Args:
+        f: the file, opened in binary mode (see open_home_file)
+
+    Returns:
+        the bytes read and the size of the file
+    """
+    size = os.fstat(f.fileno()).st_size
+    if offset >= size:
+        return b'', size
+    f.seek(offset)
+    return f.read(length), size
+
+def open_home_file(home: pathlib.Path, relative_path: str):
+    """
+    Open a regular file given by its path relative to the home directory for
+    reading in binary mode. Returns None if the path does not name a regular
+    file, leads out of the home directory or goes through a symbolic link.
+
+    The participant is root in the container and may swap a directory of the
+    path for a symbolic link at any time, so the path is not checked and then
+    opened: it is opened one directory at a time from the home directory,
+    without following symbolic links, and the file opened is the file checked.
+    """
+    if not relative_path or os.path.isabs(relative_path):
+        return None
+    home = os.path.normpath(home.as_posix())
+    path = os.path.normpath(os.path.join(home, relative_path))
+    if path == home or os.path.commonpath([home, path]) != home:
+        return None
+    names = os.path.relpath(path, home).split(os.sep)
+    try:
+        dir_fd = os.open(home, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return None
+    try:
+        for name in names[:-1]:
+            fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW,
+                         dir_fd=dir_fd)
+            os.close(dir_fd)
+            dir_fd = fd
+        # a FIFO would block the open without O_NONBLOCK
+        fd = os.open(names[-1], os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK,
+                     dir_fd=dir_fd)
+    except OSError:
+        return None
+    finally:
+        os.close(dir_fd)
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        os.close(fd)
+        return None
+    return os.fdopen(fd, 'rb')
+
+def goal_file_contents(tree: dict) -> dict:
+    """
+    Returns the file contents spelled out in a goal file system, keyed by the
+    file paths relative to the root directory.
+    """
+    contents = {}
+    stack = [(child, child['name']) for child in tree['children']] \
+        if tree else []
+    while stack:
+        node, path = stack.pop()
+        if node['type'] == 'directory':
+            stack.extend((child, path + '/' + child['name'])
+                         for child in node['children'])
+        elif 'content' in node.get('attributes', {}):
+            contents[path] = node['attributes']['content']
+    return contents
+
+def digest_goal_contents(tree: dict) -> dict:
+    """
+    Replace the file contents spelled out in a goal file system by their
+    digests in place.
+    """
+    stack = [tree] if tree else []
+    while stack:
+        node = stack.pop()
+        if node['type'] == 'directory':
+            stack.extend(node['children'])
+        elif 'content' in node.get('attributes', {}):
+            node['attributes']['content'] = \
+                text_digest(node['attributes']['content'])
+    return tree
 
 
 def dict_2_disk(tree: dict, root_path: pathlib.Path, is_root_dir=False):
@@ -342,21 +805,27 @@ def filesystem_diff(fs1, fs2):
             return True
         return False
 
-    def mark(node, tag):
-        """Mark a node and its descendants with a specific tag."""
-        add_tag(node, tag)
-        if node['type'] == 'directory':
-            for child in node['children']:
-                    mark(child, tag)
-
     def markcopy(node, tag):
         """ Mark a node and its descendants with a specific tag and make a deep
          copy. """
-        node2 = copy.deepcopy(node)
-        add_tag(node2, tag)
-        if node2['type'] == 'directory':
-            for child in node2['children']:
-                mark(child, tag)
+        # Node trees are converted to new dictionaries, which need no copy
+        is_node = not isinstance(node, dict)
+        node2 = node.to_dict() if is_node else dict(node)
+        stack = [node2]
+        while stack:
+            node = stack.pop()
+            if 'tag' in node:
+                node['tag'] = collections.defaultdict(int, node['tag'])
+            if 'attributes' in node and not is_node:
+                node['attributes'] = dict(node['attributes'])
+            add_tag(node, tag)
+            if node.pop('truncated', False):
+                add_tag(node, 'truncated')
+            if node['type'] == 'directory':
+                if not is_node:
+                    node['children'] = [dict(child)
+                                        for child in node['children']]
+                stack.extend(node['children'])
         return node2
 
     # comparing a file to a directory, shouldn't happen
@@ -382,6 +851,9 @@ def filesystem_diff(fs1, fs2):
         if __equal__(child1, child2):
             if child1['type'] == 'file':
                 # comparing two files
+                if not isinstance(child1, dict):
+                    # a Node, the annotated file is a dictionary anyway
+                    child1 = child1.to_dict()
                 tag = attribute_diff(child1['attributes'],
                                      child2['attributes'])
                 if tag_exists(child2, 'to_select'):
@@ -421,6 +893,9 @@ def filesystem_diff(fs1, fs2):
             errors['ch_missing'] += 1
 
     annotated_fs1['children'] = annotated_children
+    if fs1.get('truncated'):
+        # the snapshot does not list every child of the directory
+        errors['truncated'] = 1
     annotated_fs1['tag'] = errors
     if tag_exists(fs2, 'to_select'):
         add_tag(annotated_fs1, 'to_select')
@@ -465,26 +940,32 @@ def annotate_path_selection(fs, task_type, paths):
             if stop_search:
                 break
 
-    # mark unselected files at last
-    def mark_unselected(node):
+    # mark unselected files at last, children before their parents
+    nodes = []
+    stack = [fs]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        if node['type'] == 'directory' and not tag_exists(node, 'missing'):
+            stack.extend(node['children'])
+    incorrect = {}
+    for node in reversed(nodes):
         if not tag_exists(node, 'missing'):
-            incorrect = False
+            node_incorrect = False
             if tag_exists(node, 'to_select') and not tag_exists(node, 'selected'):
                 add_tag(node, 'selected', -1)
-                incorrect = True
+                node_incorrect = True
             if node['type'] == 'directory':
                 for child in node['children']:
-                    if mark_unselected(child):
+                    if incorrect[id(child)]:
                         inc_tag(node, 'ch_incorrect')
-                        incorrect = True
-            return incorrect
+                        node_incorrect = True
+            incorrect[id(node)] = node_incorrect
         else:
-            return True
-
-    mark_unselected(fs)
+            incorrect[id(node)] = True
 
 def annotate_node(fs, path, tag, including_self=True, recursive=False,
-                  file_only=False, **kwargs):
+                  file_only=False, columns=None, **kwargs):
     """
     Annotate specific node(s) in the filesystem with a specific tag. The
     keyword arguments specify the filtering criteria.
@@ -496,6 +977,8 @@ def annotate_node(fs, path, tag, including_self=True, recursive=False,
         including_self: The node itself shall be tagged.
         recursive: Recursively tag the descendants of the node.
         file_only: Tag only files (excluding sub-directories).
+        columns: The columnar.ColumnarSnapshot of the file system, which
+            speeds up attribute range selections.
         **kwargs: Filtering criteria on which node to tag.
 
     """
@@ -538,7 +1021,24 @@ def annotate_node(fs, path, tag, including_self=True, recursive=False,
                 raise ValueError(
                     'Specified path {} does not exist in the file system'.format(path.as_posix()))
 
-    if recursive:
+    if recursive and columns is not None and 'attr' in kwargs:
+        # select the files in range with the columns, then tag the
+        # directories and the selected files
+        if including_self:
+            add_tag(fs, tag)
+        if not file_only:
+            directories = [child for child in fs['children']
+                           if child['type'] == 'directory']
+            while directories:
+                directory = directories.pop()
+                add_tag(directory, tag)
+                directories.extend(child for child in directory['children']
+                                   if child['type'] == 'directory')
+        for file_node in find_files(fs, columns.select_paths(
+                kwargs['attr'], kwargs['attr_lower_bound'],
+                kwargs['attr_higher_bound'])):
+            add_tag(file_node, tag)
+    elif recursive:
         mark(fs, tag, including_self=including_self,
              file_only=file_only, **kwargs)
     else:
@@ -549,6 +1049,50 @@ def annotate_node(fs, path, tag, including_self=True, recursive=False,
         for ancestor in stack:
             inc_tag(ancestor, 'ch_incorrect')
 
+def find_file(fs, relative_path):
+    """
+    Returns the file node at a path relative to the root of a file system, or
+    None.
+    """
+    steps = relative_path.split('/')
+    node = fs
+    for i, step in enumerate(steps):
+        step_type = 'file' if i == len(steps) - 1 else 'directory'
+        for child in node.get('children') or []:
+            if child['name'] == step and child['type'] == step_type:
+                node = child
+                break
+        else:
+            return None
+    return node
+
+def find_files(fs, relative_paths):
+    """
+    Returns the file nodes at the given paths relative to the root of a file
+    system, visiting only the directories on the way.
+    """
+    # group the paths by directory
+    tree = {}
+    for relative_path in relative_paths:
+        steps = relative_path.split('/')
+        branch = tree
+        for step in steps[:-1]:
+            branch = branch.setdefault(('directory', step), {})
+        branch[('file', steps[-1])] = None
+
+    file_nodes = []
+    stack = [(fs, tree)]
+    while stack:
+        node, branch = stack.pop()
+        for child in node['children']:
+            key = (child['type'], child['name'])
+            if key in branch:
+                if child['type'] == 'file':
+                    file_nodes.append(child)
+                else:
+                    stack.append((child, branch[key]))
+    return file_nodes
+
 def contains_error(node):
     return node['tag'] and ('missing' in node['tag'] or
                             'extra' in node['tag'] or
@@ -663,13 +1207,15 @@ def extract_path(input, current_dir=None, is_ls_command=False):
     return path
 
 def filesystem_sort(fs):
-    if fs and fs['type'] == 'directory':
-        for child in fs['children']:
-            filesystem_sort(child)
-        fs['children'] = sorted([c for c in fs['children'] if c['type'] == 'file'],
-                                key=lambda x:x['name']) + \
-                         sorted([c for c in fs['children'] if c['type'] != 'file'],
-                                key=lambda x:x['name'])
+    stack = [fs] if fs else []
+    while stack:
+        node = stack.pop()
+        if node['type'] == 'directory':
+            node['children'] = sorted([c for c in node['children'] if c['type'] == 'file'],
+                                      key=lambda x:x['name']) + \
+                               sorted([c for c in node['children'] if c['type'] != 'file'],
+                                      key=lambda x:x['name'])
+            stack.extend(node['children'])
     return fs
 
 if __name__=="__main__":
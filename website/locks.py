@@ -0,0 +1,78 @@
+"""
+Advisory file locks shared by all processes serving the task interface.
+
+The in-process caches and the verification pool are per process, but the
+study sessions, the task sessions and their containers are shared by every
+WSGI worker process. Operations which must not run twice at the same time for
+the same session, such as provisioning the container of a task session or
+moving a study session to its next task, hold the lock of the session:
+
+    with session_lock(study_session.session_id):
+        ...
+
+The locks are fcntl.flock locks on one file per key in settings.LOCK_DIR, so
+they are released when their holder exits, even if it crashes. Every
+acquisition opens the file anew, which makes the locks exclusive between the
+threads of a process as well. Locks are not reentrant. The time spent
+waiting for a lock is the 'session_lock' stage of the request (see
+timing.py).
+"""
+
+from django.conf import settings
+
+from .timing import span
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import time
+
+
+class LockTimeout(Exception):
+    """The lock could not be acquired before the timeout."""
+    pass
+
+
+def lock_path(key):
+    """Returns the path of the lock file of a key."""
+    lock_dir = getattr(settings, 'LOCK_DIR', 'locks')
+    return os.path.join(lock_dir, 'task_manager_lock_{}'.format(
+        hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+
+@contextlib.contextmanager
+def session_lock(key, timeout=None, poll_interval=0.01):
+    """
+    Hold the advisory lock of a key (e.g. a session ID) in the body of a with
+    statement.
+
+    Args:
+        key: the name of the lock
+        timeout: the maximum time in seconds to wait for the lock, None to
+            wait as long as it takes
+        poll_interval: the time between two attempts if there is a timeout
+    """
+    path = lock_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        with span('session_lock'):
+            if timeout is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise LockTimeout(key)
+                        time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
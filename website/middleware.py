@@ -0,0 +1,65 @@
+"""
+Middleware classes of the task interface server.
+"""
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+
+from . import profiling, timing
+
+import time
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    """
+    Compresses the responses larger than settings.GZIP_MIN_SIZE bytes (if the
+    browser accepts gzip). Smaller responses are not worth the CPU time.
+    """
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < \
+                getattr(settings, 'GZIP_MIN_SIZE', 1024):
+            return response
+        return super(ThresholdGZipMiddleware, self).process_response(
+            request, response)
+
+
+class ServerTimingMiddleware(object):
+    """
+    Times the requests (see timing.py), sends the durations of their stages
+    in the Server-Timing header and adds them to the histograms of their
+    endpoints, which are named after their URL patterns or views.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with timing.timed(None) as timer:
+            response = self.get_response(request)
+            response['Server-Timing'] = timer.server_timing(
+                time.perf_counter() - timer.start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = timing.current_timer()
+        if timer is not None:
+            timer.endpoint = getattr(request.resolver_match, 'url_name',
+                                     None) or view_func.__name__
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiles the requests which ask for it with cProfile and tracemalloc (see
+    profiling.py). It is removed from the middleware chain unless
+    settings.PROFILING is on.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = profiling.profile_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return profiling.profile_request(self.get_response, request, trigger)
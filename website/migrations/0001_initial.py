@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 21:43
+from __future__ import unicode_literals
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.TextField()),
+                ('stdout', models.TextField(default='')),
+                ('action_time', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Container',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('container_id', models.TextField()),
+                ('filesystem_name', models.TextField()),
+                ('port', models.IntegerField()),
+                ('created_at', models.DateTimeField(blank=True, null=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('destroyed_at', models.DateTimeField(blank=True, null=True)),
+                ('phase_durations', models.TextField(default='{}')),
+                ('load_average', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('endpoint', models.TextField()),
+                ('path', models.TextField()),
+                ('task_session_id', models.TextField(blank=True, default='')),
+                ('duration', models.FloatField()),
+                ('trigger', models.TextField()),
+                ('profile', models.BinaryField()),
+                ('function_stats', models.TextField(default='')),
+                ('top_allocations', models.TextField(default='')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Researcher',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.TextField()),
+                ('last_name', models.TextField()),
+                ('email', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Software',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField()),
+                ('url', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudySession',
+            fields=[
+                ('ip_address', models.TextField(default='')),
+                ('session_id', models.TextField(primary_key=True, serialize=False)),
+                ('creation_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('half_session_time_left', models.DurationField(blank=True, null=True)),
+                ('current_task_session_id', models.TextField(default='')),
+                ('total_num_training_tasks', models.PositiveIntegerField(default=2)),
+                ('total_num_tasks', models.PositiveIntegerField(default=16)),
+                ('num_training_tasks_completed', models.PositiveIntegerField(default=0)),
+                ('num_tasks_completed', models.PositiveIntegerField(default=0)),
+                ('status', models.TextField(default='reading_consent')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.PositiveIntegerField(unique=True)),
+                ('type', models.TextField()),
+                ('description', models.TextField()),
+                ('file_attributes', models.TextField()),
+                ('initial_filesystem', models.TextField(default='')),
+                ('initial_filesystem_diff', models.TextField(default='')),
+                ('initial_stdout_diff', models.TextField(default='')),
+                ('goal_filesystem', models.TextField(default='')),
+                ('stdout', models.TextField(default='')),
+                ('duration', models.DurationField()),
+                ('solution', models.TextField(default='')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaskSession',
+            fields=[
+                ('study_session_stage', models.TextField()),
+                ('session_id', models.TextField(primary_key=True, serialize=False)),
+                ('is_training', models.BooleanField(default=False)),
+                ('start_time', models.DateTimeField(blank=True, null=True)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('time_left', models.DurationField(blank=True, null=True)),
+                ('last_resumed_at', models.DateTimeField(blank=True, null=True)),
+                ('accumulated_active_time', models.DurationField(default=datetime.timedelta(0))),
+                ('status', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('access_code', models.TextField(db_index=True)),
+                ('first_name', models.TextField()),
+                ('last_name', models.TextField()),
+                ('group', models.TextField(default='group1')),
+                ('status', models.TextField(default='scheduled')),
+                ('num_sessions_completed', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name', 'last_name'], name='user_name_idx'),
+        ),
+        migrations.AddField(
+            model_name='tasksession',
+            name='container',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, to='website.Container'),
+        ),
+        migrations.AddField(
+            model_name='tasksession',
+            name='study_session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.StudySession'),
+        ),
+        migrations.AddField(
+            model_name='tasksession',
+            name='task',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.Task'),
+        ),
+        migrations.AddField(
+            model_name='studysession',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.User'),
+        ),
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['created_at'], name='request_profile_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='container',
+            index=models.Index(fields=['created_at'], name='container_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='actionhistory',
+            name='task_session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.TaskSession'),
+        ),
+        migrations.AddIndex(
+            model_name='tasksession',
+            index=models.Index(fields=['study_session', 'study_session_stage', 'is_training', 'start_time'], name='task_session_stage_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actionhistory',
+            index=models.Index(fields=['task_session', 'action_time'], name='action_history_time_idx'),
+        ),
+    ]
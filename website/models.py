@@ -8,14 +8,25 @@ python3 manage.py makemigrations website
 python3 manage.py migrate
 """
 
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
+from django.utils.html import format_html
 from django.contrib import admin
 
+from .action_log import ActionLogWriter
 from .constants import *
+from .db import retry_on_busy, retry_transaction_on_busy
+from .diff_patch import diff_versions
+from .locks import session_lock
+from .owners import get_container_owners, forget_container_owners
+from .timing import PhaseTimer
 
 import docker
+import json
 import os
+import pathlib
 import subprocess
 import time
 
@@ -60,16 +71,29 @@ class User(models.Model):
     :member num_completed_sessions: number of study sessions completed by the
         user
     """
-    access_code = models.TextField()
+    access_code = models.TextField(db_index=True)
     first_name = models.TextField()
     last_name = models.TextField()
     group = models.TextField(default='group1')
     status = models.TextField(default='scheduled')
     num_sessions_completed = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # login and access code retrieval by name
+            models.Index(fields=['first_name', 'last_name'],
+                         name='user_name_idx'),
+        ]
+
+    @retry_on_busy
+    def save(self, *args, **kwargs):
+        super(User, self).save(*args, **kwargs)
+
     def inc_num_sessions_completed(self):
-        self.num_sessions_completed += 1
-        self.save()
+        # an atomic update, so that no increment of another process is lost
+        retry_on_busy(User.objects.filter(pk=self.pk).update)(
+            num_sessions_completed=F('num_sessions_completed') + 1)
+        self.refresh_from_db(fields=['num_sessions_completed'])
 
 
 class Task(models.Model):
@@ -84,6 +108,11 @@ class Task(models.Model):
     :member file_attributes: File attributes used in the tasks.
     :member initial_filesystem: JSON representation of the user's starting home
         directory
+    :member initial_filesystem_diff: JSON representation of the annotated
+        difference between the starting home directory and the goal, which is
+        what the user sees when the task starts or the file system is reset
+    :member initial_stdout_diff: JSON representation of the difference between
+        an empty standard output and the goal (if type is 'stdout')
     :member goal_filesystem: JSON representation of the goal directory (if type
         is 'filesystem_change')
     :member stdout: The expected standard output for the task. Empty if task
@@ -92,11 +121,13 @@ class Task(models.Model):
     :member solution (for training purpose): A bash one-liner that solves the
         task (a task usually have more than one solutions).
     """
-    task_id = models.PositiveIntegerField()
+    task_id = models.PositiveIntegerField(unique=True)
     type = models.TextField()
     description = models.TextField()
     file_attributes = models.TextField()
     initial_filesystem = models.TextField(default='')
+    initial_filesystem_diff = models.TextField(default='')
+    initial_stdout_diff = models.TextField(default='')
     goal_filesystem = models.TextField(default='')
     stdout = models.TextField(default='')
     duration = models.DurationField()
@@ -104,6 +135,11 @@ class Task(models.Model):
 
 # --- Container Management --- #
 
+class ContainerAdmin(admin.ModelAdmin):
+    list_display = ('filesystem_name', 'created_at', 'provisioning_time',
+                    'destruction_time', 'load_average')
+
+
 class Container(models.Model):
     """
     Describes information about a running Docker container.
@@ -114,112 +150,202 @@ class Container(models.Model):
         equals to the id of the study session the container is associated with.
     :member port: The host port through which the server in the container can
         be accessed.
+    :member created_at: The time the provisioning of the container started.
+    :member ready_at: The time the container was ready.
+    :member destroyed_at: The time the container was destroyed. None if it
+        has not been destroyed.
+    :member phase_durations: A JSON dictionary of the durations in seconds of
+        the phases of the "create" and "destroy" operations (see
+        create_container and destroy).
+    :member load_average: The 1-minute load average of the host when the
+        provisioning started.
     """
     container_id = models.TextField()
     filesystem_name = models.TextField()
     port = models.IntegerField()
+    created_at = models.DateTimeField(null=True, blank=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    destroyed_at = models.DateTimeField(null=True, blank=True)
+    phase_durations = models.TextField(default='{}')
+    load_average = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the provisioning latency report
+            models.Index(fields=['created_at'], name='container_created_idx'),
+        ]
+
+    @property
+    def website_path(self):
+        # location of the user's copy of the example website on the host
+        return pathlib.Path('/{}/home/website'.format(self.filesystem_name))
+
+    @property
+    def provisioning_time(self):
+        if self.created_at is None or self.ready_at is None:
+            return None
+        return self.ready_at - self.created_at
+
+    @property
+    def destruction_time(self):
+        duration = self.get_phase_durations('destroy').get('total')
+        return timezone.timedelta(seconds=duration) \
+            if duration is not None else None
+
+    def get_phase_durations(self, operation):
+        """
+        Returns the durations of the phases of an operation ("create" or
+        "destroy"), with the total duration as "total".
+        """
+        return json.loads(self.phase_durations).get(operation, {})
+
+    def set_phase_durations(self, operation, phases, total):
+        durations = json.loads(self.phase_durations)
+        durations[operation] = dict(phases.durations, total=total)
+        self.phase_durations = json.dumps(durations)
 
     def destroy(self):
         """Destroys container, filesystem, and database entry."""
+        if self.destroyed_at is not None:
+            # already destroyed, e.g. when the server shut down (see
+            # serving.release_containers); the recorded phases are kept
+            return
+        phases = PhaseTimer('container_phase_seconds', 'destroy')
 
         # Destroy Docker container
-        subprocess.run(['docker', 'rm', '-f', self.container_id])
+        with phases.phase('docker_rm'):
+            subprocess.run(['docker', 'rm', '-f', self.container_id])
+        forget_container_owners(self.container_id)
         # Destroy filesystem
-        subprocess.run(['/bin/bash', 'delete_filesystem.bash',
-                        self.filesystem_name])
+        with phases.phase('delete_filesystem'):
+            subprocess.run(['/bin/bash', 'delete_filesystem.bash',
+                            self.filesystem_name])
         # Delete table entry
         # self.delete()
 
+        self.destroyed_at = timezone.now()
+        self.set_phase_durations('destroy', phases, phases.finish())
+        self.save(update_fields=['destroyed_at', 'phase_durations'])
+
+def prepare_task_filesystem(task, filesystem_vfs_path):
+    """
+    Change the file parameters of a freshly copied example website according
+    to the task specification if necessary.
+
+    :param filesystem_vfs_path: location of the copy of the example website,
+        ending with a slash.
+    """
+    if task.task_id == 7:
+        os.utime(filesystem_vfs_path + 'css/bootstrap3/bootstrap-glyphicons.css',
+                 (1454065722, 1454065722))
+        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.eot',
+                 (1454065722, 1454065722))
+        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.otf',
+                 (1454065722, 1454065722))
+        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.svg',
+                 (1454065722, 1454065722))
+        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.ttf',
+                 (1454065722, 1454065722))
+    elif task.task_id == 8:
+        os.utime(filesystem_vfs_path + 'content/labs/2013/10.md',
+                 (1454065722, 1454065722))
+        os.utime(filesystem_vfs_path + 'content/labs/2013/12.md',
+                 (1454065722, 1454065722))
+
 def create_container(filesystem_name, task):
     """
     Creates a container whose filesystem is located at /{filesystem_name}/home
     on the host. The contents of filesystem are written to
     /{filesystem_name}/home.
+
+    The phases of the provisioning are timed and saved with the container.
     """
+    created_at = timezone.now()
+    load_average = os.getloadavg()[0]
+    phases = PhaseTimer('container_phase_seconds', 'create')
 
     # Make virtual filesystem
-    subprocess.run(['/bin/bash', 'make_filesystem.bash', filesystem_name, HOME])
+    with phases.phase('make_filesystem'):
+        subprocess.run(['/bin/bash', 'make_filesystem.bash', filesystem_name,
+                        HOME])
 
     # Create Docker container
     # NOTE: the created container does not run yet
-    client = docker.Client(base_url='unix://var/run/docker.sock')
-    docker_container = client.create_container(
-        image='backend_container',
-        ports=[10411],
-        volumes=['/home/' + USER_NAME],
-        host_config=client.create_host_config(
-            binds={
-                '/{}/home'.format(filesystem_name): {
-                    'bind': '/home/' + USER_NAME,
-                    'mode': 'rw',
+    with phases.phase('docker_create'):
+        client = docker.Client(base_url='unix://var/run/docker.sock')
+        docker_container = client.create_container(
+            image='backend_container',
+            ports=[10411],
+            volumes=['/home/' + USER_NAME],
+            host_config=client.create_host_config(
+                binds={
+                    '/{}/home'.format(filesystem_name): {
+                        'bind': '/home/' + USER_NAME,
+                        'mode': 'rw',
+                    },
                 },
-            },
-            port_bindings={10411: ('0.0.0.0',)},
-        ),
-    )
+                port_bindings={10411: ('0.0.0.0',)},
+            ),
+        )
 
     # Get ID of created container
     container_id = docker_container['Id']
 
     # Start container and write standard output and error to a log file
-    subprocess.run(
-        args='docker start -a {} >container_{}.log 2>&1 &'
-            .format(container_id, container_id),
-        shell=True,
-        executable='/bin/bash',
-    )
+    with phases.phase('docker_start'):
+        subprocess.run(
+            args='docker start -a {} >container_{}.log 2>&1 &'
+                .format(container_id, container_id),
+            shell=True,
+            executable='/bin/bash',
+        )
 
     # Wait a bit for container's to start
-    time.sleep(1)
+    with phases.phase('wait_for_start'):
+        time.sleep(1)
 
     # Set the permissions of the user's home directory.
     #
     # I tried to do this with the docker-py API and I couldn't get it to work,
     # so I'm just running a shell command.
-    subprocess.call(['docker', 'exec', '-u', 'root', container_id,
-        'chown', '-R', '{}:{}'.format(USER_NAME, USER_NAME),
-        '/home/{}'.format(USER_NAME)])
+    with phases.phase('chown'):
+        subprocess.call(['docker', 'exec', '-u', 'root', container_id,
+            'chown', '-R', '{}:{}'.format(USER_NAME, USER_NAME),
+            '/home/{}'.format(USER_NAME)])
 
     # Change file parameters according to the task specification if necessary
-    if task.task_id == 3:
-        # TODO: to read the owner of a file correctly, the disk_2_dict function
-        # needs to read from the docker container instead of the virtual file
-        # system
-        subprocess.call(['docker', 'exec', '-u', 'root', container_id,
-                         'adduser', USER_NAME, 'sudo'])
-        # subprocess.call(['docker', 'exec', '-u', 'root', container_id, 'bash',
-        # '-c', '\'echo "me ALL = (ALL) NOPASSWD: ALL" > /etc/sudoers\''])
-        subprocess.call(['docker', 'exec', '-u', 'root', container_id,
-                         'useradd', '-m', USER2_NAME])
-    elif task.task_id == 7:
-        filesystem_vfs_path = '/{}/home/website/'.format(filesystem_name)
-        os.utime(filesystem_vfs_path + 'css/bootstrap3/bootstrap-glyphicons.css',
-                 (1454065722, 1454065722))
-        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.eot',
-                 (1454065722, 1454065722))
-        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.otf',
-                 (1454065722, 1454065722))
-        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.svg',
-                 (1454065722, 1454065722))
-        os.utime(filesystem_vfs_path + 'css/fonts/glyphiconshalflings-regular.ttf',
-                 (1454065722, 1454065722))
-    elif task.task_id == 8:
-        filesystem_vfs_path = '/{}/home/website/'.format(filesystem_name)
-        os.utime(filesystem_vfs_path + 'content/labs/2013/10.md',
-                 (1454065722, 1454065722))
-        os.utime(filesystem_vfs_path + 'content/labs/2013/12.md',
-                 (1454065722, 1454065722))
+    with phases.phase('task_setup'):
+        if task.task_id == 3:
+            # the file owners are named after the container's users (see
+            # owners.py), which are read again after the user is added
+            subprocess.call(['docker', 'exec', '-u', 'root', container_id,
+                             'adduser', USER_NAME, 'sudo'])
+            # subprocess.call(['docker', 'exec', '-u', 'root', container_id,
+            # 'bash', '-c',
+            # '\'echo "me ALL = (ALL) NOPASSWD: ALL" > /etc/sudoers\''])
+            subprocess.call(['docker', 'exec', '-u', 'root', container_id,
+                             'useradd', '-m', USER2_NAME])
+            get_container_owners(container_id).invalidate()
+        else:
+            prepare_task_filesystem(task, '/{}/home/website/'.format(
+                filesystem_name))
 
     # Find what port the container was mapped to
-    info = client.inspect_container(container_id)
+    with phases.phase('inspect_container'):
+        info = client.inspect_container(container_id)
     port = int(info['NetworkSettings']['Ports']['10411/tcp'][0]['HostPort'])
 
     # Create container model object
-    container = Container.objects.create(
+    container = Container(
         container_id=container_id,
         filesystem_name=filesystem_name,
         port=port,
+        created_at=created_at,
+        ready_at=timezone.now(),
+        load_average=load_average
     )
+    container.set_phase_durations('create', phases, phases.finish())
+    container.save()
 
     return container
 
@@ -282,13 +408,17 @@ class StudySession(models.Model):
     # standard_output_seen = models.BooleanField(default=False)
     status = models.TextField(default='reading_consent')
 
+    @retry_on_busy
+    def save(self, *args, **kwargs):
+        super(StudySession, self).save(*args, **kwargs)
+
     def close(self, reason_for_close):
         # ignore already closed study sessions
         if self.status == 'running' or self.status == 'paused':
             self.current_task_session_id = ''
             self.close_time = timezone.now()
             self.status = reason_for_close
-            self.save()
+            self.save(update_fields=['current_task_session_id', 'status'])
             self.user.inc_num_sessions_completed()
 
     def closed(self):
@@ -296,34 +426,46 @@ class StudySession(models.Model):
 
     # --- Task manager --- #
 
+    # The counters are updated with atomic UPDATE statements and the other
+    # methods only save the fields they change, so that no process overwrites
+    # the updates of another one with stale values.
+
+    def _update(self, **kwargs):
+        """Update fields in the database and reload them."""
+        retry_on_busy(StudySession.objects.filter(pk=self.pk).update)(
+            **kwargs)
+        self.refresh_from_db(fields=list(kwargs))
+
     def inc_num_tasks_completed(self):
         if self.half_session_time_left <= timezone.timedelta(seconds=0):
             # force stage change
             if self.stage == 'I':
-                self.num_tasks_completed = self.switch_point
+                self._update(num_tasks_completed=self.switch_point)
             elif self.stage == 'II':
-                self.num_tasks_completed = self.total_num_tasks
+                self._update(num_tasks_completed=self.total_num_tasks)
         else:
-            self.num_tasks_completed += 1
-        self.save()
+            self._update(num_tasks_completed=F('num_tasks_completed') + 1)
 
     def inc_num_training_tasks_completed(self):
-        self.num_training_tasks_completed += 1
-        self.save()
+        self._update(num_training_tasks_completed=F(
+            'num_training_tasks_completed') + 1)
 
     def set_ip_address(self, ip_address):
         self.ip_address = ip_address
-        self.save()
+        self.save(update_fields=['ip_address'])
 
     def start_half_session_timer(self):
         self.half_session_time_left = timezone.timedelta(
             minutes=half_session_length)
-        self.save()
+        self.save(update_fields=['half_session_time_left'])
 
     def update_half_session_time_left(self, time_spent):
+        # not an UPDATE statement since SQLite cannot subtract durations, the
+        # caller holds the lock of the study session (see go_to_next_task)
+        self.refresh_from_db(fields=['half_session_time_left'])
         self.half_session_time_left -= time_spent
+        self.save(update_fields=['half_session_time_left'])
         print('half_session_time_left: {}'.format(self.half_session_time_left))
-        self.save()
 
     def update_current_task_session_id(self):
         """
@@ -341,7 +483,7 @@ class StudySession(models.Model):
             new_task_session_id = self.session_id + \
                 '-task-{}'.format(self.num_tasks_completed + 1)
         self.current_task_session_id = new_task_session_id
-        self.save()
+        self.save(update_fields=['current_task_session_id'])
         return new_task_session_id
 
     def stage_change(self):
@@ -492,6 +634,12 @@ class TaskSession(models.Model):
         is being undertaken.
     :member time_left: Time left in this task session. This is used for
         redirecting the user when a half session timed out.
+    :member last_resumed_at: The time the task session was last resumed. None
+        if the task session has never been resumed, in which case the start
+        time is used.
+    :member accumulated_active_time: Time the user has been actively working
+        on the task, summed over every interval that has ended so far (by a
+        pause or by closing the task session).
 
     :member status: The state of the task result.
         - 'running':     The user has started the task, but the task has not
@@ -511,47 +659,96 @@ class TaskSession(models.Model):
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
     time_left = models.DurationField(null=True, blank=True)
+    last_resumed_at = models.DateTimeField(null=True, blank=True)
+    accumulated_active_time = models.DurationField(
+        default=timezone.timedelta(seconds=0))
 
     status = models.TextField()
 
+    class Meta:
+        indexes = [
+            # the task sessions of a study session stage in the order they
+            # were taken (reports and statistics)
+            models.Index(fields=['study_session', 'study_session_stage',
+                                 'is_training', 'start_time'],
+                         name='task_session_stage_idx'),
+        ]
+
+    @retry_on_busy
+    def save(self, *args, **kwargs):
+        super(TaskSession, self).save(*args, **kwargs)
+
     def close(self, reason_for_close):
+        # write the queued actions before the container is destroyed, whatever
+        # the reason for closing
+        action_log.flush()
+        self._close(reason_for_close, timezone.now())
+        diff_versions.forget(self.session_id)
+        self.container.destroy()
+
+    @retry_transaction_on_busy
+    def _close(self, reason_for_close, end_time):
         self.status = reason_for_close
-        self.end_time = timezone.now()
+        self.end_time = end_time
         if not self.is_training:
             time_spent = self.get_time_spent_since_last_resume(self.end_time)
             self.update_time_left(time_spent)
-            self.study_session.update_half_session_time_left(time_spent)
-        self.container.destroy()
+            # go_to_next_task takes the time spent off the study session
+        if reason_for_close == 'passed':
+            # the task is completed by the last command the user issued (the
+            # queued actions were written by close)
+            last_action = ActionHistory.objects.filter(task_session=self) \
+                .order_by('action_time').last()
+            finish_time = last_action.action_time if last_action \
+                else self.end_time
+        else:
+            finish_time = self.end_time
+        self.accumulated_active_time += \
+            self.get_time_spent_since_last_resume(finish_time)
         self.save()
 
     def pause(self):
         current_time = timezone.now()
-        ActionHistory.objects.create(
+        self._pause(current_time)
+        action_log.log(
             task_session = self,
             action = '__paused__',
             action_time = current_time
         )
+
+    @retry_transaction_on_busy
+    def _pause(self, current_time):
         time_spent_since_last_resume = \
                 self.get_time_spent_since_last_resume(current_time)
         self.time_left -= time_spent_since_last_resume
+        self.accumulated_active_time += time_spent_since_last_resume
         self.status = 'paused'
         self.save()
 
     def resume(self):
-        ActionHistory.objects.create(
+        current_time = timezone.now()
+        self._resume(current_time)
+        action_log.log(
             task_session = self,
             action = '__resumed__',
-            action_time = timezone.now()
+            action_time = current_time
         )
+
+    @retry_transaction_on_busy
+    def _resume(self, current_time):
+        self.last_resumed_at = current_time
         self.status = 'running'
         self.save()
 
     def create_new_container(self):
-        if self.container:
-            # make sure any existing container is destroyed
-            self.destroy_container()
-        self.container = create_container(self.session_id, self.task)
-        self.save()
+        with session_lock(self.session_id):
+            # another process may have replaced the container meanwhile
+            self.refresh_from_db(fields=['container'])
+            if self.container:
+                # make sure any existing container is destroyed
+                self.destroy_container()
+            self.container = create_container(self.session_id, self.task)
+            self.save(update_fields=['container'])
 
     def destroy_container(self):
         self.container.destroy()
@@ -560,17 +757,14 @@ class TaskSession(models.Model):
     def get_action_history(self):
         # the user's action history in the task session ordered from the
         # least recent to the most recent
+        action_log.flush()
         return ActionHistory.objects.filter(task_session=self)\
             .order_by('action_time')
 
     def get_time_spent_since_last_resume(self, current_time):
         # compute time spent since last time update
-        if ActionHistory.objects.filter(task_session=self,
-                                        action='__resumed__').exists():
-            most_recent_resume = self.get_action_history()\
-                .filter(action='__resumed__').order_by('action_time')\
-                .reverse()[0]
-            return current_time - most_recent_resume.action_time
+        if self.last_resumed_at is not None:
+            return current_time - self.last_resumed_at
         else:
             return current_time - self.start_time
 
@@ -588,22 +782,9 @@ class TaskSession(models.Model):
 
     @property
     def time_spent(self):
-        time_spent = timezone.timedelta(seconds=0)
-        last_resumed_time = self.start_time
-        action_history = self.get_action_history()
-        for action in action_history:
-            if action.action == '__paused__':
-                time_spent += (action.action_time - last_resumed_time)
-            if action.action == '__resumed__':
-                last_resumed_time = action.action_time
-        if self.status == 'passed':
-            # get the timestamp of the command that solves the task
-            assert(action_history)
-            last_action = action_history[len(action_history)-1]
-            time_spent += last_action.action_time - last_resumed_time
-        else:
-            time_spent += self.end_time - last_resumed_time
-        return time_spent
+        # the active time is folded into accumulated_active_time when the task
+        # session is closed, see replay_task_session_timing for its definition
+        return self.accumulated_active_time
 
     @property
     def time_spent_converted(self):
@@ -628,6 +809,41 @@ class TaskSession(models.Model):
             .format(self.status))
 
 
+def replay_task_session_timing(task_session, action_history):
+    """
+    Recompute the cached timing fields of a task session from its action
+    history.
+
+    Args:
+        task_session: the task session whose timing is to be recomputed
+        action_history: the actions of the task session ordered from the least
+            recent to the most recent
+
+    Returns the values of (last_resumed_at, accumulated_active_time). The
+    active time of a task session that is not closed only covers the intervals
+    ended by a pause.
+    """
+    accumulated_active_time = timezone.timedelta(seconds=0)
+    last_resumed_at = None
+    last_resumed_time = task_session.start_time
+    for action in action_history:
+        if action.action == '__paused__':
+            accumulated_active_time += (action.action_time - last_resumed_time)
+        if action.action == '__resumed__':
+            last_resumed_at = action.action_time
+            last_resumed_time = action.action_time
+    if task_session.end_time is not None:
+        if task_session.status == 'passed' and action_history:
+            # get the timestamp of the command that solves the task
+            last_action = action_history[len(action_history)-1]
+            accumulated_active_time += \
+                last_action.action_time - last_resumed_time
+        else:
+            accumulated_active_time += \
+                task_session.end_time - last_resumed_time
+    return last_resumed_at, accumulated_active_time
+
+
 class ActionHistory(models.Model):
     """
     An action history includes the operations done by the user at a specific
@@ -648,6 +864,20 @@ class ActionHistory(models.Model):
     stdout = models.TextField(default='')
     action_time = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # the action history of a task session in chronological order
+            models.Index(fields=['task_session', 'action_time'],
+                         name='action_history_time_idx'),
+        ]
+
+# Actions are queued and written to the database in batches, see action_log.py.
+action_log = ActionLogWriter(
+    ActionHistory,
+    flush_interval=getattr(settings, 'ACTION_LOG_FLUSH_INTERVAL', 0.5),
+    max_batch_size=getattr(settings, 'ACTION_LOG_MAX_BATCH_SIZE', 64)
+)
+
 # --- Peripheral Data --- #
 
 class Researcher(models.Model):
@@ -668,3 +898,54 @@ class Software(models.Model):
     """
     name = models.TextField()
     url = models.TextField()
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'endpoint', 'task_session_id', 'duration',
+                    'trigger', 'download')
+    list_filter = ('endpoint', 'trigger')
+    search_fields = ('task_session_id', 'path')
+    readonly_fields = ('created_at', 'endpoint', 'path', 'task_session_id',
+                       'duration', 'trigger', 'function_stats',
+                       'top_allocations', 'download')
+    exclude = ('profile',)
+
+    def download(self, obj):
+        return format_html('<a href="/request_profile?id={}">{}.prof</a>',
+                           obj.pk, obj.pk)
+
+
+class RequestProfile(models.Model):
+    """
+    A profile of a request, taken by ProfilingMiddleware (see profiling.py).
+
+    :member created_at: The time the request was served.
+    :member endpoint: The name of the URL pattern or view of the request.
+    :member path: The path of the request.
+    :member task_session_id: The task session of the request, empty if none.
+    :member duration: The time spent in the view and the middleware below
+        the profiler, in seconds.
+    :member trigger: What turned the profiler on: 'header', 'cookie' or
+        'sample'.
+    :member profile: The cProfile statistics in the marshal format of
+        pstats, which `python3 -m pstats` and snakeviz read.
+    :member function_stats: The functions with the highest cumulative time,
+        as printed by pstats.
+    :member top_allocations: The source lines which allocated the most memory
+        still held at the end of the request, as printed by tracemalloc.
+    """
+    created_at = models.DateTimeField()
+    endpoint = models.TextField()
+    path = models.TextField()
+    task_session_id = models.TextField(default='', blank=True)
+    duration = models.FloatField()
+    trigger = models.TextField()
+    profile = models.BinaryField()
+    function_stats = models.TextField(default='')
+    top_allocations = models.TextField(default='')
+
+    class Meta:
+        indexes = [
+            # the most recent profiles, for the cap on the number of profiles
+            models.Index(fields=['created_at'], name='request_profile_idx'),
+        ]
@@ -0,0 +1,156 @@
+"""
+Resolution of the user and group names owning the files of a file system.
+
+The home directory of a task session is scanned on the host, but the file
+owners have to be named after the users and groups of the container, whose
+/etc/passwd and /etc/group differ from the host's (task 3 adds a user to the
+container). The name tables of a container are read once and cached; they are
+read again when a file is owned by an unknown user or group, at most every
+reload_interval seconds, or after 'invalidate' is called.
+
+All resolvers implement
+
+    user_name(uid) -> str
+    group_name(gid) -> str
+
+and fall back to the numeric ID for unknown users and groups.
+"""
+
+import grp
+import pwd
+import subprocess
+import threading
+import time
+
+
+def parse_name_table(text):
+    """
+    Returns the ID to name map of the content of an /etc/passwd or /etc/group
+    file.
+    """
+    names = {}
+    for line in text.splitlines():
+        fields = line.split(':')
+        if len(fields) >= 3 and fields[2].isdigit():
+            names.setdefault(int(fields[2]), fields[0])
+    return names
+
+
+class HostOwners(object):
+    """Resolves owners with the user and group databases of the host."""
+    def __init__(self):
+        self._users = {}
+        self._groups = {}
+
+    def user_name(self, uid):
+        try:
+            return self._users[uid]
+        except KeyError:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            return self._users.setdefault(uid, name)
+
+    def group_name(self, gid):
+        try:
+            return self._groups[gid]
+        except KeyError:
+            try:
+                name = grp.getgrgid(gid).gr_name
+            except KeyError:
+                name = str(gid)
+            return self._groups.setdefault(gid, name)
+
+
+class FixedOwners(object):
+    """
+    Names every file after the same user and group, like a home directory
+    after "chown -R".
+    """
+    def __init__(self, user, group):
+        self.user = user
+        self.group = group
+
+    def user_name(self, uid):
+        return self.user
+
+    def group_name(self, gid):
+        return self.group
+
+
+class ContainerOwners(object):
+    """
+    Resolves owners with the /etc/passwd and /etc/group files of a Docker
+    container.
+
+    :member container_id: The ID of the container.
+    :member reload_interval: The minimum time in seconds between two reads of
+        the name tables.
+    """
+    def __init__(self, container_id, reload_interval=1.0):
+        self.container_id = container_id
+        self.reload_interval = reload_interval
+        self._users = None
+        self._groups = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def read_file(self, path):
+        result = subprocess.run(['docker', 'exec', self.container_id, 'cat',
+                                 path], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        return result.stdout.decode('utf-8', errors='ignore')
+
+    def load(self):
+        users = parse_name_table(self.read_file('/etc/passwd'))
+        groups = parse_name_table(self.read_file('/etc/group'))
+        with self._lock:
+            self._users = users
+            self._groups = groups
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Read the name tables again on the next lookup."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _lookup(self, table, i):
+        with self._lock:
+            loaded_at = self._loaded_at
+            names = self._users if table == 'users' else self._groups
+        if loaded_at is None or (i not in names and time.monotonic() -
+                                 loaded_at >= self.reload_interval):
+            self.load()
+            with self._lock:
+                names = self._users if table == 'users' else self._groups
+        return names.get(i, str(i))
+
+    def user_name(self, uid):
+        return self._lookup('users', uid)
+
+    def group_name(self, gid):
+        return self._lookup('groups', gid)
+
+
+host_owners = HostOwners()
+
+_container_owners = {}
+_container_owners_lock = threading.Lock()
+
+
+def get_container_owners(container_id):
+    """Returns the cached resolver of a container."""
+    with _container_owners_lock:
+        try:
+            return _container_owners[container_id]
+        except KeyError:
+            owners = _container_owners[container_id] = \
+                ContainerOwners(container_id)
+            return owners
+
+
+def forget_container_owners(container_id):
+    """Drop the resolver of a destroyed container."""
+    with _container_owners_lock:
+        _container_owners.pop(container_id, None)
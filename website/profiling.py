@@ -0,0 +1,124 @@
+"""
+Opt-in profiling of single requests.
+
+When settings.PROFILING is on, ProfilingMiddleware (see middleware.py) runs
+the view of a request under cProfile and tracemalloc if:
+    - the request has the X-Profile-Request header set to
+      settings.PROFILING_HEADER_TOKEN ('header')
+    - the request has the "profile" cookie set to 1 and comes from a logged in
+      staff member ('cookie')
+    - the request is picked at random, with the probability
+      settings.PROFILING_SAMPLE_RATE ('sample')
+
+The profile and the top allocations are saved as a RequestProfile, keyed by
+the task session and the endpoint of the request, and listed in the admin,
+from which the profiles can be downloaded. Only the most recent
+settings.PROFILING_MAX_PROFILES profiles are kept.
+
+Since tracemalloc traces the whole process, one request is profiled at a time;
+requests arriving while another one is profiled are served as usual. When
+settings.PROFILING is off, the middleware is removed from the middleware chain
+and costs nothing.
+"""
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import RequestProfile
+
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+
+PROFILE_HEADER = 'HTTP_X_PROFILE_REQUEST'
+PROFILE_COOKIE = 'profile'
+
+_profiling_lock = threading.Lock()
+
+
+def profile_trigger(request):
+    """
+    Returns what asks for the request to be profiled ('header', 'cookie' or
+    'sample'), or None if it is not profiled.
+    """
+    token = getattr(settings, 'PROFILING_HEADER_TOKEN', '')
+    if token and request.META.get(PROFILE_HEADER) == token:
+        return 'header'
+    if request.COOKIES.get(PROFILE_COOKIE) == '1':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return 'cookie'
+    if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0):
+        return 'sample'
+    return None
+
+
+def profile_request(get_response, request, trigger):
+    """
+    Serve a request under the profilers and save its profile. The request is
+    served without them if another request is being profiled.
+    """
+    if not _profiling_lock.acquire(blocking=False):
+        return get_response(request)
+    try:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.clear_traces()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+        save_profile(request, trigger, duration, profiler, snapshot)
+        return response
+    finally:
+        _profiling_lock.release()
+
+
+def save_profile(request, trigger, duration, profiler, snapshot):
+    """Save a RequestProfile and drop the oldest ones above the cap."""
+    profiler.create_stats()
+    # pstats.Stats takes the statistics of the profiler
+    profile = marshal.dumps(profiler.stats)
+    function_stats = io.StringIO()
+    pstats.Stats(profiler, stream=function_stats) \
+        .sort_stats('cumulative').print_stats(40)
+    top_allocations = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ]).statistics('lineno')
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is not None:
+        endpoint = resolver_match.url_name or resolver_match.func.__name__
+    else:
+        endpoint = ''
+
+    RequestProfile.objects.create(
+        created_at=timezone.now(),
+        endpoint=endpoint,
+        path=request.path,
+        task_session_id=request.COOKIES.get('task_session_id', ''),
+        duration=duration,
+        trigger=trigger,
+        profile=profile,
+        function_stats=function_stats.getvalue(),
+        top_allocations='\n'.join(
+            str(statistic) for statistic in top_allocations[
+                :getattr(settings, 'PROFILING_TOP_ALLOCATIONS', 20)]))
+
+    max_profiles = getattr(settings, 'PROFILING_MAX_PROFILES', 100)
+    expired = RequestProfile.objects.order_by('-created_at') \
+        .values_list('pk', flat=True)[max_profiles:]
+    RequestProfile.objects.filter(pk__in=list(expired)).delete()
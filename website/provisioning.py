@@ -0,0 +1,101 @@
+"""
+Provisioning latency report of the containers.
+
+create_container and Container.destroy save the durations of their phases
+with every container (see models.py). /container_report groups the containers
+by the period in which they were provisioned and shows, for every period, the
+quantiles of the provisioning latency, the mean duration of every phase and
+the mean load average of the host. A period is flagged as:
+    - a regression if its median latency exceeds the median latency of the
+      containers provisioned before it by more than a factor
+    - saturated if the mean load average of the host exceeded its number of
+      CPUs, in which case the containers were competing for the CPUs
+"""
+
+from django.utils import timezone
+
+import collections
+import math
+import os
+
+CREATE_PHASES = ['make_filesystem', 'docker_create', 'docker_start',
+                 'wait_for_start', 'chown', 'task_setup', 'inspect_container']
+DESTROY_PHASES = ['docker_rm', 'delete_filesystem']
+
+
+def percentile(values, q):
+    """Returns the q-quantile of sorted values (nearest rank)."""
+    if not values:
+        return None
+    return values[max(0, int(math.ceil(q * len(values))) - 1)]
+
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def period_start(time, period):
+    """Returns the start of the period of a given length containing a time."""
+    seconds = int(period.total_seconds())
+    timestamp = int(time.timestamp())
+    return timezone.datetime.fromtimestamp(timestamp - timestamp % seconds,
+                                           tz=time.tzinfo)
+
+
+def provisioning_report(containers, period=timezone.timedelta(hours=1),
+                        regression_factor=1.5, num_cpus=None):
+    """
+    Returns the rows of the report, from the oldest period to the most recent
+    one, as dictionaries. The durations are in seconds.
+
+    Args:
+        containers: the Container objects, the ones which were not timed are
+            skipped
+        period: the length of a period
+        regression_factor: the ratio of the median latency of a period to the
+            median latency of the earlier containers above which the period
+            is flagged as a regression
+        num_cpus: the number of CPUs of the host, os.cpu_count() by default
+    """
+    num_cpus = num_cpus or os.cpu_count()
+    periods = collections.OrderedDict()
+    for container in sorted(
+            (c for c in containers if c.provisioning_time is not None),
+            key=lambda c: c.created_at):
+        periods.setdefault(period_start(container.created_at, period), []) \
+            .append(container)
+
+    rows = []
+    earlier_latencies = []
+    for start, period_containers in periods.items():
+        latencies = sorted(c.provisioning_time.total_seconds()
+                           for c in period_containers)
+        create_durations = [c.get_phase_durations('create')
+                            for c in period_containers]
+        destroy_durations = [c.get_phase_durations('destroy')
+                             for c in period_containers]
+        load_averages = [c.load_average for c in period_containers
+                         if c.load_average is not None]
+        baseline = percentile(sorted(earlier_latencies), 0.5)
+        row = {
+            'start': start,
+            'count': len(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'max': latencies[-1],
+            'baseline': baseline,
+            'create_phases': [
+                mean([d[phase] for d in create_durations if phase in d])
+                for phase in CREATE_PHASES],
+            'destroy_phases': [
+                mean([d[phase] for d in destroy_durations if phase in d])
+                for phase in DESTROY_PHASES],
+            'load_average': mean(load_averages),
+        }
+        row['regression'] = baseline is not None and \
+            row['p50'] > regression_factor * baseline
+        row['saturated'] = row['load_average'] is not None and \
+            row['load_average'] > num_cpus
+        rows.append(row)
+        earlier_latencies.extend(latencies)
+    return rows
@@ -0,0 +1,70 @@
+"""
+Life cycle of the production server processes (see gunicorn.conf.py).
+
+The production server pre-forks its worker processes from a master process
+which has loaded the application:
+    - before forking, `preload` parses the task catalog, so that the workers
+      share the cached task definitions copy-on-write instead of each parsing
+      them on its first requests
+    - when a worker exits, `worker_exit` writes the actions it still holds in
+      memory to the database
+    - when the server shuts down, `release_containers` destroys the containers
+      of the running and paused task sessions, which would otherwise keep
+      running without a server; resume_task_session gives the participants
+      new ones when they come back
+"""
+
+from django.db import connections
+
+from .locks import session_lock
+from .models import Task, TaskSession, action_log
+from . import task_catalog
+
+import gc
+import time
+
+
+def preload():
+    """Warm up the in-process caches in the master process."""
+    start = time.time()
+    num_tasks = task_catalog.preload(Task.objects.all())
+    # the workers must not share the database connection of the master
+    connections.close_all()
+    if hasattr(gc, 'freeze'):
+        # keep the preloaded objects out of the garbage collections of the
+        # workers, which would copy the pages holding them
+        gc.collect()
+        gc.freeze()
+    print('Preloaded {} tasks in {:.2f}s'.format(num_tasks,
+                                                 time.time() - start))
+
+
+def worker_exit():
+    """Flush the state of a worker process which is exiting."""
+    try:
+        action_log.flush()
+    finally:
+        connections.close_all()
+
+
+def release_containers():
+    """
+    Destroy the containers of the task sessions which are still running or
+    paused. Returns the number of containers destroyed.
+    """
+    num_containers = 0
+    task_sessions = TaskSession.objects.filter(
+        status__in=['running', 'paused'], container__isnull=False,
+        container__destroyed_at__isnull=True) \
+        .select_related('container')
+    for task_session in task_sessions:
+        with session_lock(task_session.session_id):
+            try:
+                task_session.container.destroy()
+                num_containers += 1
+            except Exception as err:
+                print('Failed to destroy the container of {}: {}'.format(
+                    task_session.session_id, err))
+    connections.close_all()
+    print('Destroyed {} containers'.format(num_containers))
+    return num_containers
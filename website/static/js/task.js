@@ -24,6 +24,17 @@ $(document).ready(function () {
     var is_second_training = false;
     var task_time_out;
 
+    // the file system diff last received from the server and its version,
+    // the server sends patches against this version
+    var fs_diff = null;
+    var fs_diff_version = null;
+
+    // the verification jobs of the commands whose results are still to come,
+    // and the ID of the last job whose result was handled
+    var num_pending_jobs = 0;
+    var last_job_id = 0;
+    var polling = false;
+
     // create terminal object
     var term, protocol, socketURL, socket, pid, charWidth, charHeight;
     var terminalContainer = document.getElementById('bash-terminal');
@@ -31,7 +42,7 @@ $(document).ready(function () {
     create_new_terminal();
 
     // connect xterm.js terminal to the study session's container
-    $.get(`/get_additional_task_info`, function(data) {
+    $.get(`/get_additional_task_info`, {diff_encoding: 'compact', diff_mode: 'summary'}, function(data) {
         status = data.filesystem_status;
         if (status != "FILE_SYSTEM_WRITTEN_TO_DISK") {
             // TODO: a file system error is likely to be caused by a
@@ -44,7 +55,7 @@ $(document).ready(function () {
 
         set_websocket(container_port);
 
-        refresh_vis(data);
+        update_filesystem_diff(data, refresh_vis);
 
         // check if stage change & training information needs to be displayed
         if (data.status == 'ENTERING_STAGE_I') { 
@@ -67,7 +78,7 @@ $(document).ready(function () {
             socket.close();
             create_new_terminal();
             // reset file system
-            $.get(`/reset_file_system`, function(data){
+            $.get(`/reset_file_system`, {diff_encoding: 'compact', diff_mode: 'summary'}, function(data){
                 status = data.filesystem_status;
                 if (status == 'FILE_SYSTEM_ERROR') {
                     // TODO: a file system error is likely to be caused by a
@@ -79,7 +90,7 @@ $(document).ready(function () {
                 console.log(data.container_port);
                 // open websocket connection to the new container
                 set_websocket(data.container_port);
-                refresh_vis(data);
+                update_filesystem_diff(data, refresh_vis);
             })
         });
 
@@ -146,21 +157,18 @@ $(document).ready(function () {
                     // executes a command in the terminal
                     if (stdout.match(/(.|\n)*\@[0-9a-z]{12}\:[^\n]*\$ $/)) {
                         if (stdout.split('\n').length > 1) {
-                            $.post(`/on_command_execution`, {stdout: stdout},
+                            $.post(`/on_command_execution`, {
+                                    stdout: stdout,
+                                    filesystem_diff_version: fs_diff_version,
+                                    diff_encoding: 'compact',
+                                    diff_mode: 'summary'
+                                },
                                 function(data) {
-                                    console.log(data.status);
-                                    refresh_vis(data);
-                                    if (data.status == 'TASK_COMPLETED') {
-                                        clearTimeout(task_time_out);
-                                        if (is_training) {
-                                            setTimeout(function() {
-                                                show_training_completion_dialog(data);
-                                            }, 300);
-                                        } else {
-                                            setTimeout(function() {
-                                                show_task_completion_dialog();
-                                            }, 300);
-                                        }
+                                    if (data.status == 'VERIFICATION_QUEUED') {
+                                        num_pending_jobs++;
+                                        poll_verification_results();
+                                    } else {
+                                        on_verification_result(data);
                                     }
                                 }
                             );
@@ -183,6 +191,52 @@ $(document).ready(function () {
         }
     }
 
+    // fetch the results of the queued verification jobs, in order, until
+    // every command has been verified
+    function poll_verification_results() {
+        if (polling || num_pending_jobs <= 0) {
+            return;
+        }
+        polling = true;
+        $.get(`/get_verification_results`, {after: last_job_id}, function(data) {
+            polling = false;
+            if (data.status != 'SUCCESS') {
+                num_pending_jobs = 0;
+                return;
+            }
+            if (data.results.length == 0 && !data.pending) {
+                // the results are lost (e.g. the server restarted)
+                num_pending_jobs = 0;
+            }
+            data.results.forEach(function(result) {
+                last_job_id = result.job_id;
+                num_pending_jobs--;
+                on_verification_result(result);
+            });
+            poll_verification_results();
+        }).fail(function() {
+            polling = false;
+            setTimeout(poll_verification_results, 1000);
+        });
+    }
+
+    function on_verification_result(data) {
+        console.log(data.status);
+        update_filesystem_diff(data, refresh_vis);
+        if (data.status == 'TASK_COMPLETED') {
+            clearTimeout(task_time_out);
+            if (is_training) {
+                setTimeout(function() {
+                    show_training_completion_dialog(data);
+                }, 300);
+            } else {
+                setTimeout(function() {
+                    show_task_completion_dialog();
+                }, 300);
+            }
+        }
+    }
+
     function create_new_terminal() {
         term = new Terminal({
             cursorBlink: true
@@ -205,10 +259,75 @@ $(document).ready(function () {
 
     /* --- Visual Feedbacks --- */
 
+    // bring the local copy of the file system diff up to date with a server
+    // response, then call back with the response whose filesystem_diff
+    // field holds the complete diff
+    function update_filesystem_diff(data, callback) {
+        if (data.hasOwnProperty('filesystem_diff_compact')) {
+            data.filesystem_diff = decode_compact_fs_diff(data.filesystem_diff_compact);
+        }
+        if (data.hasOwnProperty('filesystem_diff')) {
+            fs_diff = data.filesystem_diff;
+            fs_diff_version = data.filesystem_diff_version;
+            callback(data);
+        } else if (data.filesystem_diff_unchanged
+                   && data.filesystem_diff_version == fs_diff_version) {
+            data.filesystem_diff = fs_diff;
+            callback(data);
+        } else if (data.hasOwnProperty('filesystem_diff_patch')
+                   && data.filesystem_diff_base_version == fs_diff_version) {
+            apply_fs_diff_patch(fs_diff, data.filesystem_diff_patch);
+            fs_diff_version = data.filesystem_diff_version;
+            data.filesystem_diff = fs_diff;
+            callback(data);
+        } else {
+            // the versions disagree (e.g. responses arrived out of order),
+            // request the complete diff
+            $.get(`/get_filesystem_diff`, {diff_encoding: 'compact'}, function(full_data) {
+                if (full_data.status != 'SUCCESS') {
+                    // the server lost the diff, start over from the task
+                    // session's current state
+                    window.location.reload();
+                    return;
+                }
+                fs_diff = decode_compact_fs_diff(full_data.filesystem_diff_compact);
+                fs_diff_version = full_data.filesystem_diff_version;
+                data.filesystem_diff = fs_diff;
+                delete data.filesystem_diff_unchanged;
+                callback(data);
+            });
+        }
+    }
+
+    // fetch a directory the server left out of a summarized diff
+    function expand_subtree(key, callback) {
+        $.get(`/get_filesystem_subtree`, {
+                key: key,
+                filesystem_diff_version: fs_diff_version,
+                diff_encoding: 'compact'
+            }, function(data) {
+                if (data.status == 'FILE_SYSTEM_DIFF_DOES_NOT_EXIST') {
+                    // the server lost the diff, start over from the task
+                    // session's current state
+                    window.location.reload();
+                } else if (data.status == 'SUCCESS'
+                           && data.filesystem_diff_version == fs_diff_version) {
+                    callback(decode_compact_fs_diff(data.filesystem_subtree_compact));
+                }
+                // otherwise the subtree is dropped, the diff changed in the
+                // meantime
+            });
+    }
+
     function refresh_vis(data) {
 
-        // update treevis
-        build_fs_tree_vis(data.filesystem_diff, "#current-tree-vis");
+        // update treevis, the visualization modifies the nodes so it is given
+        // a copy of the diff
+        if (!data.filesystem_diff_unchanged) {
+            build_fs_tree_vis(JSON.parse(JSON.stringify(data.filesystem_diff)),
+                              "#current-tree-vis", expand_subtree,
+                              show_file_content_dialog);
+        }
 
         // search in the tree for data exists a tag if val is null/ or value equals to val
         function exists_somewhere_in_tree(data, tag, val) {
@@ -386,6 +505,25 @@ $(document).ready(function () {
         });
     }
 
+    function show_file_content_dialog(path) {
+        // show the beginning of a file next to its goal content
+        $.get(`/get_file_content`, {path: path}, function(data) {
+            if (data.status != 'SUCCESS')
+                return;
+            var message = $('<div></div>');
+            message.append($('<div style="font-weight: bold;"></div>').text('Your file'));
+            message.append($('<pre></pre>').text(data.content));
+            if (data.goal_content != null) {
+                message.append($('<div style="font-weight: bold;"></div>').text('Goal'));
+                message.append($('<pre></pre>').text(data.goal_content));
+            }
+            BootstrapDialog.show({
+                title: path,
+                message: message
+            });
+        });
+    }
+
     function show_times_up_dialog() {
         // prompt the user that they have to move on to the next task
          BootstrapDialog.show({
@@ -69,7 +69,12 @@ function build_stdout_vis(data, div_id) {
 
 }
 
-function build_fs_tree_vis(data, div_id) {
+// expand_subtree(key, callback) is optional; it is called with the key of a
+// directory collapsed by the server (see website/diff_summary.py) when the
+// directory is expanded, and calls back with the complete directory.
+// view_content(path) is optional; it is called with the path of a file
+// relative to the root when a file whose content is tracked is clicked.
+function build_fs_tree_vis(data, div_id, expand_subtree, view_content) {
 
     var init_time = true;
     var id = 0;
@@ -105,6 +110,20 @@ function build_fs_tree_vis(data, div_id) {
             .style("opacity", 0)
             .style("height", tree.nodeHeight() + "px")
             .on("click", function (d) {
+                if (!init_time && d.collapsed && !d.children && expand_subtree) {
+                    expand_subtree(fs_tree_node_key(d), function(subtree) {
+                        d.children = subtree.children;
+                        d._children = null;
+                        delete d.collapsed;
+                        render(data, d);
+                    });
+                    return;
+                }
+                if (d.type == "file" && view_content && d.attributes
+                    && d.attributes.hasOwnProperty("content")) {
+                    view_content(fs_tree_node_path(d));
+                    return;
+                }
                 toggleChildren(d);
                 render(data, d);
             })
@@ -118,7 +137,7 @@ function build_fs_tree_vis(data, div_id) {
         //add arrows if it is a folder
         entered.append("span").attr("class", function (d) {
             var icon = d.children ? " glyphicon-chevron-down"
-                : d._children ? "glyphicon-chevron-right" : "glyphicon-chevron-right non-visible";
+                : (d._children || d.collapsed) ? "glyphicon-chevron-right" : "glyphicon-chevron-right non-visible";
             return "glyphicon " + icon;
         });
         //add icons for folder for file
@@ -152,6 +171,9 @@ function build_fs_tree_vis(data, div_id) {
                      || d.tag.hasOwnProperty('ch_extra')
                      || d.tag.hasOwnProperty('ch_incorrect'))) {
                     return '*';
+                } else if (d.hasOwnProperty('tag') && d.tag.hasOwnProperty('truncated')) {
+                    // the directory was too large to be scanned completely
+                    return '…';
                 } else {
                     return '';
                 }
@@ -167,6 +189,10 @@ function build_fs_tree_vis(data, div_id) {
                         } else {
                             d_attribute = d.attributes[key];
                         }
+                        if (key == 'content') {
+                            // show the content digests abbreviated
+                            d_attribute = d_attribute.replace(/([0-9a-f]{8})[0-9a-f]{32}/g, "$1");
+                        }
                         str += (key + ': ' + d_attribute);
                     }
                     if (str == '')
@@ -178,10 +204,19 @@ function build_fs_tree_vis(data, div_id) {
                     return '';
                 }
             });
+        entered.append("span").attr("class", 'collapsed');
+        // the number of children left out by the server
+        nodeEls.select("span.collapsed")
+            .html(function (d) {
+                if (!d.collapsed)
+                    return '';
+                return ' (+' + d.collapsed.files + ' files, '
+                    + d.collapsed.directories + ' directories)';
+            });
         //update caret direction
         nodeEls.select("span").attr("class", function (d) {
             var icon = d.children ? " glyphicon-chevron-down"
-                : d._children ? "glyphicon-chevron-right" : "glyphicon-chevron-right non-visible";
+                : (d._children || d.collapsed) ? "glyphicon-chevron-right" : "glyphicon-chevron-right non-visible";
             return "glyphicon " + icon;
         });
         // make the glyphicon smaller, and align cneter
@@ -244,3 +279,94 @@ function build_fs_tree_vis(data, div_id) {
         init_time = false;
     }
 }
+
+// Key of a node in a file system diff, see website/diff_patch.py.
+function fs_diff_node_key(node, parent_key) {
+    var key = (node.type == "directory" ? "d:" : "f:") + node.name;
+    return parent_key == null ? key : parent_key + "/" + key;
+}
+
+// Key of a node laid out by build_fs_tree_vis.
+function fs_tree_node_key(d) {
+    return fs_diff_node_key(d, d.parent ? fs_tree_node_key(d.parent) : null);
+}
+
+// Path of a node laid out by build_fs_tree_vis relative to the root.
+function fs_tree_node_path(d) {
+    if (!d.parent)
+        return "";
+    var parent_path = fs_tree_node_path(d.parent);
+    return parent_path == "" ? d.name : parent_path + "/" + d.name;
+}
+
+// Apply a patch computed by website/diff_patch.py to a file system diff in
+// place.
+function apply_fs_diff_patch(fs_diff, patch) {
+    // index the nodes by key
+    var nodes = {};
+    var parents = {};
+    var stack = [[fs_diff, null]];
+    while (stack.length > 0) {
+        var item = stack.pop();
+        var key = fs_diff_node_key(item[0], item[1]);
+        nodes[key] = item[0];
+        parents[key] = item[1];
+        if (item[0].children) {
+            for (var i = 0; i < item[0].children.length; i ++)
+                stack.push([item[0].children[i], key]);
+        }
+    }
+
+    patch.removed.forEach(function(key) {
+        var siblings = nodes[parents[key]].children;
+        siblings.splice(siblings.indexOf(nodes[key]), 1);
+    });
+    patch.updated.forEach(function(update) {
+        var node = nodes[update.key];
+        for (var field in node) {
+            if (node.hasOwnProperty(field) && field != "children")
+                delete node[field];
+        }
+        for (var field in update.node)
+            node[field] = update.node[field];
+    });
+    patch.inserted.forEach(function(insertion) {
+        nodes[insertion.parent].children.splice(insertion.index, 0,
+                                                insertion.node);
+    });
+    return fs_diff;
+}
+
+// Tag codes of the compact diff encoding, see website/diff_encoding.py.
+var FS_DIFF_TAG_NAMES = ["extra", "missing", "incorrect", "correct",
+    "stdout_missing", "stdout_extra", "ch_extra", "ch_missing", "ch_incorrect",
+    "to_select", "selected", "truncated"];
+
+// Decode a file system diff in the compact encoding of
+// website/diff_encoding.py to the format created by filesystem.py.
+function decode_compact_fs_diff(encoded) {
+    function decode(node) {
+        var decoded = {
+            type: node[0] == 1 ? "directory" : "file",
+            name: encoded.names[node[1]]
+        };
+        if (node[2] != null) {
+            decoded.tag = {};
+            for (var i = 0; i < node[2].length; i += 2)
+                decoded.tag[FS_DIFF_TAG_NAMES[node[2][i]]] = node[2][i + 1];
+        }
+        if (node[0] == 1) {
+            decoded.children = node[3].map(decode);
+            if (node.length > 4)
+                decoded.collapsed = {files: node[4][0], directories: node[4][1]};
+        } else if (node[3] != null) {
+            decoded.attributes = {};
+            node[3].forEach(function(attr) {
+                decoded.attributes[encoded.keys[attr[0]]] =
+                    attr.slice(1).join(":::");
+            });
+        }
+        return decoded;
+    }
+    return encoded.root == null ? null : decode(encoded.root);
+}
@@ -0,0 +1,118 @@
+"""
+In-process cache of the static parts of the task definitions.
+
+Once `load_config` has registered a task, its goal file system, file attributes
+and precomputed initial diffs never change. They are parsed once per process
+and shared by every task session of the task instead of being decoded from the
+Task row on every request.
+
+The cached objects are shared: callers must copy anything they annotate.
+"""
+
+from . import columnar
+from .filesystem import compile_attributes, digest_goal_contents, \
+    goal_file_contents
+
+import json
+import threading
+
+
+class TaskDefinition(object):
+    """
+    The parsed definition of a task.
+
+    :member task_id: The ID of the task.
+    :member type: The type of the task.
+    :member file_attributes: The file attributes used in the task.
+    :member attribute_extractor: The file attributes compiled for
+        'disk_2_dict'.
+    :member goal_filesystem: The file system the user's home directory is
+        compared with, with file contents replaced by their digests. For
+        'stdout' tasks this is the initial file system.
+    :member goal_contents: The file contents spelled out in the goal file
+        system, keyed by their paths relative to the home directory.
+    """
+    def __init__(self, task):
+        self.task_id = task.task_id
+        self.type = task.type
+        self.file_attributes = json.loads(task.file_attributes)
+        self.attribute_extractor = compile_attributes(self.file_attributes)
+        self.goal_contents = {}
+        if task.type == 'stdout':
+            # a snapshot, which already holds digests
+            self.goal_filesystem = json.loads(task.initial_filesystem) \
+                if task.initial_filesystem else None
+        elif task.goal_filesystem:
+            self.goal_filesystem = json.loads(task.goal_filesystem)
+            self.goal_contents = goal_file_contents(self.goal_filesystem)
+            digest_goal_contents(self.goal_filesystem)
+        else:
+            self.goal_filesystem = None
+        self._initial_filesystem_diff = task.initial_filesystem_diff
+        self._goal_columns = None
+        self._initial_stdout_diff = task.initial_stdout_diff
+
+    def get_goal_columns(self):
+        """
+        Returns the columnar.ColumnarSnapshot of the goal file system, or None
+        if NumPy is not installed. The columns are built on the first call.
+        """
+        if self._goal_columns is None and columnar.available() and \
+                self.goal_filesystem is not None:
+            self._goal_columns = columnar.ColumnarSnapshot.from_filesystem(
+                self.goal_filesystem)
+        return self._goal_columns
+
+    def get_initial_filesystem_diff(self):
+        """
+        Returns a fresh copy of the precomputed annotated diff of the initial
+        file system, or None if it has not been precomputed.
+        """
+        if not self._initial_filesystem_diff:
+            return None
+        return json.loads(self._initial_filesystem_diff)
+
+    def get_initial_stdout_diff(self):
+        """
+        Returns a fresh copy of the precomputed standard output diff of the
+        task, or None if it has not been precomputed.
+        """
+        if not self._initial_stdout_diff:
+            return None
+        return json.loads(self._initial_stdout_diff)
+
+
+_catalog = {}
+_catalog_lock = threading.Lock()
+
+
+def get_task_definition(task):
+    """Returns the cached TaskDefinition of a Task object."""
+    try:
+        return _catalog[task.task_id]
+    except KeyError:
+        task_definition = TaskDefinition(task)
+        with _catalog_lock:
+            return _catalog.setdefault(task.task_id, task_definition)
+
+
+def preload(tasks):
+    """
+    Parse the definitions of the given Task objects ahead of the first
+    request. The production server calls it before forking its workers, which
+    then share the cached definitions. Returns the number of tasks loaded.
+
+    The goal columns are left out: no request uses them yet, they are built
+    on first use.
+    """
+    num_tasks = 0
+    for task in tasks:
+        get_task_definition(task)
+        num_tasks += 1
+    return num_tasks
+
+
+def invalidate(task):
+    """Drop the cached definition of a task after its Task row changed."""
+    with _catalog_lock:
+        _catalog.pop(task.task_id, None)
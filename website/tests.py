@@ -5,13 +5,42 @@ This file contains unit tests that are run with
 `python3 manage.py test`.
 """
 
-from django.test import TestCase
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, models
+from django.test import TestCase, TransactionTestCase
+from . import columnar
+from .action_log import ActionLogWriter
+from .db import full_table_scans
+from .diff_cache import DiffCache, snapshot_hash
+from .diff_encoding import encode_compact_diff, decode_compact_diff
+from .diff_summary import count_nodes, summarize_diff, find_node
+from .diff_patch import *
+from .task_catalog import get_task_definition, invalidate, preload
+from . import filesystem
 from .filesystem import *
+from .locks import LockTimeout, session_lock
+from .middleware import ProfilingMiddleware
 from .models import *
+from .owners import ContainerOwners, parse_name_table
+from .provisioning import provisioning_report
+from .timing import Histogram, PhaseTimer, histograms, span, timed
+from .verification import VerificationPool
 
-import pathlib
+from django.utils import timezone
+from unittest import mock, skipUnless
+
+import copy
 import datetime
 import docker
+import json
+import multiprocessing
+import os
+import pathlib
+import pstats
+import tempfile
+import sys
+import threading
+import time
 
 class ModelTestCase(TestCase):
     def test_container(self):
@@ -62,6 +91,147 @@ class FilesystemTestCase(TestCase):
         actual = disk_2_dict(pathlib.Path('website/test_directory_tree'))
         self.assertEqual(actual, expected)
 
+    def test_content_digest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = pathlib.Path(tmp_dir) / 'index.html'
+            with path.open('w') as o_f:
+                o_f.write('<html></html>')
+            actual = disk_2_dict(pathlib.Path(tmp_dir),
+                                 [filesystem._CONTENT])
+            goal = digest_goal_contents({
+                'type': 'directory', 'name': actual['name'], 'children': [
+                    {'type': 'file', 'name': 'index.html',
+                     'attributes': {'content': '<html></html>'}}]})
+            self.assertEqual(actual, goal)
+            self.assertEqual(file_digest(path), text_digest('<html></html>'))
+
+    def test_scan_budget(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            home.mkdir()
+            (home / 'loop').symlink_to(home)
+            path = home
+            for i in range(100):
+                path = path / 'dir'
+                path.mkdir()
+            for i in range(10):
+                (home / 'file{}'.format(i)).touch()
+
+            fs = disk_2_dict(home, max_depth=10)
+            self.assertTrue(fs['truncated'])
+            loop = [child for child in fs['children']
+                    if child['name'] == 'loop'][0]
+            self.assertEqual(loop['children'], [])
+
+            fs = disk_2_dict(home, max_entries=5)
+            self.assertTrue(fs['truncated'])
+            self.assertEqual(len(fs['children']), 5)
+            fs_diff = filesystem_diff(fs, {'type': 'directory',
+                                           'name': 'website', 'children': []})
+            self.assertEqual(fs_diff['tag']['truncated'], 1)
+
+    def test_symlink_to_sibling_directory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            (home / 'css').mkdir(parents=True)
+            (home / 'css' / 'style.css').touch()
+            (home / 'alink').symlink_to('css')
+            for workers in [1, 4]:
+                with mock.patch.object(filesystem,
+                                       'PARALLEL_SCAN_MIN_ENTRIES', 0):
+                    fs = disk_2_dict(home, workers=workers)
+                self.assertNotIn('truncated', fs)
+                for child in fs['children']:
+                    self.assertEqual([grandchild['name'] for grandchild
+                                      in child['children']], ['style.css'])
+
+    def test_compiled_attributes(self):
+        self.assertFalse(compile_attributes([]).needs_stat)
+        self.assertFalse(compile_attributes([filesystem._NAME]).needs_stat)
+        extractor = compile_attributes([filesystem._SIZE, filesystem._MTIME])
+        self.assertIs(compile_attributes([filesystem._SIZE,
+                                          filesystem._MTIME]), extractor)
+        self.assertIs(compile_attributes(extractor), extractor)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            home.mkdir()
+            with (home / 'index.html').open('w') as o_f:
+                o_f.write('<html></html>')
+            fs = disk_2_dict(home, extractor)
+            self.assertEqual(fs['children'][0]['attributes'], {
+                'size': '13', 'mtime': datetime.date.fromtimestamp(
+                    (home / 'index.html').stat().st_mtime).isoformat()})
+            with mock.patch('os.stat', wraps=os.stat) as os_stat:
+                fs = disk_2_dict(home, [filesystem._NAME])
+            self.assertNotIn(mock.call((home / 'index.html').as_posix()),
+                             os_stat.call_args_list)
+            self.assertEqual(fs['children'][0]['attributes'], {})
+
+    def test_parallel_scan(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            for i in range(4):
+                directory = home / 'dir{}'.format(i) / 'sub'
+                directory.mkdir(parents=True)
+                for j in range(5):
+                    (directory / 'file{}'.format(j)).touch()
+                    (directory.parent / 'file{}'.format(j)).touch()
+            (home / 'dir0' / 'loop').symlink_to(home)
+            attrs = [filesystem._SIZE]
+            fs = disk_2_dict(home, attrs)
+            with mock.patch.object(filesystem, 'PARALLEL_SCAN_MIN_ENTRIES', 0):
+                self.assertEqual(disk_2_dict(home, attrs, workers=4), fs)
+                fs = disk_2_dict(home, attrs, max_entries=20, workers=4)
+            self.assertTrue(fs['truncated'])
+            self.assertEqual(count_nodes(fs), 21)
+
+    def test_node_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            (home / 'css').mkdir(parents=True)
+            with (home / 'index.html').open('w') as o_f:
+                o_f.write('<html></html>')
+            (home / 'css' / 'style.css').touch()
+            attrs = [filesystem._SIZE, filesystem._CONTENT]
+            fs = disk_2_dict(home, attrs)
+            nodes = disk_2_dict(home, attrs, as_dict=False)
+            self.assertIsInstance(nodes, Node)
+            self.assertEqual(nodes.to_dict(), fs)
+            self.assertEqual(snapshot_hash(nodes), snapshot_hash(fs))
+            goal = copy.deepcopy(fs)
+            goal['children'][0]['attributes']['size'] = '1'
+            self.assertEqual(filesystem_diff(nodes, goal),
+                             filesystem_diff(fs, goal))
+
+    def test_ranged_reads_stay_in_home(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            home.mkdir()
+            with (home / 'index.html').open('w') as o_f:
+                o_f.write('<html></html>')
+            (home / 'empty').touch()
+            (home / 'passwd').symlink_to('/etc/passwd')
+            (home / 'etc').symlink_to('/etc')
+            (home / 'css').mkdir()
+            (home / 'css' / 'main.css').touch()
+            with open_home_file(home, 'index.html') as f:
+                self.assertEqual(read_file_range(f, 1, 4), (b'html', 13))
+                self.assertEqual(read_file_range(f, 10, 64), (b'ml>', 13))
+                self.assertEqual(read_file_range(f, 20, 64), (b'', 13))
+            with open_home_file(home, 'empty') as f:
+                self.assertEqual(read_file_range(f, 0, 4), (b'', 0))
+            for relative_path in ['../website/index.html', 'css/main.css',
+                                  'css/../index.html']:
+                f = open_home_file(home, relative_path)
+                self.assertIsNotNone(f)
+                f.close()
+            # symbolic links are not followed, even to a path within the
+            # home directory
+            (home / 'style').symlink_to('css')
+            for relative_path in ['..', '/etc/passwd', 'passwd', 'etc/passwd',
+                                  'style/main.css', 'css', '', 'missing']:
+                self.assertIsNone(open_home_file(home, relative_path))
+
 class TaskTestCase(TestCase):
     def test_to_dict_stdout(self):
         task = Task(
@@ -101,4 +271,815 @@ class TaskTestCase(TestCase):
             },
             'duration': 1,
         }
-        self.assertEqual(task.to_dict(), expected)
\ No newline at end of file
+        self.assertEqual(task.to_dict(), expected)
+
+class TaskSessionTimingTestCase(TestCase):
+    # action sequences of task sessions recorded in the user study, as offsets
+    # in seconds from the start of the task session, with the time of the last
+    # resume and the active time the action history gives them
+    sessions = [
+        # active until the command which solves the task
+        ('passed', 212, [('ls', 30), ('find . -size +800c', 95),
+                         ('find content -size +800c -size -10k', 180)],
+         None, 180),
+        # 60 + (200 - 150) + (300 - 260)
+        ('passed', 340, [('ls', 12), ('__paused__', 60), ('__resumed__', 150),
+                         ('cd css', 170), ('__paused__', 200),
+                         ('__resumed__', 260), ('du -a', 300)],
+         260, 150),
+        # 180 + (600 - 400), until the end of the task session
+        ('time_out', 600, [('ls -l', 40), ('__reset__', 120),
+                           ('__paused__', 180), ('__resumed__', 400)],
+         400, 380),
+        # an interrupted task session paused twice counts both pauses from
+        # the start: 50 + 90 + (250 - 100)
+        ('quit', 250, [('__paused__', 50), ('__paused__', 90),
+                       ('__resumed__', 100), ('ls', 120)],
+         100, 290),
+    ]
+
+    def setUp(self):
+        user = User.objects.create(access_code='bob-smith', first_name='bob',
+                                   last_name='smith')
+        self.study_session = StudySession.objects.create(
+            user=user, session_id='bob-smith-study_session-1',
+            creation_time=timezone.now(),
+            half_session_time_left=timezone.timedelta(minutes=40))
+        self.task = Task.objects.create(
+            task_id=1, type='file_search', description='',
+            file_attributes='[]', duration=timezone.timedelta(minutes=10))
+        self.container = Container.objects.create(
+            container_id='', filesystem_name='', port=0)
+        # write the actions from the test thread
+        patcher = mock.patch.object(action_log, 'flush_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(Container, 'destroy')
+    def test_cached_timing_of_recorded_sessions(self, destroy):
+        start_time = timezone.now()
+        for i, (status, end, actions, last_resume, active_time) in \
+                enumerate(self.sessions):
+            task_session = TaskSession.objects.create(
+                study_session=self.study_session, study_session_stage='I',
+                session_id='{}-task-{}'.format(
+                    self.study_session.session_id, i + 1),
+                container=self.container, task=self.task,
+                start_time=start_time, time_left=self.task.duration,
+                status='running')
+            for action, offset in actions:
+                action_time = start_time + timezone.timedelta(seconds=offset)
+                with mock.patch('django.utils.timezone.now',
+                                return_value=action_time):
+                    if action == '__paused__':
+                        task_session.pause()
+                    elif action == '__resumed__':
+                        task_session.resume()
+                    else:
+                        ActionHistory.objects.create(
+                            task_session=task_session, action=action,
+                            action_time=action_time)
+            with mock.patch('django.utils.timezone.now', return_value=
+                            start_time + timezone.timedelta(seconds=end)):
+                task_session.close(status)
+
+            task_session = TaskSession.objects.get(
+                session_id=task_session.session_id)
+            if last_resume is None:
+                self.assertIsNone(task_session.last_resumed_at)
+            else:
+                self.assertEqual(
+                    task_session.last_resumed_at,
+                    start_time + timezone.timedelta(seconds=last_resume))
+            self.assertEqual(task_session.time_spent,
+                             timezone.timedelta(seconds=active_time))
+            # the backfill gives the same values
+            self.assertEqual(
+                replay_task_session_timing(
+                    task_session, list(task_session.get_action_history())),
+                (task_session.last_resumed_at, task_session.time_spent))
+
+    @mock.patch.object(Container, 'destroy')
+    def test_close_writes_the_queued_actions(self, destroy):
+        task_session = TaskSession.objects.create(
+            study_session=self.study_session, study_session_stage='I',
+            session_id='{}-task-1'.format(self.study_session.session_id),
+            container=self.container, task=self.task,
+            start_time=timezone.now(), time_left=self.task.duration,
+            status='running')
+        # queue the action without the writer thread
+        with mock.patch.object(action_log, 'flush_interval', 60), \
+                mock.patch.object(action_log, '_start'):
+            action_log.log(task_session=task_session, action='ls',
+                           action_time=timezone.now())
+            self.assertEqual(action_log.queue_size, 1)
+            task_session.close('quit')
+        self.assertEqual(action_log.queue_size, 0)
+        self.assertEqual(ActionHistory.objects.filter(
+            task_session=task_session).count(), 1)
+
+class RetryTransactionTestCase(TransactionTestCase):
+    """The transactions must commit for the retries to happen."""
+    def test_locked_transaction_is_retried(self):
+        user = User.objects.create(access_code='bob-smith', first_name='bob',
+                                   last_name='smith')
+        study_session = StudySession.objects.create(
+            user=user, session_id='bob-smith-study_session-1',
+            creation_time=timezone.now(),
+            half_session_time_left=timezone.timedelta(minutes=40))
+        task = Task.objects.create(
+            task_id=1, type='file_search', description='',
+            file_attributes='[]', duration=timezone.timedelta(minutes=10))
+        task_session = TaskSession.objects.create(
+            study_session=study_session, study_session_stage='I',
+            session_id='{}-task-1'.format(study_session.session_id),
+            container=Container.objects.create(
+                container_id='', filesystem_name='', port=0), task=task,
+            start_time=timezone.now() - timezone.timedelta(seconds=60),
+            time_left=task.duration, status='running')
+        save = models.Model.save
+        attempts = []
+
+        def save_once_locked(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return save(*args, **kwargs)
+
+        with mock.patch.object(models.Model, 'save', save_once_locked), \
+                mock.patch.object(action_log, 'flush_interval', 0):
+            task_session.pause()
+        self.assertEqual(len(attempts), 2)
+        task_session = TaskSession.objects.get(
+            session_id=task_session.session_id)
+        self.assertEqual(task_session.status, 'paused')
+        self.assertAlmostEqual(
+            task_session.accumulated_active_time.total_seconds(), 60, delta=5)
+        self.assertEqual(task_session.time_left +
+                         task_session.accumulated_active_time,
+                         task.duration)
+
+class ActionLogWriterTestCase(TestCase):
+    def test_records_are_written_on_flush(self):
+        writer = ActionLogWriter(Researcher, flush_interval=60,
+                                 max_batch_size=1000)
+        for i in range(10):
+            writer.log(first_name='r{}'.format(i), last_name='', email='')
+        self.assertEqual(writer.queue_size, 10)
+        writer.flush()
+        self.assertEqual(writer.queue_size, 0)
+        self.assertEqual(Researcher.objects.count(), 10)
+
+    def test_rejected_record_does_not_block_the_others(self):
+        writer = ActionLogWriter(Researcher, flush_interval=60,
+                                 max_batch_size=1000)
+        writer.log(first_name='r0', last_name='', email='')
+        # violates a NOT NULL constraint
+        writer.log(first_name=None, last_name='', email='')
+        writer.log(first_name='r2', last_name='', email='')
+        writer.flush()
+        self.assertEqual(writer.queue_size, 0)
+        self.assertEqual(len(writer.dead_letters), 1)
+        self.assertEqual(sorted(Researcher.objects.values_list(
+            'first_name', flat=True)), ['r0', 'r2'])
+        writer.log(first_name='r3', last_name='', email='')
+        writer.flush()
+        self.assertEqual(Researcher.objects.count(), 3)
+
+class QueryPlanTestCase(TestCase):
+    """Hot queries must be answered with an index lookup."""
+    def assertNoFullTableScan(self, queryset):
+        scans = full_table_scans(queryset)
+        self.assertEqual(scans, [], 'full table scan in query: {}'.format(
+            queryset.query))
+
+    def test_login_queries(self):
+        self.assertNoFullTableScan(
+            User.objects.filter(access_code='bob-smith'))
+        self.assertNoFullTableScan(
+            User.objects.filter(first_name='bob', last_name='smith'))
+        self.assertNoFullTableScan(
+            StudySession.objects.filter(user_id=1).order_by('creation_time'))
+
+    def test_task_queries(self):
+        self.assertNoFullTableScan(Task.objects.filter(task_id=1))
+
+    def test_task_session_queries(self):
+        self.assertNoFullTableScan(TaskSession.objects.filter(
+            study_session_id='s', is_training=False,
+            study_session_stage='I').order_by('start_time'))
+        self.assertNoFullTableScan(TaskSession.objects.filter(
+            study_session_id='s', status='passed'))
+
+    def test_action_history_queries(self):
+        self.assertNoFullTableScan(ActionHistory.objects.filter(
+            task_session_id='t').order_by('action_time'))
+
+class TaskCatalogTestCase(TestCase):
+    def test_initial_diffs_are_copied(self):
+        task = Task(
+            task_id=100, type='stdout', description='', file_attributes='[]',
+            initial_filesystem='{"type": "directory", "name": "website", '
+                               '"children": []}',
+            initial_filesystem_diff='{"type": "directory", "name": "website", '
+                                    '"children": [], "tag": {}}',
+            initial_stdout_diff='{"lines": [], "tag": "correct"}',
+            duration=datetime.timedelta(seconds=1))
+        invalidate(task)
+        task_definition = get_task_definition(task)
+        self.assertIs(get_task_definition(task), task_definition)
+        self.assertEqual(task_definition.goal_filesystem['name'], 'website')
+
+        fs_diff = task_definition.get_initial_filesystem_diff()
+        fs_diff['tag']['ch_missing'] = 1
+        self.assertEqual(task_definition.get_initial_filesystem_diff()['tag'],
+                         {})
+        self.assertEqual(task_definition.get_initial_stdout_diff()['tag'],
+                         'correct')
+        invalidate(task)
+
+    def test_preload(self):
+        tasks = [Task(task_id=task_id, type='stdout', description='',
+                      file_attributes='[]', initial_filesystem='',
+                      duration=datetime.timedelta(seconds=1))
+                 for task_id in [101, 102]]
+        for task in tasks:
+            invalidate(task)
+        self.assertEqual(preload(tasks), 2)
+        task_definition = get_task_definition(tasks[0])
+        self.assertEqual(task_definition.task_id, 101)
+        preload(tasks[:1])
+        self.assertIs(get_task_definition(tasks[0]), task_definition)
+        for task in tasks:
+            invalidate(task)
+
+class DiffCacheTestCase(TestCase):
+    def test_lookup_returns_copy(self):
+        cache = DiffCache(max_size=1024)
+        key = cache.make_key(1, {'type': 'directory', 'name': 'website',
+                                 'children': []}, [pathlib.Path('website')])
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {'name': 'website', 'tag': {}})
+        fs_diff = cache.get(key)
+        fs_diff['tag']['ch_extra'] = 1
+        self.assertEqual(cache.get(key), {'name': 'website', 'tag': {}})
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_cached_diff_can_be_annotated(self):
+        goal = {'type': 'directory', 'name': 'website', 'children': [
+            {'type': 'file', 'name': 'README.md', 'attributes': {}},
+            {'type': 'directory', 'name': 'css', 'children': [
+                {'type': 'file', 'name': 'main.css', 'attributes': {}}]}]}
+        cache = DiffCache(max_size=1024 * 1024)
+        key = (1, 'snapshot', '')
+        cache.put(key, filesystem_diff(copy.deepcopy(goal), goal))
+        stdout_diff = {'lines': [
+            {'line': 'css/main.css', 'tag': 'missing'},
+            {'line': 'README.md', 'tag': 'extra'}]}
+        expected = filesystem_diff(copy.deepcopy(goal), goal)
+        annotate_stdout_errors(expected, stdout_diff)
+        for _ in range(2):
+            fs_diff = cache.get(key)
+            annotate_stdout_errors(fs_diff, stdout_diff)
+            self.assertEqual(fs_diff, expected)
+
+    def test_size_based_eviction(self):
+        cache = DiffCache(max_size=100)
+        for i in range(10):
+            cache.put((1, str(i), ''), {'name': 'x' * 20})
+        stats = cache.stats()
+        self.assertLessEqual(stats['size'], 100)
+        self.assertGreater(stats['evictions'], 0)
+        self.assertIsNone(cache.get((1, '0', '')))
+        self.assertIsNotNone(cache.get((1, '9', '')))
+
+class DiffPatchTestCase(TestCase):
+    def setUp(self):
+        self.goal = {'type': 'directory', 'name': 'website', 'children': [
+            {'type': 'file', 'name': 'README.md', 'attributes': {}},
+            {'type': 'directory', 'name': 'css', 'children': [
+                {'type': 'file', 'name': 'main.css', 'attributes': {}}]}]}
+
+    def diff(self, current):
+        return json.loads(json.dumps(filesystem_diff(current, self.goal)))
+
+    def test_patch_turns_old_diff_into_new_diff(self):
+        old_diff = self.diff(copy.deepcopy(self.goal))
+        current = {'type': 'directory', 'name': 'website', 'children': [
+            {'type': 'file', 'name': 'README.md', 'attributes': {}},
+            {'type': 'file', 'name': 'css', 'attributes': {}},
+            {'type': 'directory', 'name': 'js', 'children': [
+                {'type': 'file', 'name': 'app.js', 'attributes': {}}]}]}
+        new_diff = self.diff(current)
+        patch = compute_diff_patch(old_diff, new_diff)
+        self.assertEqual(apply_diff_patch(old_diff, patch), new_diff)
+        self.assertIsNone(compute_diff_patch(new_diff, new_diff))
+
+    def test_version_store(self):
+        store = DiffVersionStore()
+        fs_diff = self.diff(copy.deepcopy(self.goal))
+        fields = store.update('s', fs_diff)
+        self.assertIn('filesystem_diff', fields)
+        version = fields['filesystem_diff_version']
+        fields = store.update('s', fs_diff, version)
+        self.assertTrue(fields['filesystem_diff_unchanged'])
+        fields = store.update('s', fs_diff, version - 1)
+        self.assertIn('filesystem_diff', fields)
+
+    def test_version_store_shared_by_processes(self):
+        fs_diff = self.diff(copy.deepcopy(self.goal))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # two server processes
+            store = DiffVersionStore(directory=tmp_dir)
+            other_store = DiffVersionStore(directory=tmp_dir)
+            version = store.update('s', fs_diff)['filesystem_diff_version']
+            self.assertEqual(other_store.get('s'), (version, fs_diff))
+            fields = other_store.update('s', fs_diff, version)
+            self.assertTrue(fields['filesystem_diff_unchanged'])
+            current = copy.deepcopy(self.goal)
+            current['children'].pop()
+            new_diff = self.diff(current)
+            fields = other_store.update('s', new_diff, version)
+            self.assertIn('filesystem_diff_patch', fields)
+            self.assertEqual(store.get_full('s'),
+                             (version + 1, new_diff))
+            store.forget('s')
+            self.assertEqual(other_store.get('s'), (None, None))
+
+    def test_full_diff_not_modified_when_gzipped(self):
+        user = User.objects.create(access_code='bob-smith', first_name='bob',
+                                   last_name='smith')
+        study_session = StudySession.objects.create(
+            user=user, session_id='bob-smith-study_session-1',
+            creation_time=timezone.now(),
+            half_session_time_left=timezone.timedelta(minutes=40))
+        task_session = TaskSession.objects.create(
+            study_session=study_session, study_session_stage='I',
+            session_id='bob-smith-study_session-1-task-1',
+            container=Container.objects.create(
+                container_id='', filesystem_name='', port=0),
+            task=Task.objects.create(
+                task_id=1, type='file_search', description='',
+                file_attributes='[]',
+                duration=timezone.timedelta(minutes=10)),
+            status='running')
+        current = {'type': 'directory', 'name': 'website', 'children': [
+            {'type': 'file', 'name': 'file{}.html'.format(i),
+             'attributes': {}} for i in range(100)]}
+        diff_versions.update(task_session.session_id, self.diff(current))
+        self.addCleanup(diff_versions.forget, task_session.session_id)
+        self.client.cookies['session_id'] = study_session.session_id
+        self.client.cookies['task_session_id'] = task_session.session_id
+
+        resp = self.client.get('/get_filesystem_diff',
+                               HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertTrue(resp['ETag'].startswith('W/'))
+        resp = self.client.get('/get_filesystem_diff',
+                               HTTP_ACCEPT_ENCODING='gzip',
+                               HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_compact_encoding_roundtrip(self):
+        current = {'type': 'directory', 'name': 'website', 'children': [
+            {'type': 'file', 'name': 'README.md', 'attributes': {}},
+            {'type': 'directory', 'name': 'js', 'children': [
+                {'type': 'file', 'name': 'app.js', 'attributes': {}}]}]}
+        fs_diff = self.diff(current)
+        encoded = json.loads(json.dumps(encode_compact_diff(fs_diff)))
+        self.assertEqual(decode_compact_diff(encoded), fs_diff)
+
+
+class DiffSummaryTestCase(TestCase):
+    def setUp(self):
+        self.goal = {'type': 'directory', 'name': 'website', 'children': [
+            {'type': 'file', 'name': 'README.md', 'attributes': {}},
+            {'type': 'directory', 'name': 'css', 'children': [
+                {'type': 'file', 'name': 'main.css', 'attributes': {}}]},
+            {'type': 'directory', 'name': 'js', 'children': [
+                {'type': 'file', 'name': 'app.js', 'attributes': {}},
+                {'type': 'file', 'name': 'lib.js', 'attributes': {}}]}]}
+        current = copy.deepcopy(self.goal)
+        # delete js/lib.js
+        current['children'][2]['children'].pop()
+        self.fs_diff = json.loads(json.dumps(
+            filesystem_diff(current, self.goal)))
+
+    def test_summary_keeps_marked_nodes(self):
+        summary = summarize_diff(self.fs_diff)
+        self.assertEqual(summary['collapsed'],
+                         {'files': 1, 'directories': 1})
+        js = find_node(summary, 'd:website/d:js')
+        self.assertEqual([child['name'] for child in js['children']],
+                         ['lib.js'])
+        self.assertEqual(js['collapsed'], {'files': 1, 'directories': 0})
+        encoded = json.loads(json.dumps(encode_compact_diff(summary)))
+        self.assertEqual(decode_compact_diff(encoded), summary)
+
+    def test_expanded_subtree(self):
+        js = summarize_diff(find_node(self.fs_diff, 'd:website/d:js'),
+                            expanded=True)
+        self.assertEqual([child['name'] for child in js['children']],
+                         ['app.js', 'lib.js'])
+        self.assertNotIn('collapsed', js)
+        self.assertIsNone(find_node(self.fs_diff, 'd:website/f:js'))
+
+    def test_deep_diff(self):
+        fs_diff = {'type': 'directory', 'name': 'website', 'children': []}
+        node = fs_diff
+        for i in range(sys.getrecursionlimit() + 100):
+            child = {'type': 'directory', 'name': 'd', 'children': [
+                {'type': 'file', 'name': 'f', 'tag': {'correct': True}}]}
+            node['children'].append(child)
+            node = child
+        node['children'].append(
+            {'type': 'file', 'name': 'g', 'tag': {'missing': True}})
+        summary = summarize_diff(fs_diff)
+        self.assertEqual(count_nodes(summary),
+                         sys.getrecursionlimit() + 102)
+
+
+class OwnersTestCase(TestCase):
+    def test_container_owners(self):
+        files = {
+            '/etc/passwd': 'root:x:0:0:root:/root:/bin/bash\n'
+                           'me:x:1000:1000::/home/me:/bin/bash\n',
+            '/etc/group': 'root:x:0:\nme:x:1000:\nsudo:x:27:me\n'
+        }
+        owners = ContainerOwners('container', reload_interval=0)
+        with mock.patch.object(ContainerOwners, 'read_file',
+                               side_effect=lambda path: files[path]) as read:
+            self.assertEqual(owners.user_name(1000), 'me')
+            self.assertEqual(owners.group_name(27), 'sudo')
+            self.assertEqual(read.call_count, 2)
+
+            # a user added to the container is found after a reload
+            files['/etc/passwd'] += 'me2:x:1001:1001::/home/me2:/bin/sh\n'
+            self.assertEqual(owners.user_name(1001), 'me2')
+            self.assertEqual(owners.user_name(1000), 'me')
+            self.assertEqual(read.call_count, 4)
+            self.assertEqual(owners.user_name(4242), '4242')
+
+    def test_parse_name_table(self):
+        self.assertEqual(parse_name_table('# comment\nme:x:1000:1000::/:\n'),
+                         {1000: 'me'})
+
+
+@skipUnless(columnar.available(), 'NumPy is not installed')
+class ColumnarTestCase(TestCase):
+    def test_range_selection(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            home = pathlib.Path(tmp_dir) / 'website'
+            (home / 'css').mkdir(parents=True)
+            for name, mtime in [('README.md', 1454065722),
+                                ('css/main.css', 1300000000)]:
+                (home / name).touch()
+                os.utime((home / name).as_posix(), (mtime, mtime))
+            builder = columnar.ColumnBuilder()
+            fs = disk_2_dict(home, [filesystem._MTIME], columns=builder)
+            columns = builder.build()
+            self.assertEqual(sorted(columns.paths),
+                             ['README.md', 'css/main.css'])
+
+            day = datetime.date.fromtimestamp(1454065722)
+            lower_bound = day.isoformat()
+            higher_bound = (day + datetime.timedelta(days=1)).isoformat()
+            self.assertEqual(columns.select_paths('mtime', lower_bound,
+                                                  higher_bound),
+                             ['README.md'])
+            annotate_node(fs, pathlib.Path('website'), 'to_select',
+                          recursive=True, file_only=True, columns=columns,
+                          attr='mtime', attr_lower_bound=lower_bound,
+                          attr_higher_bound=higher_bound)
+            self.assertTrue(tag_exists(fs['children'][0], 'to_select'))
+            self.assertFalse(tag_exists(fs['children'][1]['children'][0],
+                                        'to_select'))
+
+            goal = columnar.ColumnarSnapshot.from_filesystem(fs)
+            self.assertEqual(columns.mismatches(goal, 'mtime'), [])
+
+
+class VerificationPoolTestCase(TestCase):
+    def test_jobs_of_a_session_run_in_order(self):
+        pool = VerificationPool(num_workers=4)
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+
+        def job(i):
+            def run(chained, batch):
+                if i == 0:
+                    started.set()
+                    release.wait(5)
+                order.append(i)
+                return {'status': 'SUCCESS', 'i': i, 'chained': chained}
+            return run
+
+        job_ids = [pool.submit('session1', job(0))]
+        started.wait(5)
+        job_ids += [pool.submit('session1', job(i)) for i in range(1, 3)]
+        self.assertTrue(pool.is_pending('session1'))
+        self.assertEqual(pool.stats()['busy_workers'], 1)
+        self.assertEqual(pool.stats()['queue_depth'], 2)
+        release.set()
+
+        results = []
+        while len(results) < 3:
+            results = pool.wait_results('session1', timeout=5)
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual([result['job_id'] for result in results], job_ids)
+        self.assertEqual([result['chained'] for result in results],
+                         [False, True, True])
+        self.assertEqual(pool.stats()['batches'], 2)
+        # acknowledged results are dropped
+        self.assertEqual(pool.wait_results('session1', after=job_ids[-1]),
+                         [])
+        self.assertFalse(pool.is_pending('session1'))
+
+    def test_failed_job(self):
+        pool = VerificationPool(num_workers=1)
+
+        def job(chained, batch):
+            raise ValueError()
+
+        job_id = pool.submit('session1', job)
+        self.assertEqual(pool.wait_results('session1', timeout=5),
+                         [{'status': 'VERIFICATION_ERROR', 'job_id': job_id}])
+        self.assertEqual(pool.stats()['failed'], 1)
+
+    def burst(self, pool, submit, num_commands=50):
+        """
+        Execute a burst of commands, each of which changes the file system
+        state, and verify them with the pool. Returns the job IDs and the
+        state, which counts the scans.
+        """
+        lock = threading.Lock()
+        state = {'executed': 0, 'scans': 0}
+
+        def job(i):
+            def verify(chained, batch):
+                if 'snapshot' not in batch:
+                    with lock:
+                        state['scans'] += 1
+                        batch['snapshot'] = state['executed']
+                    time.sleep(0.01)
+                return {'status': 'SUCCESS', 'command': i,
+                        'snapshot': batch['snapshot']}
+            return verify
+
+        def execute(i):
+            with lock:
+                state['executed'] += 1
+            return submit(job(i))
+
+        return [execute(i) for i in range(num_commands)], state
+
+    def test_burst_is_coalesced(self):
+        pool = VerificationPool(num_workers=4)
+        job_ids, _ = self.burst(
+            pool, lambda job: pool.submit('session1', job))
+        results = []
+        while len(results) < len(job_ids):
+            results = pool.wait_results('session1', timeout=5)
+        self.assertEqual([result['job_id'] for result in results], job_ids)
+        self.assertEqual([result['command'] for result in results],
+                         list(range(50)))
+        # every result reflects the file system after its command
+        for result in results:
+            self.assertGreater(result['snapshot'], result['command'])
+        stats = pool.stats()
+        self.assertEqual(stats['completed'], 50)
+        self.assertLess(stats['batches'], 50)
+        self.assertEqual(stats['batches'] + stats['coalesced'], 50)
+
+    def test_concurrent_inline_burst_is_coalesced(self):
+        pool = VerificationPool(num_workers=0)
+        results = [None] * 50
+        threads = []
+
+        def submit(job):
+            def request(i):
+                results[i] = pool.run('session1', job)
+            thread = threading.Thread(target=request, args=(len(threads),))
+            threads.append(thread)
+            thread.start()
+
+        _, state = self.burst(pool, submit)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([result['command'] for result in results],
+                         list(range(50)))
+        for result in results:
+            self.assertGreater(result['snapshot'], result['command'])
+        self.assertLess(state['scans'], 50)
+        self.assertFalse(pool.is_pending('session1'))
+
+
+def increment_counter_file(path, num_increments):
+    for _ in range(num_increments):
+        with session_lock('counter'):
+            with open(path) as f:
+                value = int(f.read())
+            # give the other processes a chance to interleave
+            time.sleep(0.001)
+            with open(path, 'w') as f:
+                f.write(str(value + 1))
+
+
+class SessionLockTestCase(TestCase):
+    def test_processes_do_not_lose_updates(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'counter')
+            with open(path, 'w') as f:
+                f.write('0')
+            with self.settings(LOCK_DIR=os.path.join(tmp_dir, 'locks')):
+                context = multiprocessing.get_context('fork')
+                processes = [context.Process(target=increment_counter_file,
+                                             args=(path, 20))
+                             for _ in range(8)]
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join(30)
+                    self.assertEqual(process.exitcode, 0)
+            with open(path) as f:
+                self.assertEqual(int(f.read()), 8 * 20)
+
+    def test_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.settings(LOCK_DIR=tmp_dir):
+                with session_lock('session'):
+                    with self.assertRaises(LockTimeout):
+                        with session_lock('session', timeout=0.05):
+                            pass
+                with session_lock('session', timeout=0.05):
+                    pass
+
+    def test_counters_of_stale_instances(self):
+        user = User.objects.create(access_code='bob-smith', first_name='bob',
+                                   last_name='smith')
+        StudySession.objects.create(
+            user=user, session_id='bob-smith-study_session-1',
+            creation_time=timezone.now(),
+            half_session_time_left=timezone.timedelta(minutes=40))
+        # two processes holding the study session
+        study_sessions = [
+            StudySession.objects.get(session_id='bob-smith-study_session-1')
+            for _ in range(2)]
+        for study_session in study_sessions:
+            study_session.inc_num_training_tasks_completed()
+            study_session.update_half_session_time_left(
+                timezone.timedelta(minutes=5))
+            study_session.set_ip_address('127.0.0.1')
+        study_session = StudySession.objects.get(
+            session_id='bob-smith-study_session-1')
+        self.assertEqual(study_session.num_training_tasks_completed, 2)
+        self.assertEqual(study_session.half_session_time_left,
+                         timezone.timedelta(minutes=30))
+
+
+class TimingTestCase(TestCase):
+    def setUp(self):
+        histograms.clear()
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram()
+        for i in range(1, 101):
+            histogram.observe(i / 1000)
+        self.assertEqual(histogram.count, 100)
+        for q, value in [(0.5, 0.050), (0.95, 0.095), (0.99, 0.099)]:
+            self.assertGreaterEqual(histogram.quantile(q), value)
+            self.assertLessEqual(histogram.quantile(q), value * 2 ** 0.25)
+        self.assertEqual(histogram.quantile(1.0), 0.1)
+
+    def test_spans(self):
+        with span('outside'):
+            pass
+        with timed('endpoint') as timer:
+            for _ in range(2):
+                with span('stage'):
+                    time.sleep(0.01)
+            with timed('nested') as nested_timer:
+                self.assertIs(nested_timer, timer)
+        self.assertGreaterEqual(timer.spans['stage'], 0.02)
+        self.assertNotIn('outside', timer.spans)
+        stage = histograms.get('request_stage_seconds',
+                               (('endpoint', 'endpoint'), ('stage', 'stage')))
+        self.assertEqual(stage.count, 1)
+        self.assertIsNone(histograms.get(
+            'request_stage_seconds',
+            (('endpoint', 'nested'), ('stage', 'total'))))
+
+    def test_server_timing_header(self):
+        resp = self.client.get('/retrieve_access_code',
+                               {'first_name': 'bob', 'last_name': 'smith'})
+        stages = [entry.split(';')[0]
+                  for entry in resp['Server-Timing'].split(', ')]
+        self.assertIn('db', stages)
+        self.assertEqual(stages[-1], 'total')
+        metrics = self.client.get('/metrics').content.decode('utf-8')
+        self.assertIn('request_stage_seconds_count{endpoint='
+                      '"retrieve_access_code",stage="db"} 1', metrics)
+
+
+class ProvisioningTestCase(TestCase):
+    def create_container(self, name, created_at, provisioning_time,
+                         load_average=0.5):
+        phases = PhaseTimer('container_phase_seconds', 'create')
+        with phases.phase('make_filesystem'):
+            pass
+        container = Container(
+            container_id=name, filesystem_name=name, port=0,
+            created_at=created_at,
+            ready_at=created_at + timezone.timedelta(
+                seconds=provisioning_time),
+            load_average=load_average)
+        container.set_phase_durations('create', phases, provisioning_time)
+        container.save()
+        return container
+
+    def test_phase_timer(self):
+        histograms.clear()
+        phases = PhaseTimer('container_phase_seconds', 'create')
+        for _ in range(2):
+            with phases.phase('chown'):
+                time.sleep(0.01)
+        self.assertGreaterEqual(phases.finish(), phases.durations['chown'])
+        self.assertEqual(histograms.get(
+            'container_phase_seconds',
+            (('operation', 'create'), ('phase', 'chown'))).count, 2)
+
+    def test_destroy_records_phases(self):
+        container = self.create_container(
+            'c1', timezone.now(), 2.0)
+        with mock.patch('subprocess.run'):
+            container.destroy()
+        container = Container.objects.get(pk=container.pk)
+        self.assertIsNotNone(container.destroyed_at)
+        self.assertEqual(set(container.get_phase_durations('destroy')),
+                         {'docker_rm', 'delete_filesystem', 'total'})
+        self.assertEqual(container.get_phase_durations('create')['total'], 2.0)
+        self.assertEqual(container.provisioning_time,
+                         timezone.timedelta(seconds=2))
+        # destroyed again when its task session is resumed or closed
+        destroyed_at = container.destroyed_at
+        with mock.patch('subprocess.run') as run:
+            container.destroy()
+        self.assertFalse(run.called)
+        self.assertEqual(Container.objects.get(pk=container.pk).destroyed_at,
+                         destroyed_at)
+
+    def test_report(self):
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - \
+            timezone.timedelta(hours=3)
+        for i, provisioning_time in enumerate([2.0, 2.2, 2.1]):
+            self.create_container('a{}'.format(i), start, provisioning_time)
+        for i, provisioning_time in enumerate([4.0, 4.5]):
+            self.create_container(
+                'b{}'.format(i), start + timezone.timedelta(hours=1),
+                provisioning_time, load_average=8.0)
+        rows = provisioning_report(Container.objects.all(), num_cpus=4)
+        self.assertEqual([row['count'] for row in rows], [3, 2])
+        self.assertEqual(rows[0]['p50'], 2.1)
+        self.assertFalse(rows[0]['regression'])
+        self.assertTrue(rows[1]['regression'])
+        self.assertTrue(rows[1]['saturated'])
+        self.assertEqual(rows[1]['baseline'], 2.1)
+
+        resp = self.client.get('/container_report', {'period': '30'})
+        self.assertEqual(resp.status_code, 200)
+
+
+class ProfilingTestCase(TestCase):
+    def test_disabled(self):
+        with self.settings(PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_profiles(self):
+        with self.settings(PROFILING=True, PROFILING_HEADER_TOKEN='secret',
+                           PROFILING_MAX_PROFILES=2):
+            self.client.get('/retrieve_access_code',
+                            {'first_name': 'bob', 'last_name': 'smith'})
+            self.assertEqual(RequestProfile.objects.count(), 0)
+            self.client.cookies['task_session_id'] = 'task-session-1'
+            for _ in range(3):
+                self.client.get('/retrieve_access_code',
+                                {'first_name': 'bob', 'last_name': 'smith'},
+                                HTTP_X_PROFILE_REQUEST='secret')
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        request_profile = RequestProfile.objects.first()
+        self.assertEqual(request_profile.endpoint, 'retrieve_access_code')
+        self.assertEqual(request_profile.task_session_id, 'task-session-1')
+        self.assertEqual(request_profile.trigger, 'header')
+        self.assertIn('retrieve_access_code', request_profile.function_stats)
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(bytes(request_profile.profile))
+            f.flush()
+            self.assertGreater(pstats.Stats(f.name).total_calls, 0)
+        # the profiles are for the staff only
+        resp = self.client.get('/request_profile',
+                               {'id': request_profile.pk})
+        self.assertEqual(resp.status_code, 302)
@@ -0,0 +1,308 @@
+"""
+Timing of the stages of the requests.
+
+The stages of a request are timed with spans:
+
+    with span('disk_2_dict'):
+        ...
+
+The spans of the thread's current request (see `timed`) are summed by name:
+ServerTimingMiddleware sends them to the browser in the Server-Timing header,
+so that the developer tools show where the time of a slow request went, and
+they are aggregated into histograms by endpoint and stage, which /metrics
+reports with their quantiles. The database queries are timed as the 'db'
+stage (see `instrument_connection`). A span outside of a request costs one
+thread-local lookup.
+
+The histograms live in the memory of the process: with several server
+processes, every process reports the requests it served.
+"""
+
+import bisect
+import collections
+import contextlib
+import math
+import os
+import threading
+import time
+
+
+class Histogram(object):
+    """
+    Counts values in buckets whose bounds grow exponentially, from 'min_value'
+    by a factor of 'growth'. The quantiles are estimated with the bounds of
+    the buckets, within a factor of 'growth' of the true value.
+
+    :member count: The number of values observed.
+    :member sum: The sum of the values observed.
+    :member max: The largest value observed.
+    """
+    def __init__(self, min_value=1e-5, growth=2 ** 0.25, num_buckets=96):
+        self.bounds = [min_value * growth ** i for i in range(num_buckets)]
+        self.buckets = [0] * (num_buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Returns an upper bound of the q-quantile of the values."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                break
+        if i == len(self.bounds):
+            return self.max
+        return min(self.bounds[i], self.max)
+
+
+class HistogramRegistry(object):
+    """
+    Histograms of durations in seconds, by metric name and labels.
+
+    :member quantiles: The quantiles reported by 'render'.
+    """
+    def __init__(self, quantiles=(0.5, 0.95, 0.99)):
+        self.quantiles = quantiles
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        """
+        Add a value to a histogram.
+
+        Args:
+            name: the name of the metric
+            labels: a tuple of (label name, label value) pairs
+            value: the duration in seconds
+        """
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram()
+            histogram.observe(value)
+
+    def get(self, name, labels):
+        """Returns the histogram of a metric and labels, or None."""
+        return self._histograms.get((name, labels))
+
+    def summary(self, name):
+        """
+        Returns the count, sum, maximum and quantiles of the histograms of a
+        metric, by their labels as dictionaries.
+        """
+        with self._lock:
+            rows = []
+            for (metric, labels), histogram in sorted(
+                    self._histograms.items()):
+                if metric != name:
+                    continue
+                row = dict(labels)
+                row.update({
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'max': histogram.max
+                })
+                for q in self.quantiles:
+                    row['p{:g}'.format(q * 100)] = histogram.quantile(q)
+                rows.append(row)
+            return rows
+
+    def render(self):
+        """
+        Returns the histograms as summaries in the Prometheus text format.
+        """
+        lines = ['# process {}'.format(os.getpid())]
+        with self._lock:
+            last_name = None
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name != last_name:
+                    lines.append('# TYPE {} summary'.format(name))
+                    last_name = name
+                label_text = ','.join('{}="{}"'.format(k, v)
+                                      for k, v in labels)
+                for q in self.quantiles:
+                    lines.append('{}{{{},quantile="{:g}"}} {:.6f}'.format(
+                        name, label_text, q, histogram.quantile(q)))
+                lines.append('{}_count{{{}}} {}'.format(
+                    name, label_text, histogram.count))
+                lines.append('{}_sum{{{}}} {:.6f}'.format(
+                    name, label_text, histogram.sum))
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+histograms = HistogramRegistry()
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+    """
+    The spans of a request.
+
+    :member endpoint: The name of the view, None until it is resolved.
+    :member start: The time the request started.
+    :member spans: The total duration of the spans of each stage in seconds,
+        in the order the stages started.
+    """
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.spans = {}
+        self._order = []
+
+    def add(self, name, duration):
+        if name not in self.spans:
+            self.spans[name] = 0.0
+            self._order.append(name)
+        self.spans[name] += duration
+
+    def server_timing(self, total):
+        """Returns the value of the Server-Timing header."""
+        return ', '.join('{};dur={:.2f}'.format(name, self.spans[name] * 1000)
+                         for name in self._order) + \
+            ', total;dur={:.2f}'.format(total * 1000)
+
+    def record(self, total):
+        """Add the spans and the total duration to the histograms."""
+        if self.endpoint is None:
+            return
+        for name in self._order:
+            histograms.observe('request_stage_seconds',
+                               (('endpoint', self.endpoint), ('stage', name)),
+                               self.spans[name])
+        histograms.observe('request_stage_seconds',
+                           (('endpoint', self.endpoint), ('stage', 'total')),
+                           total)
+
+
+def current_timer():
+    """Returns the RequestTimer of the thread's request, or None."""
+    return getattr(_local, 'timer', None)
+
+
+@contextlib.contextmanager
+def timed(endpoint):
+    """
+    Time the spans in the body of a with statement as a request to an
+    endpoint, and record them when it ends. Within a request, the spans are
+    added to the request instead.
+    """
+    if current_timer() is not None:
+        yield current_timer()
+        return
+    timer = _local.timer = RequestTimer(endpoint)
+    try:
+        yield timer
+    finally:
+        _local.timer = None
+        timer.record(time.perf_counter() - timer.start)
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time the body of a with statement as a stage of the request."""
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+class PhaseTimer(object):
+    """
+    Times the consecutive phases of an operation, such as provisioning a
+    container:
+
+        phases = PhaseTimer('container_phase_seconds', 'create')
+        with phases.phase('docker_create'):
+            ...
+        phases.finish()
+
+    Every phase is a span of the current request and is added to the
+    histogram of the metric for the operation and the phase; 'finish' adds
+    the total duration as the 'total' phase.
+
+    :member durations: The duration of every phase in seconds, in the order
+        the phases ran.
+    """
+    def __init__(self, metric, operation):
+        self.metric = metric
+        self.operation = operation
+        self.durations = collections.OrderedDict()
+        self.start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            duration = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+            histograms.observe(self.metric, (('operation', self.operation),
+                                             ('phase', name)), duration)
+
+    def finish(self):
+        """Record and return the total duration of the operation."""
+        total = time.perf_counter() - self.start
+        histograms.observe(self.metric, (('operation', self.operation),
+                                         ('phase', 'total')), total)
+        return total
+
+
+class TimedCursor(object):
+    """Times the queries of a database cursor as 'db' spans."""
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self.cursor.__exit__(*args)
+
+    def execute(self, sql, params=None):
+        with span('db'):
+            return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with span('db'):
+            return self.cursor.executemany(sql, param_list)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """Time the queries of a newly created database connection."""
+    if getattr(connection, 'timed_cursors', False):
+        return
+    connection.timed_cursors = True
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TimedCursor(make_cursor(cursor))
+    connection.make_debug_cursor = \
+        lambda cursor: TimedCursor(make_debug_cursor(cursor))
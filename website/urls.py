@@ -31,15 +31,24 @@ urlpatterns = [
 
     # terminal I/O
     url(r'^on_command_execution$', views.on_command_execution),
+    url(r'^get_verification_results$', views.get_verification_results),
 
     # file system
     url(r'^reset_file_system$', views.reset_file_system),
+    url(r'^get_filesystem_diff$', views.get_filesystem_diff),
+    url(r'^get_filesystem_subtree$', views.get_filesystem_subtree),
+    url(r'^get_file_content$', views.get_file_content),
 
     # admin pagedj
     url(r'^admin', admin.site.urls),
     url(r'^study_session_report$', views.study_session_report),
     url(r'^action_history$', views.action_history),
     url(r'^overview$', views.overview),
+    url(r'^diff_cache_stats$', views.diff_cache_stats),
+    url(r'^verification_stats$', views.verification_stats),
+    url(r'^metrics$', views.metrics),
+    url(r'^container_report$', views.container_report),
+    url(r'^request_profile$', views.request_profile),
 
     # login & registration
     url(r'', TemplateView.as_view(template_name='login.html'),
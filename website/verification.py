@@ -0,0 +1,293 @@
+"""
+Asynchronous verification of the commands executed in the task sessions.
+
+Scanning a participant's home directory, diffing it with the goal and encoding
+the diff can take a while on large file systems, so on_command_execution only
+queues the verification and returns a job ID. The jobs run on a bounded pool
+of worker threads. The jobs of a task session run one at a time, in the order
+they were submitted, so that its diff versions follow the commands; the jobs
+of different task sessions run in parallel.
+
+Bursts of commands (pasted scripts, fast typists) are coalesced: the jobs a
+task session queued while one of its batches was running form its next batch,
+which scans the file system once for all of them. Each job still gets its own
+result, with the diff annotated with the paths of its own command.
+
+The browser long-polls /get_verification_results for the results of its jobs,
+passing the ID of the last job it has handled. The results it acknowledges
+this way are dropped.
+
+The pool and the results live in the memory of the process. With several
+server processes, the commands are verified in their requests instead (see
+settings_production.py), and on_command_execution holds the task session's
+advisory lock around them, so that they still run one at a time.
+/verification_stats reports the queue depth and the utilisation of the
+workers.
+"""
+
+from django.conf import settings
+
+import collections
+import itertools
+import threading
+import time
+import traceback
+
+
+class _SessionJobs(object):
+    """
+    The jobs of a task session.
+
+    :member jobs: The (job ID, job, chained, submission time, inline) of the
+        jobs waiting to run.
+    :member scheduled: Whether the session is waiting for a worker or its
+        jobs are running.
+    :member results: The (job ID, result) of the jobs which ran and whose
+        results the browser has not acknowledged yet.
+    :member inline_results: The results of the jobs run by 'run', by job ID,
+        until their callers take them.
+    """
+    def __init__(self, max_results):
+        self.jobs = collections.deque()
+        self.scheduled = False
+        self.results = collections.deque(maxlen=max_results)
+        self.inline_results = {}
+
+    def is_idle(self):
+        return not self.jobs and not self.scheduled
+
+
+class VerificationPool(object):
+    """
+    Runs the verification jobs of the task sessions on worker threads.
+
+    A job is a function called with two arguments and returning the response
+    dictionary, with its 'status':
+        chained: whether an earlier job of the same task session had not been
+            delivered to the browser when the job was submitted
+        batch: a dictionary shared by the jobs of the batch the job runs in
+
+    The jobs of a task session are single-flight: when its jobs run, all of
+    its waiting jobs are taken as one batch and run one after the other,
+    while newer jobs wait for the next batch. Since a batch starts after
+    every one of its commands was executed, its jobs can share one scan of
+    the file system through the batch dictionary.
+
+    :member num_workers: The number of worker threads.
+    :member max_queue_size: The number of jobs waiting to run above which
+        'submit' blocks until a worker takes one.
+    :member max_results: The number of unacknowledged results kept per task
+        session.
+    """
+    def __init__(self, num_workers=4, max_queue_size=64, max_results=64):
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.max_results = max_results
+        self._condition = threading.Condition()
+        self._job_ids = itertools.count(1)
+        self._sessions = {}
+        # the IDs of the sessions whose next batch can run, in arrival order
+        self._ready = collections.deque()
+        self._threads = []
+        self._num_queued = 0
+        self._num_busy = 0
+        self._started_at = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.coalesced = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+
+    def submit(self, session_id, job):
+        """Queue a job of a task session. Returns its job ID."""
+        with self._condition:
+            while self._num_queued >= self.max_queue_size:
+                self._condition.wait()
+            self._start()
+            job_id, session = self._add_job(session_id, job, inline=False)
+            if not session.scheduled:
+                session.scheduled = True
+                self._ready.append(session_id)
+            self._condition.notify_all()
+            return job_id
+
+    def run(self, session_id, job):
+        """
+        Run a job of a task session in the calling thread, for a pool
+        without workers, and return its result. Concurrent callers of the
+        same task session are single-flight as well: the first one runs the
+        batches of the session while the others wait for their results.
+        """
+        with self._condition:
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+            job_id, session = self._add_job(session_id, job, inline=True)
+            leader = not session.scheduled
+            session.scheduled = True
+        if leader:
+            while True:
+                with self._condition:
+                    batch = self._take_batch(session)
+                    if not batch:
+                        session.scheduled = False
+                        break
+                self._run_batch(session_id, session, batch)
+        with self._condition:
+            while job_id not in session.inline_results:
+                self._condition.wait()
+            result = session.inline_results.pop(job_id)
+            if session.is_idle() and not session.results and \
+                    not session.inline_results:
+                self._sessions.pop(session_id, None)
+            return result
+
+    def wait_results(self, session_id, after=0, timeout=20.0):
+        """
+        Returns the results of the jobs of a task session with an ID greater
+        than 'after', as dictionaries with a 'job_id' field, and drops the
+        others. Waits at most 'timeout' seconds for a result if the session
+        has jobs waiting or running, and returns at once otherwise.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return []
+                while session.results and session.results[0][0] <= after:
+                    session.results.popleft()
+                remaining = deadline - time.monotonic()
+                if session.results or session.is_idle() or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if session.is_idle() and not session.results and \
+                    not session.inline_results:
+                del self._sessions[session_id]
+            results = []
+            for job_id, result in session.results:
+                result = dict(result)
+                result['job_id'] = job_id
+                results.append(result)
+            return results
+
+    def is_pending(self, session_id):
+        """Check if a task session has jobs waiting or running."""
+        with self._condition:
+            session = self._sessions.get(session_id)
+            return session is not None and not session.is_idle()
+
+    def stats(self):
+        with self._condition:
+            uptime = time.monotonic() - self._started_at \
+                if self._started_at is not None else 0.0
+            num_finished = self.completed + self.failed
+            num_threads = self.num_workers or 1
+            return {
+                'workers': self.num_workers,
+                'busy_workers': self._num_busy,
+                'queue_depth': self._num_queued,
+                'max_queue_size': self.max_queue_size,
+                'sessions': len(self._sessions),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'coalesced': self.coalesced,
+                'mean_wait_time': self._wait_time / num_finished
+                    if num_finished else 0.0,
+                'mean_run_time': self._run_time / num_finished
+                    if num_finished else 0.0,
+                'utilisation': self._run_time / (uptime * num_threads)
+                    if uptime else 0.0,
+            }
+
+    def _add_job(self, session_id, job, inline):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = \
+                _SessionJobs(self.max_results)
+        chained = not session.is_idle() or bool(session.results)
+        job_id = next(self._job_ids)
+        session.jobs.append((job_id, job, chained, time.monotonic(), inline))
+        self._num_queued += 1
+        self.submitted += 1
+        return job_id, session
+
+    def _take_batch(self, session):
+        """Take the waiting jobs of a session, with the condition held."""
+        batch = list(session.jobs)
+        session.jobs.clear()
+        self._num_queued -= len(batch)
+        if batch:
+            self._num_busy += 1
+            self.batches += 1
+            self.coalesced += len(batch) - 1
+            # there is room in the queue
+            self._condition.notify_all()
+        return batch
+
+    def _run_batch(self, session_id, session, batch):
+        shared = {}
+        for job_id, job, chained, submitted_at, inline in batch:
+            started_at = time.monotonic()
+            failed = False
+            try:
+                result = job(chained, shared)
+            except Exception:
+                print('Verification job {} of task session {} failed:'.format(
+                    job_id, session_id))
+                traceback.print_exc()
+                result = {'status': 'VERIFICATION_ERROR'}
+                failed = True
+            finished_at = time.monotonic()
+
+            with self._condition:
+                if inline:
+                    session.inline_results[job_id] = result
+                else:
+                    session.results.append((job_id, result))
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                self._wait_time += started_at - submitted_at
+                self._run_time += finished_at - started_at
+                self._condition.notify_all()
+        with self._condition:
+            self._num_busy -= 1
+
+    def _start(self):
+        if self._threads:
+            return
+        self._started_at = time.monotonic()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run,
+                                      name='verification-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._ready:
+                    self._condition.wait()
+                session_id = self._ready.popleft()
+                session = self._sessions[session_id]
+                batch = self._take_batch(session)
+
+            self._run_batch(session_id, session, batch)
+
+            with self._condition:
+                if session.jobs:
+                    self._ready.append(session_id)
+                else:
+                    session.scheduled = False
+                self._condition.notify_all()
+
+
+verification_pool = VerificationPool(
+    num_workers=getattr(settings, 'VERIFICATION_WORKERS', 4),
+    max_queue_size=getattr(settings, 'VERIFICATION_QUEUE_SIZE', 64))
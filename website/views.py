@@ -2,14 +2,28 @@
 This file defines functions to handle requests at URLs defined in urls.py.
 """
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import close_old_connections
 from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.template import loader
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import *
+from .diff_cache import diff_cache, snapshot_hash
+from .diff_encoding import encode_diff_fields
+from .diff_patch import diff_versions
+from .diff_summary import *
 from .filesystem import *
+from .locks import session_lock
+from .owners import get_container_owners
+from .provisioning import CREATE_PHASES, DESTROY_PHASES, provisioning_report
+from .task_catalog import get_task_definition
+from .timing import histograms, span, timed
+from .verification import verification_pool
 
 from . import functions
 import json
@@ -19,7 +33,8 @@ import tarfile
 
 def json_response(d={}, status='SUCCESS'):
     d.update({'status': status})
-    resp = JsonResponse(d)
+    with span('json'):
+        resp = JsonResponse(d)
     return resp
 
 def session_id_required(f):
@@ -152,8 +167,8 @@ def get_additional_task_info(request, task_session):
     #       pathlib.Path('/{}/home/website'.format(container.filesystem_name)),
     #         [filesystem._MTIME]), o_f)
 
-    fs_diff = compute_filesystem_diff(container, task, [],
-                                      save_initial_filesystem=True)
+    with span('initial_diffs'):
+        fs_diff, stdout_diff = get_initial_diffs(container, task)
     if fs_diff:
         filesystem_status = "FILE_SYSTEM_WRITTEN_TO_DISK"
     else:
@@ -168,15 +183,12 @@ def get_additional_task_info(request, task_session):
 	    status = ''
 
     if task.type == "stdout":
-        stdout_diff = compute_stdout_diff('', task)
-        annotate_stdout_errors(fs_diff, stdout_diff)
         resp = {
             'task_duration': task.duration.seconds,
             'task_solution': task.solution,
             'treatment_order': task_session.study_session.treatment_order,
             'research_tool_url': research_tool_url,
             'filesystem_status': filesystem_status,
-            'filesystem_diff': fs_diff,
             'stdout_diff': stdout_diff,
             'container_port': container_port
         }
@@ -187,9 +199,12 @@ def get_additional_task_info(request, task_session):
             'treatment_order': task_session.study_session.treatment_order,
             'research_tool_url': research_tool_url,
             'filesystem_status': filesystem_status,
-            'filesystem_diff': fs_diff,
             'container_port': container_port
         }
+    with span('diff_patch'):
+        resp.update(update_diff_fields(request, task_session, fs_diff))
+    with span('encode_diff'):
+        encode_diff_fields(request, resp)
 
     return json_response(resp, status=status)
 
@@ -204,62 +219,70 @@ def go_to_next_task(request, study_session):
     session.
 
     """
-    status = ''
-    # close the currently running task session if there is any
-    if study_session.current_task_session_id:
-        task_session = TaskSession.objects.get(
-            session_id=study_session.current_task_session_id)
-        if task_session.status == 'running':
-            # close current_task_session
-            task_session.close(request.GET['reason_for_close'])
-            # update relevant study session attributes
-            if task_session.is_training:
-                study_session.inc_num_training_tasks_completed()
-                if study_session.stage == 'I':
-                    status = 'FIRST_TRAINING_TASK_COMPLETE'
-                elif study_session.stage == 'II':
-                    status = 'SECOND_TRAINING_TASK_COMPLETE'
+    # concurrent requests of the study session (e.g. a double click) must
+    # not close the task session twice or provision two containers
+    with session_lock(study_session.session_id):
+        study_session.refresh_from_db()
+        status = ''
+        # close the currently running task session if there is any
+        if study_session.current_task_session_id:
+            task_session = TaskSession.objects.get(
+                session_id=study_session.current_task_session_id)
+            if task_session.status == 'running':
+                # close current_task_session
+                with span('close_task_session'):
+                    task_session.close(request.GET['reason_for_close'])
+                # update relevant study session attributes
+                if task_session.is_training:
+                    study_session.inc_num_training_tasks_completed()
+                    if study_session.stage == 'I':
+                        status = 'FIRST_TRAINING_TASK_COMPLETE'
+                    elif study_session.stage == 'II':
+                        status = 'SECOND_TRAINING_TASK_COMPLETE'
+                    else:
+                        raise AttributeError('Wrong study session stage: {} '
+                            'while closing training task session'.format(
+                                study_session.stage))
                 else:
-                    raise AttributeError('Wrong study session stage: {} while '
-                        'closing training task session'.format(study_session.stage))
-            else:
-                # update time left in the current half of the study session
-                # needs to be done before
-                print('task_session_time_spent: {}'.format(
-                    task_session.time_spent))
-                study_session.update_half_session_time_left(
-                    task_session.time_spent)
-                study_session.inc_num_tasks_completed()
-
-    # check for study session stage change or completion
-    if study_session.stage == 'III':
-        # study session completed
-        study_session.close('finished')
-        resp = json_response(
-            {
-                "num_passed": TaskSession.objects.filter(
-                    study_session=study_session, status='passed').count(),
-                "num_given_up": TaskSession.objects.filter(
-                    study_session=study_session, status='quit').count(),
-                "num_total": study_session.total_num_tasks
-            },
-            status='STUDY_SESSION_COMPLETE')
-        resp.set_cookie('session_id', '')
-        resp.set_cookie('task_session_id', '')
-    else:
-        # create new task session
-        next_task_session_id = study_session.update_current_task_session_id()
-        try:
-            create_task_session(study_session)
-            resp = json_response({
-                "task_session_id": next_task_session_id,
-                "treatment_order": study_session.treatment_order
-            }, status=status)
-            resp.set_cookie('study_session', study_session.session_id)
-            resp.set_cookie('task_session_id', next_task_session_id)
-        except ObjectDoesNotExist:
-            study_session.close('closed_with_error')
-            resp = json_response(status='TASK_SESSION_CREATION_FAILED')
+                    # update time left in the current half of the study
+                    # session needs to be done before
+                    print('task_session_time_spent: {}'.format(
+                        task_session.time_spent))
+                    study_session.update_half_session_time_left(
+                        task_session.time_spent)
+                    study_session.inc_num_tasks_completed()
+
+        # check for study session stage change or completion
+        if study_session.stage == 'III':
+            # study session completed
+            study_session.close('finished')
+            resp = json_response(
+                {
+                    "num_passed": TaskSession.objects.filter(
+                        study_session=study_session, status='passed').count(),
+                    "num_given_up": TaskSession.objects.filter(
+                        study_session=study_session, status='quit').count(),
+                    "num_total": study_session.total_num_tasks
+                },
+                status='STUDY_SESSION_COMPLETE')
+            resp.set_cookie('session_id', '')
+            resp.set_cookie('task_session_id', '')
+        else:
+            # create new task session
+            next_task_session_id = \
+                study_session.update_current_task_session_id()
+            try:
+                with span('create_task_session'):
+                    create_task_session(study_session)
+                resp = json_response({
+                    "task_session_id": next_task_session_id,
+                    "treatment_order": study_session.treatment_order
+                }, status=status)
+                resp.set_cookie('study_session', study_session.session_id)
+                resp.set_cookie('task_session_id', next_task_session_id)
+            except ObjectDoesNotExist:
+                study_session.close('closed_with_error')
+                resp = json_response(status='TASK_SESSION_CREATION_FAILED')
 
     return resp
 
@@ -272,7 +295,10 @@ def create_task_session(study_session):
     study_session_stage = study_session.stage
     task_session_id = study_session.current_task_session_id
 
-    if not TaskSession.objects.filter(session_id=task_session_id).exists():
+    with session_lock(task_session_id):
+        if TaskSession.objects.filter(session_id=task_session_id).exists():
+            return
+
         # select a task from the task database
         if study_session.stage_change() and study_session.stage in ['I', 'II']:
             study_session.start_half_session_timer()
@@ -322,12 +348,19 @@ def on_command_execution(request, task_session):
     Args:
         task_session:
 
-    Record user's terminal standard output upon command execution. Check for
-    task completion.
+    Record user's terminal standard output upon command execution and queue
+    the check for task completion on the verification pool (see
+    verification.py). Returns the job ID of the check, whose result the
+    browser fetches from get_verification_results. The check is done in the
+    request if settings.VERIFICATION_WORKERS is 0.
     """
     study_session = task_session.study_session
     task = task_session.task
     stdout = request.POST['stdout']
+    # the version of the file system diff the browser holds
+    client_diff_version = request.POST.get('filesystem_diff_version', '')
+    client_diff_version = int(client_diff_version) \
+        if client_diff_version.isdigit() else None
 
     # check if there are file path in the stdout
     stdout_lines = stdout.split('\n')
@@ -348,52 +381,125 @@ def on_command_execution(request, task_session):
             stdout_paths.append(path)
 
     stdout = '\n'.join(stdout_lines[1:-1]) if len(stdout_lines) > 2 else ''
-    ActionHistory.objects.create(
+    action_log.log(
         task_session=task_session,
         action = command,
         stdout = stdout,
         action_time = timezone.now()
     )
 
-    # compute distance between current file system and the goal file system
+    # load the related objects here, the job only works in memory
     container = task_session.container
+    treatment = study_session.treatment
+
+    def verify(chained, batch):
+        if chained:
+            # the browser applies the results in order, so it will hold the
+            # diff of the previous job by then
+            client_version = diff_versions.get(task_session.session_id)[0]
+        else:
+            client_version = client_diff_version
+        try:
+            # the jobs run by the workers are timed on their own
+            with timed('verification_job'):
+                resp, status = verify_command(
+                    request, task_session, task, container, treatment, stdout,
+                    stdout_paths, current_dir, is_ls_command, client_version,
+                    batch)
+        finally:
+            if verification_pool.num_workers:
+                # the worker thread's own database connection
+                close_old_connections()
+        resp['status'] = status
+        return resp
+
+    if not verification_pool.num_workers:
+        # the requests of a task session may reach several server processes,
+        # whose pools only run the jobs of their own process one at a time
+        with session_lock('verify:' + task_session.session_id):
+            resp = verification_pool.run(task_session.session_id, verify)
+        return json_response(resp, status=resp['status'])
+    job_id = verification_pool.submit(task_session.session_id, verify)
+    return json_response({'job_id': job_id}, status='VERIFICATION_QUEUED')
 
-    fs_diff = compute_filesystem_diff(container, task, stdout_paths)
+@task_session_id_required
+def get_verification_results(request, task_session):
+    """
+    Args:
+        task_session:
+
+    Returns the results of the command verifications of the task session
+    which ran after the job given by "after", waiting for one if the task
+    session has verifications queued, and whether verifications are still
+    queued. Every result has the fields of the synchronous response of
+    on_command_execution, with its job_id.
+    """
+    after = request.GET.get('after', '')
+    after = int(after) if after.isdigit() else 0
+    results = verification_pool.wait_results(
+        task_session.session_id, after,
+        timeout=getattr(settings, 'VERIFICATION_POLL_TIMEOUT', 20.0))
+    return json_response({
+        'results': results,
+        'pending': verification_pool.is_pending(task_session.session_id)
+    })
+
+def verify_command(request, task_session, task, container, treatment, stdout,
+                   stdout_paths, current_dir, is_ls_command,
+                   client_diff_version, batch=None):
+    """
+    Compare the file system and the standard output of the task session
+    after a command with the goal. Returns the response fields and status.
+    The verifications of a coalesced batch of commands share the scan of the
+    file system through the batch dictionary (see verification.py).
+    """
+    # compute distance between current file system and the goal file system
+    fs_diff = compute_filesystem_diff(container.website_path, task,
+                                      stdout_paths,
+                                      trace_id=task_session.session_id,
+                                      owners=get_container_owners(
+                                          container.container_id),
+                                      batch=batch)
     if fs_diff is None:
-        return json_response(status='FILE_SYSTEM_ERROR')
+        return {}, 'FILE_SYSTEM_ERROR'
 
     task_completed = False
     if task.type == 'stdout':
-        stdout_diff = compute_stdout_diff(
-            '\n'.join(stdout_lines[1:-1]), task, current_dir, is_ls_command)
+        with span('compute_stdout_diff'):
+            stdout_diff = compute_stdout_diff(
+                stdout, task, current_dir, is_ls_command)
         # check if stdout signals task completion
         # the files/directories being checked must be presented in full paths
         # the file/directory names cannot contain spaces
         if stdout_diff['tag'] == 'correct':
             task_completed = True
         else:
-            annotate_stdout_errors(fs_diff, stdout_diff)
+            with span('annotate_stdout_errors'):
+                annotate_stdout_errors(fs_diff, stdout_diff)
         resp = {
-            'filesystem_diff': fs_diff,
             'stdout_diff': stdout_diff,
-            'treatment': study_session.treatment
+            'treatment': treatment
         }
     elif task.type == 'file_search' or task.type == 'filesystem_change':
         # check if the current file system is the same as the goal file system
         if not fs_diff['tag']:
             task_completed = True
         resp = {
-            'filesystem_diff': fs_diff,
-            'treatment': study_session.treatment
+            'treatment': treatment
         }
     else:
         raise AttributeError('Unrecognized task type "{}": must be "stdout",'
             '"file_search" or "filesystem_change"'.format(task.type))
-
+    # send only the changes to the diff the browser already has
+    with span('diff_patch'):
+        resp.update(update_diff_fields(request, task_session, fs_diff,
+                                       client_diff_version))
+    with span('encode_diff'):
+        encode_diff_fields(request, resp)
     if task_completed:
-        return json_response(resp, status= 'TASK_COMPLETED')
+        return resp, 'TASK_COMPLETED'
     else:
-        return json_response(resp)
+        return resp, 'SUCCESS'
 
 # --- File System Management --- #
 
@@ -408,29 +514,28 @@ def reset_file_system(request, task_session):
     task = task_session.task
 
     # destroy the current container and create a new one
-    task_session.create_new_container()
+    with span('create_container'):
+        task_session.create_new_container()
     container = task_session.container
     container_id = container.container_id
 
-    ActionHistory.objects.create(
+    action_log.log(
         task_session=task_session,
         action = '__reset__',
         action_time = timezone.now()
     )
 
-    fs_diff = compute_filesystem_diff(container, task, [])
+    with span('initial_diffs'):
+        fs_diff, stdout_diff = get_initial_diffs(container, task)
     if fs_diff is None:
         filesystem_status = 'FILE_SYSTEM_ERROR'
     else:
         filesystem_status = 'FILE_SYSTEM_WRITTEN_TO_DISK'
 
     if task.type == 'stdout':
-        stdout_diff = compute_stdout_diff('', task)
-        annotate_stdout_errors(fs_diff, stdout_diff)
         resp = {
             'container_id': container_id,
             'container_port': container.port,
-            'filesystem_diff': fs_diff,
             'filesystem_status': filesystem_status,
             'stdout_diff': stdout_diff
         }
@@ -438,44 +543,213 @@ def reset_file_system(request, task_session):
         resp = {
             'container_id': container_id,
             'container_port': container.port,
-            'filesystem_diff': fs_diff,
             'filesystem_status': filesystem_status
         }
-    
+    with span('diff_patch'):
+        resp.update(update_diff_fields(request, task_session, fs_diff))
+    with span('encode_diff'):
+        encode_diff_fields(request, resp)
+
     return json_response(resp)
 
+@task_session_id_required
+def get_filesystem_diff(request, task_session):
+    """
+    Args:
+        task_session:
+
+    Returns the complete file system diff last sent to the task session, which
+    the browser requests when it cannot apply a patch. Answers "304 Not
+    Modified" if the browser already holds that version.
+    """
+    version, fs_diff = diff_versions.get(task_session.session_id)
+    if fs_diff is None:
+        return json_response(status='FILE_SYSTEM_DIFF_DOES_NOT_EXIST')
+    etag = '"{}-{}"'.format(task_session.session_id, version)
+    # GZipMiddleware turns the ETag of the compressed responses into a weak
+    # one, which the browser sends back, so the ETags are compared weakly
+    if etag in (client_etag[2:] if client_etag.startswith('W/')
+                else client_etag for client_etag in
+                parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))):
+        return HttpResponseNotModified()
+    resp = json_response(encode_diff_fields(request, {
+        'filesystem_diff_version': version,
+        'filesystem_diff': fs_diff
+    }))
+    resp['ETag'] = etag
+    return resp
+
+@task_session_id_required
+def get_filesystem_subtree(request, task_session):
+    """
+    Args:
+        task_session:
+
+    Returns a directory of the file system diff with all of its children,
+    which the browser requests when the participant expands a directory left
+    out of a summarized diff.
+    """
+    key = request.GET.get('key', '')
+    client_diff_version = request.GET.get('filesystem_diff_version', '')
+    version, fs_diff = diff_versions.get_full(task_session.session_id)
+    if fs_diff is None:
+        return json_response(status='FILE_SYSTEM_DIFF_DOES_NOT_EXIST')
+    if client_diff_version != str(version):
+        return json_response({'filesystem_diff_version': version},
+                             status='FILE_SYSTEM_DIFF_VERSION_MISMATCH')
+    node = find_node(fs_diff, key)
+    if node is None or node['type'] != 'directory':
+        return json_response(status='FILE_SYSTEM_NODE_DOES_NOT_EXIST')
+    return json_response(encode_diff_fields(request, {
+        'filesystem_diff_version': version,
+        'filesystem_subtree': summarize_diff(node, expanded=True)
+    }))
+
+@task_session_id_required
+def get_file_content(request, task_session):
+    """
+    Args:
+        task_session:
+
+    Returns a byte range of a file in the task session's home directory and
+    the same range of the file's goal content, which the tree view fetches
+    when the participant opens a file. The file is given by its path relative
+    to the home directory, without symbolic links; at most
+    settings.FILE_CONTENT_MAX_RANGE bytes are returned.
+    """
+    relative_path = request.GET.get('path', '')
+    offset = request.GET.get('offset', '0')
+    length = request.GET.get('length', '')
+    max_length = getattr(settings, 'FILE_CONTENT_MAX_RANGE', 64 * 1024)
+    offset = int(offset) if offset.isdigit() else 0
+    length = min(int(length), max_length) if length.isdigit() else max_length
+
+    f = open_home_file(task_session.container.website_path, relative_path)
+    if f is None:
+        return json_response(status='FILE_DOES_NOT_EXIST')
+    with f:
+        content, size = read_file_range(f, offset, length)
+
+    goal_content = get_task_definition(task_session.task).goal_contents \
+        .get(relative_path)
+    if goal_content is not None:
+        goal_content = goal_content.encode('utf-8')
+        goal_size = len(goal_content)
+        goal_content = goal_content[offset:offset + length] \
+            .decode('utf-8', errors='replace')
+    else:
+        goal_size = None
+
+    return json_response({
+        'path': relative_path,
+        'offset': offset,
+        'size': size,
+        'content': content.decode('utf-8', errors='replace'),
+        'goal_size': goal_size,
+        'goal_content': goal_content
+    })
+
+def update_diff_fields(request, task_session, fs_diff, client_version=None):
+    """
+    Returns the fields of a response which bring the browser's copy of the
+    file system diff up to date, summarizing large diffs if the browser asked
+    for it.
+    """
+    if wants_summarized_diff(request, fs_diff):
+        return diff_versions.update(task_session.session_id,
+                                    summarize_diff(fs_diff), client_version,
+                                    full_diff=fs_diff)
+    return diff_versions.update(task_session.session_id, fs_diff,
+                                client_version)
+
 # --- Task Result Verification --- #
 
-def compute_filesystem_diff(container, task, stdout_paths,
-                            save_initial_filesystem=False):
+def get_initial_diffs(container, task):
+    """
+    Returns the annotated file system diff and the standard output diff (None
+    if the task is not a 'stdout' task) the user sees when a task session
+    starts or its file system is reset. The file system diff is None if the
+    container's file system does not exist.
+
+    The diffs are precomputed by load_config since every freshly provisioned
+    file system of a task is the same, so the disk is not scanned here.
+    """
+    if not container.website_path.is_dir():
+        return None, None
+
+    task_definition = get_task_definition(task)
+    fs_diff = task_definition.get_initial_filesystem_diff()
+    stdout_diff = task_definition.get_initial_stdout_diff()
+    if fs_diff is None:
+        # the task was registered before the initial diffs were precomputed
+        fs_diff = compute_filesystem_diff(
+            container.website_path, task, [],
+            owners=get_container_owners(container.container_id))
+        if task.type == 'stdout':
+            stdout_diff = compute_stdout_diff('', task)
+            annotate_stdout_errors(fs_diff, stdout_diff)
+    return fs_diff, stdout_diff
+
+def compute_filesystem_diff(filesystem_vfs_path, task, stdout_paths,
+                            trace_id='', owners=None, batch=None):
     """
     Compute the difference between the current file system on disk and the goal
     file system. Return None if the current file system does not exist.
 
     Args:
-        container: the container object on which the file system is mounted
+        filesystem_vfs_path: the location of the user's copy of the example
+            website on the host
         task: the task object which contains the definition of the file system
         stdout_paths: the paths detected from the user's terminal standard
             output which shall be annotated on the diff object
-        save_initial_filesystem: set to True if the current file system on disk
-            should be saved to the Task object
+        trace_id: identifies the caller in the diff cache trace
+        owners: the resolver of the file owners' names (see owners.py)
+        batch: a dictionary in which the snapshot of the file system is kept
+            for the next calls, which do not scan the file system again
 
+    Participants often reach the same file system states, so the annotated
+    diffs are shared across task sessions through the diff cache.
     """
-    filesystem_vfs_path = '/{}/home/website'.format(container.filesystem_name)
-    current_filesystem = disk_2_dict(pathlib.Path(filesystem_vfs_path),
-        json.loads(task.file_attributes))
-    if save_initial_filesystem:
-        task.initial_filesystem = json.dumps(current_filesystem)
-        task.save()
+    task_definition = get_task_definition(task)
+    if batch is not None and 'snapshot' in batch:
+        current_filesystem, filesystem_hash = batch['snapshot']
+    else:
+        with span('disk_2_dict'):
+            current_filesystem = disk_2_dict(pathlib.Path(filesystem_vfs_path),
+                task_definition.attribute_extractor,
+                max_entries=getattr(settings, 'SCAN_MAX_ENTRIES',
+                                    SCAN_MAX_ENTRIES),
+                max_depth=getattr(settings, 'SCAN_MAX_DEPTH', SCAN_MAX_DEPTH),
+                time_budget=getattr(settings, 'SCAN_TIME_BUDGET',
+                                    SCAN_TIME_BUDGET),
+                owners=owners, as_dict=False,
+                workers=getattr(settings, 'SCAN_WORKERS', 1))
+        with span('snapshot_hash'):
+            filesystem_hash = snapshot_hash(current_filesystem) \
+                if current_filesystem is not None else None
+        if batch is not None:
+            batch['snapshot'] = (current_filesystem, filesystem_hash)
 
     if current_filesystem is None:
         return None
 
-    goal_filesystem = task.initial_filesystem if task.type == 'stdout' \
-        else task.goal_filesystem
-    fs_diff = filesystem_diff(current_filesystem, json.loads(goal_filesystem))
-    # annotate the fs_diff with the stdout_paths
-    annotate_path_selection(fs_diff, task.type, stdout_paths)
+    cache_key = diff_cache.make_key(task.task_id, current_filesystem,
+                                    stdout_paths,
+                                    filesystem_hash=filesystem_hash)
+    with span('diff_cache'):
+        fs_diff = diff_cache.get(cache_key, trace_id=trace_id)
+    if fs_diff is None:
+        with span('filesystem_diff'):
+            fs_diff = filesystem_diff(current_filesystem,
+                                      task_definition.goal_filesystem)
+        # annotate the fs_diff with the stdout_paths
+        with span('annotate_path_selection'):
+            annotate_path_selection(fs_diff, task.type, stdout_paths)
+        with span('diff_cache'):
+            diff_cache.put(cache_key, fs_diff, trace_id=trace_id)
+
+    # the content of html.tar is not part of the snapshot, so it is checked
+    # after the cache lookup
 
     if not contains_error_in_child(fs_diff) and task.task_id == 2:
         files_in_tar = set()
@@ -651,11 +925,13 @@ def register_user(request):
     first_name = request.GET['first_name']
     last_name = request.GET['last_name']
 
-    if User.objects.filter(first_name=first_name, last_name=last_name).exists():
-        return json_response({
-            'access_code': 'USER_EXISTS'
-        })
-    else:
+    # the group assignment counts the users, so registrations are serialized
+    with session_lock('register_user'):
+        if User.objects.filter(first_name=first_name,
+                               last_name=last_name).exists():
+            return json_response({
+                'access_code': 'USER_EXISTS'
+            })
         # assign the new user to a group
         num_registered_users = User.objects.all().count()
         groups = ['group4', 'group1', 'group2', 'group3']
@@ -668,10 +944,10 @@ def register_user(request):
             access_code = access_code,
             group = group
         )
-        return json_response({
-            'access_code': access_code,
-            'group': group
-        })
+    return json_response({
+        'access_code': access_code,
+        'group': group
+    })
 
 def user_login(request):
     """
@@ -725,14 +1001,16 @@ def user_login(request):
                 })
 
         if check_existing_session == "false" or not healthy_sessions:
-            # register a new study session for the user
-            session_id = '-'.join([access_code, "study_session",
-                str(StudySession.objects.filter(user=user).count() + 1)])
-            StudySession.objects.create(
-                user = user,
-                session_id = session_id,
-                creation_time = timezone.now(),
-            )
+            # register a new study session for the user, the session IDs
+            # count the sessions of the user
+            with session_lock(access_code):
+                session_id = '-'.join([access_code, "study_session",
+                    str(StudySession.objects.filter(user=user).count() + 1)])
+                StudySession.objects.create(
+                    user = user,
+                    session_id = session_id,
+                    creation_time = timezone.now(),
+                )
             # remember the study session id with cookies
             resp = json_response(status="SESSION_CREATED")
             resp.set_cookie('session_id', session_id)
@@ -779,7 +1057,7 @@ def instruction(request, study_session):
 @session_id_required
 def instruction_read(request, study_session):
     study_session.status = 'running'
-    study_session.save()
+    study_session.save(update_fields=['status'])
     return json_response({
         'task_session_id': study_session.current_task_session_id
     })
@@ -801,7 +1079,7 @@ def consent_signed(request, study_session):
         ip_address = ''
     study_session.set_ip_address(ip_address)
     study_session.status = 'reading_instructions'
-    study_session.save()
+    study_session.save(update_fields=['status'])
     return json_response()
 
 
@@ -890,6 +1168,57 @@ def overview(request):
     context = { 'user_groups': user_groups }
     return HttpResponse(template.render(context, request))
 
+def diff_cache_stats(request):
+    return JsonResponse(diff_cache.stats())
+
+def verification_stats(request):
+    return JsonResponse(verification_pool.stats())
+
+def metrics(request):
+    """
+    Returns the quantiles of the durations of the requests and of their
+    stages by endpoint (see timing.py), in the Prometheus text format.
+    """
+    return HttpResponse(histograms.render(),
+                        content_type='text/plain; version=0.0.4')
+
+def container_report(request):
+    """
+    Shows the provisioning latency of the containers over time (see
+    provisioning.py) and the histograms of the phases of the containers
+    provisioned and destroyed by this server process.
+    """
+    template = loader.get_template('container_report.html')
+    period = request.GET.get('period', '60')
+    period = timezone.timedelta(minutes=int(period) if period.isdigit()
+                                and int(period) > 0 else 60)
+    rows = provisioning_report(
+        Container.objects.filter(created_at__isnull=False),
+        period=period,
+        regression_factor=getattr(settings, 'CONTAINER_REGRESSION_FACTOR',
+                                  1.5))
+    context = {
+        'period_minutes': int(period.total_seconds() // 60),
+        'create_phases': CREATE_PHASES,
+        'destroy_phases': DESTROY_PHASES,
+        'rows': reversed(rows),
+        'phase_histograms': histograms.summary('container_phase_seconds')
+    }
+    return HttpResponse(template.render(context, request))
+
+@staff_member_required
+def request_profile(request):
+    """
+    Returns a profile taken by ProfilingMiddleware (see profiling.py) as a
+    file in the pstats format.
+    """
+    request_profile = RequestProfile.objects.get(pk=int(request.GET['id']))
+    resp = HttpResponse(bytes(request_profile.profile),
+                        content_type='application/octet-stream')
+    resp['Content-Disposition'] = 'attachment; filename="{}-{}.prof"'.format(
+        request_profile.endpoint or 'request', request_profile.pk)
+    return resp
+
 def action_history(request):
     template = loader.get_template('action_history.html')
     session_id = request.GET['study_session_id']
@@ -907,9 +1236,9 @@ def action_history(request):
             break
 
     action_history = []
-    for action in ActionHistory.objects.filter(task_session=task_session)\
-        .order_by('action_time'):
-        action_history.append(action)
+    if task_session is not None:
+        for action in task_session.get_action_history():
+            action_history.append(action)
 
     context = {
         'task_order_number': task_order_number,